@@ -0,0 +1,362 @@
+import timeit
+import tracemalloc
+import random
+import os
+import sys
+import asyncio
+import time
+import json
+import platform
+import subprocess
+import argparse
+
+from graph import Graph
+from gremlinparser import GremlinParser, GremlinTokenizeParser
+import sample_graph
+from gremlin import GremlinGraph, GremlinExecutionEngine
+from graphanalytics import GraphAnalytics
+from graphgenerator import GraphGenerator
+from gremlinserver import GremlinServer, GremlinLoadGenerator
+
+class ParserBenchmark:
+	QUERIES = [
+	'g.V()',
+	"g.V().has( 'code', 'AUS' ).out( 'route' ).values( 'city' )",
+	"g.V().hasLabel( 'airport' ).has( 'country', 'US' ).out( 'route' ).out( 'route' ).count()",
+	"i = g.V( 3 ).as( 'a' ).out( 'route' ).as( 'b' ).repeat( out( 'route' ) ).times( 2 ).select( 'a', 'b' )",
+	'g.V()' + '.out()' * 200,
+	]
+
+	@staticmethod
+	def run( iterations=1000 ):
+		results = dict()
+		for parserName, parse in (('tokenize', GremlinTokenizeParser.parse), ('lexer', GremlinParser.parse)):
+			elapsed = timeit.timeit( lambda : [ parse( gremlinQuery ) for gremlinQuery in ParserBenchmark.QUERIES ], number=iterations )
+			results[ parserName ] = elapsed / ( iterations * len( ParserBenchmark.QUERIES ) )
+		return results
+
+class MemoryBenchmark:
+	# Builds an air-routes shaped graph through the bulk-load API and reports the bytes allocated per vertex and per
+	# edge, property values included.
+	VERTEX_COUNT, EDGE_COUNT = 20000, 100000
+
+	@staticmethod
+	def run( vertexCount=VERTEX_COUNT, edgeCount=EDGE_COUNT, seed=0 ):
+		# The batches are generated while tracing, so that only what the graph retains is counted.
+		randomGenerator = random.Random( seed )
+		vertexBatch = ( (id_, [ 'airport' ], { 'code' : 'A{}'.format( id_ ), 'runways' : randomGenerator.randint( 1, 8 ), 'city' : 'City{}'.format( id_ % 1000 ) })
+		                for id_ in range( vertexCount ) )
+		edgeBatch = ( (vertexCount + id_, randomGenerator.randrange( vertexCount ), randomGenerator.randrange( vertexCount ), 'route', { 'dist' : randomGenerator.randint( 50, 9000 ) })
+		              for id_ in range( edgeCount ) )
+
+		tracemalloc.start()
+		graph = Graph()
+		graph.bulkAddVertices( vertexBatch )
+		vertexBytes, _ = tracemalloc.get_traced_memory()
+		graph.bulkAddEdges( edgeBatch )
+		totalBytes, _ = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		return { 'bytesPerVertex' : vertexBytes / vertexCount, 'bytesPerEdge' : ( totalBytes - vertexBytes ) / edgeCount }
+
+class ParallelBenchmark:
+	# Times whole-graph queries against the number of parallel workers, on air-routes when its GraphML file is present
+	# and otherwise on a random graph of similar shape.
+	QUERIES = [
+	'g.V().out().out().count()',
+	"g.V().out().out().simplePath().count()",
+	]
+	WORKER_COUNTS = (1, 2, 4)
+	VERTEX_COUNT, EDGE_COUNT = 3500, 50000
+
+	@staticmethod
+	def graph( seed=0 ):
+		if os.path.exists( sample_graph.AirRoutesGraph.PATH ):
+			g, _ = sample_graph.AirRoutesGraph.loadSnapshot()
+			return g
+		randomGenerator = random.Random( seed )
+		g = GremlinGraph()
+		g.graph.bulkAddVertices( (id_, [ 'airport' ], { 'code' : 'A{}'.format( id_ ) }) for id_ in range( ParallelBenchmark.VERTEX_COUNT ) )
+		g.graph.bulkAddEdges( (ParallelBenchmark.VERTEX_COUNT + id_, randomGenerator.randrange( ParallelBenchmark.VERTEX_COUNT ),
+			                   randomGenerator.randrange( ParallelBenchmark.VERTEX_COUNT ), 'route', {}) for id_ in range( ParallelBenchmark.EDGE_COUNT ) )
+		return g
+
+	@staticmethod
+	def run( graph, workerCounts=WORKER_COUNTS, repeats=3 ):
+		# Returns { query : { workers : seconds } }, taking the best of repeats runs. Starting the pool and writing the
+		# snapshot are not timed.
+		results = { gremlinQuery : dict() for gremlinQuery in ParallelBenchmark.QUERIES }
+		for workers in workerCounts:
+			engine = GremlinExecutionEngine( workers=workers )
+			engine.setGraph( graph )
+			try:
+				engine.run( ParallelBenchmark.QUERIES[ 0 ] )
+				for gremlinQuery in ParallelBenchmark.QUERIES:
+					results[ gremlinQuery ][ workers ] = min( timeit.repeat( lambda : engine.run( gremlinQuery )._toString(), number=1, repeat=repeats ) )
+			finally:
+				engine.close()
+		return results
+
+class ServerBenchmark:
+	# Runs a GremlinServer in process and measures it with the load generator, over the same graph as ParallelBenchmark.
+	QUERIES = [
+	"g.V().has('code','A1').out().values('code')",
+	'g.V(3).out().out().count()',
+	"g.V().hasLabel('airport').count()",
+	]
+
+	@staticmethod
+	def run( graph, connections=8, requests=2000, workers=GremlinServer.WORKERS ):
+		async def measure():
+			engine = GremlinExecutionEngine()
+			engine.setGraph( graph )
+			server = GremlinServer( engine, workers=workers )
+			port = await server.start( port=0 )
+			try:
+				return await GremlinLoadGenerator.run( '127.0.0.1', port, ServerBenchmark.QUERIES, connections=connections, requests=requests )
+			finally:
+				await server.stop()
+		return asyncio.run( measure() )
+
+class AnalyticsBenchmark:
+	# Times the analytics steps against computing the same values the way it is done without them: one traversal per
+	# vertex to read its neighbours, and the algorithm's iterations in Python over what those traversals returned.
+	QUERIES = {
+	'pageRank' : "g.V().pageRank().values('pageRank')",
+	'connectedComponent' : "g.V().connectedComponent().values('component')",
+	'degreeCentrality' : "g.V().degreeCentrality().values('degree')",
+	}
+
+	@staticmethod
+	def run( graph, repeats=3 ):
+		# Returns { step : { 'step' : seconds, 'traversals' : seconds } }, taking the best of repeats runs of each.
+		engine = GremlinExecutionEngine()
+		engine.setGraph( graph )
+		naiveFunctions = { 'pageRank' : AnalyticsBenchmark.naivePageRank, 'connectedComponent' : AnalyticsBenchmark.naiveConnectedComponent,
+		                   'degreeCentrality' : AnalyticsBenchmark.naiveDegreeCentrality }
+		results = dict()
+		for stepName, gremlinQuery in AnalyticsBenchmark.QUERIES.items():
+			# run() rather than exec(), so that results are not served from the result cache.
+			stepSeconds = min( timeit.repeat( lambda : list( engine.run( gremlinQuery ).results() ), number=1, repeat=repeats ) )
+			naiveSeconds = min( timeit.repeat( lambda : naiveFunctions[ stepName ]( engine ), number=1, repeat=repeats ) )
+			results[ stepName ] = { 'step' : stepSeconds, 'traversals' : naiveSeconds }
+		return results
+
+	@staticmethod
+	def neighbours( engine, vertexId, step ):
+		return [ vertex.id for vertex in engine.run( 'g.V({}).{}()'.format( vertexId, step ) ).results() ]
+
+	@staticmethod
+	def naivePageRank( engine, tolerance=GraphAnalytics.TOLERANCE, maxIterations=GraphAnalytics.MAX_ITERATIONS, dampingFactor=GraphAnalytics.DAMPING_FACTOR ):
+		vertexIds = list( engine.run( 'g.V()' ).results() )
+		outNeighbours = { vertex.id : AnalyticsBenchmark.neighbours( engine, vertex.id, 'out' ) for vertex in vertexIds }
+		ranks = { vertexId : 1.0 / len( outNeighbours ) for vertexId in outNeighbours }
+		for _ in range( maxIterations ):
+			danglingRank = sum( ranks[ vertexId ] for vertexId, neighbourIds in outNeighbours.items() if len( neighbourIds ) == 0 )
+			newRanks = dict.fromkeys( ranks, ( 1.0 - dampingFactor + dampingFactor * danglingRank ) / len( ranks ) )
+			for vertexId, neighbourIds in outNeighbours.items():
+				for neighbourId in neighbourIds:
+					newRanks[ neighbourId ] += dampingFactor * ranks[ vertexId ] / len( neighbourIds )
+			change = sum( abs( newRanks[ vertexId ] - ranks[ vertexId ] ) for vertexId in ranks )
+			ranks = newRanks
+			if change < tolerance:
+				break
+		return ranks
+
+	@staticmethod
+	def naiveConnectedComponent( engine ):
+		components = dict()
+		for vertex in engine.run( 'g.V()' ).results():
+			if vertex.id in components:
+				continue
+			component, frontier = [ vertex.id ], [ vertex.id ]
+			components[ vertex.id ] = None
+			while len( frontier ) > 0:
+				vertexId = frontier.pop()
+				for neighbourId in AnalyticsBenchmark.neighbours( engine, vertexId, 'both' ):
+					if neighbourId not in components:
+						components[ neighbourId ] = None
+						component.append( neighbourId )
+						frontier.append( neighbourId )
+			componentId = min( component )
+			components.update( dict.fromkeys( component, componentId ) )
+		return components
+
+	@staticmethod
+	def naiveDegreeCentrality( engine ):
+		return { vertex.id : next( engine.run( 'g.V({}).both().count()'.format( vertex.id ) ).results() ) for vertex in engine.run( 'g.V()' ).results() }
+
+class BenchmarkSuite:
+	# A fixed set of queries run through GremlinExecutionEngine over TinkerPop-modern, air-routes when its GraphML file
+	# is present, and graphs of the given sizes from GraphGenerator, with the loads and the parsing of the queries. The
+	# results are plain values, written as JSON so that runs on different commits can be compared.
+	# Queries are templates completed by each graph's GRAPH_PARAMETERS.
+	QUERIES = {
+	'filters' : [
+		"g.V().hasLabel('{label}').count()",
+		"g.V().has('{key}','{value}').values('{key}')",
+		"g.V().hasLabel('{label}').has('{numericKey}',{number}).count()",
+		],
+	'hops' : [
+		"g.V({vertexId}).out('{edgeLabel}').values('{key}')",
+		'g.V({vertexId}).out().out().dedup().count()',
+		'g.V({vertexId}).out().out().out().dedup().count()',
+		],
+	'aggregations' : [
+		"g.V().out('{edgeLabel}').count()",
+		"g.V().values('{numericKey}').mean()",
+		'g.V().both().dedup().count()',
+		"g.V().hasLabel('{label}').values('{numericKey}').max()",
+		],
+	'paths' : [
+		'g.V({vertexId}).out().out().simplePath().path().limit(100)',
+		'g.V({vertexId}).repeat(out()).times(2).path().count()',
+		],
+	}
+	GRAPH_PARAMETERS = {
+	'modern' : { 'label' : 'person', 'key' : 'name', 'value' : 'marko', 'numericKey' : 'age', 'number' : 29, 'vertexId' : 1, 'edgeLabel' : 'created' },
+	'air-routes' : { 'label' : 'airport', 'key' : 'code', 'value' : 'AUS', 'numericKey' : 'runways', 'number' : 3, 'vertexId' : 1, 'edgeLabel' : 'route' },
+	'generated' : { 'label' : 'person', 'key' : 'name', 'value' : 'v1', 'numericKey' : 'age', 'number' : 30, 'vertexId' : 0, 'edgeLabel' : 'knows' },
+	}
+	# The generated graphs have GENERATED_SIZES vertices, and EDGES_PER_VERTEX times as many edges.
+	GENERATED_MODEL, GENERATED_SIZES = 'barabasiAlbert', (10000,)
+	EDGES_PER_VERTEX = 4
+	# Each query runs at least MIN_RUNS times and until MIN_SECONDS have passed, up to MAX_RUNS times.
+	MIN_RUNS, MAX_RUNS, MIN_SECONDS = 5, 1000, 0.2
+
+	@staticmethod
+	def run( generatedSizes=GENERATED_SIZES, edgesPerVertex=EDGES_PER_VERTEX, model=GENERATED_MODEL, seed=0, minSeconds=MIN_SECONDS ):
+		results = { 'environment' : BenchmarkSuite.environment(), 'parameters' : { 'model' : model, 'generatedSizes' : list( generatedSizes ),
+		                                                                           'edgesPerVertex' : edgesPerVertex, 'seed' : seed, 'minSeconds' : minSeconds },
+		            'parsing' : BenchmarkSuite.measureParsing( minSeconds ), 'graphs' : dict() }
+		graphs = [ ('modern', 'modern', sample_graph.TinkerPopModernGraph.get) ]
+		if os.path.exists( sample_graph.AirRoutesGraph.PATH ):
+			graphs.append( ('air-routes', 'air-routes', sample_graph.AirRoutesGraph.get) )
+		else:
+			results[ 'graphs' ][ 'air-routes' ] = { 'skipped' : '{} not found'.format( sample_graph.AirRoutesGraph.PATH ) }
+		for vertexCount in generatedSizes:
+			graphs.append( ('{}-{}'.format( model, vertexCount ), 'generated',
+			                lambda vertexCount=vertexCount : BenchmarkSuite.generatedGraph( model, vertexCount, edgesPerVertex, seed )) )
+
+		for graphName, parametersName, load in graphs:
+			graph, loadResults = BenchmarkSuite.measureLoad( load )
+			engine = GremlinExecutionEngine()
+			engine.setGraph( graph )
+			queryResults = dict()
+			for category, templates in BenchmarkSuite.QUERIES.items():
+				queries = [ template.format( ** BenchmarkSuite.GRAPH_PARAMETERS[ parametersName ] ) for template in templates ]
+				queryResults[ category ] = { gremlinQuery : BenchmarkSuite.measureQuery( engine, gremlinQuery, minSeconds ) for gremlinQuery in queries }
+			results[ 'graphs' ][ graphName ] = { 'load' : loadResults, 'queries' : queryResults }
+		return results
+
+	@staticmethod
+	def generatedGraph( model, vertexCount, edgesPerVertex=EDGES_PER_VERTEX, seed=0 ):
+		g = GremlinGraph()
+		g.createLabelIndex()
+		g.createPropertyIndex( 'name' )
+		GraphGenerator( model, vertexCount, vertexCount * edgesPerVertex, seed ).load( g.graph )
+		return g
+
+	@staticmethod
+	def measureLoad( load ):
+		# Loads the graph twice: once timed, and once traced for its peak memory, which tracing would slow down.
+		startTime = time.perf_counter()
+		graph = load()
+		seconds = time.perf_counter() - startTime
+		del graph
+		tracemalloc.start()
+		graph = load()
+		_, peakBytes = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		vertexCount, edgeCount = len( graph.V() ), len( graph.E() )
+		return graph, { 'vertices' : vertexCount, 'edges' : edgeCount, 'seconds' : seconds,
+		                'objectsPerSecond' : ( vertexCount + edgeCount ) / seconds if seconds > 0 else 0.0, 'peakBytes' : peakBytes }
+
+	@staticmethod
+	def measureQuery( engine, gremlinQuery, minSeconds=MIN_SECONDS ):
+		# run() rather than exec(), so that results are not served from the result cache. The first run compiles the
+		# plan and is not timed; a last one is traced for its peak memory.
+		resultCount = len( list( engine.run( gremlinQuery ).results() ) )
+		latencies, startTime = list(), time.perf_counter()
+		while len( latencies ) < BenchmarkSuite.MAX_RUNS and ( len( latencies ) < BenchmarkSuite.MIN_RUNS or time.perf_counter() - startTime < minSeconds ):
+			runStartTime = time.perf_counter()
+			list( engine.run( gremlinQuery ).results() )
+			latencies.append( time.perf_counter() - runStartTime )
+		tracemalloc.start()
+		list( engine.run( gremlinQuery ).results() )
+		_, peakBytes = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		return dict( BenchmarkSuite.latencyStats( latencies ), results=resultCount, peakBytes=peakBytes )
+
+	@staticmethod
+	def measureParsing( minSeconds=MIN_SECONDS ):
+		queries = [ template.format( ** parameters ) for templates in BenchmarkSuite.QUERIES.values() for template in templates
+		            for parameters in BenchmarkSuite.GRAPH_PARAMETERS.values() ]
+		latencies, startTime = list(), time.perf_counter()
+		while len( latencies ) < BenchmarkSuite.MIN_RUNS * len( queries ) or time.perf_counter() - startTime < minSeconds:
+			for gremlinQuery in queries:
+				parseStartTime = time.perf_counter()
+				GremlinParser.parse( gremlinQuery )
+				latencies.append( time.perf_counter() - parseStartTime )
+		return BenchmarkSuite.latencyStats( latencies )
+
+	@staticmethod
+	def latencyStats( latencies ):
+		# Throughput is in runs per second of running time, latencies are in milliseconds.
+		latencies = sorted( latencies )
+		percentile = lambda fraction : latencies[ min( len( latencies ) - 1, int( fraction * len( latencies ) ) ) ] * 1e3
+		return { 'runs' : len( latencies ), 'throughput' : len( latencies ) / sum( latencies ), 'meanMs' : sum( latencies ) / len( latencies ) * 1e3,
+		         'p50Ms' : percentile( 0.5 ), 'p90Ms' : percentile( 0.9 ), 'p99Ms' : percentile( 0.99 ), 'maxMs' : latencies[ -1 ] * 1e3 }
+
+	@staticmethod
+	def environment():
+		try:
+			commit = subprocess.run( [ 'git', 'rev-parse', 'HEAD' ], capture_output=True, text=True, check=True,
+			                         cwd=os.path.dirname( os.path.abspath( __file__ ) ) ).stdout.strip()
+		except (OSError, subprocess.CalledProcessError):
+			commit = None
+		return { 'commit' : commit, 'python' : platform.python_version(), 'implementation' : platform.python_implementation(),
+		         'platform' : platform.platform(), 'cpus' : os.cpu_count(), 'time' : time.strftime( '%Y-%m-%dT%H:%M:%S' ) }
+
+if __name__ == '__main__':
+	argumentParser = argparse.ArgumentParser( description='Graph and Gremlin benchmarks.' )
+	argumentParser.add_argument( '--suite', action='store_true', help='run the query benchmark suite and write its results as JSON' )
+	argumentParser.add_argument( '--sizes', type=int, nargs='+', default=list( BenchmarkSuite.GENERATED_SIZES ), help='generated graph vertex counts' )
+	argumentParser.add_argument( '--model', choices=GraphGenerator.MODELS, default=BenchmarkSuite.GENERATED_MODEL, help='generated graph model' )
+	argumentParser.add_argument( '--edges-per-vertex', type=int, default=BenchmarkSuite.EDGES_PER_VERTEX )
+	argumentParser.add_argument( '--seed', type=int, default=0 )
+	argumentParser.add_argument( '--min-seconds', type=float, default=BenchmarkSuite.MIN_SECONDS, help='minimum time spent on each query' )
+	argumentParser.add_argument( '--output', help='the JSON file to write, instead of standard output' )
+	arguments = argumentParser.parse_args()
+	if arguments.suite:
+		results = BenchmarkSuite.run( arguments.sizes, arguments.edges_per_vertex, arguments.model, arguments.seed, arguments.min_seconds )
+		if arguments.output is not None:
+			with open( arguments.output, 'w' ) as outputFile:
+				json.dump( results, outputFile, indent=1 )
+		else:
+			json.dump( results, sys.stdout, indent=1 )
+			print()
+		sys.exit()
+
+	results = ParserBenchmark.run()
+	for parserName, secondsPerQuery in results.items():
+		print( '{:>10} : {:8.2f} us/query'.format( parserName, secondsPerQuery * 1e6 ) )
+	print( '{:>10} : {:8.2f}x'.format( 'speedup', results[ 'tokenize' ] / results[ 'lexer' ] ) )
+
+	for measurement, value in MemoryBenchmark.run().items():
+		print( '{:>14} : {:8.1f}'.format( measurement, value ) )
+
+	print( 'parallel execution on {} cores:'.format( os.cpu_count() ) )
+	graph = ParallelBenchmark.graph()
+	for gremlinQuery, secondsByWorkers in ParallelBenchmark.run( graph ).items():
+		print( gremlinQuery )
+		for workers, seconds in secondsByWorkers.items():
+			print( '{:>10} workers : {:8.3f}s {:6.2f}x'.format( workers, seconds, secondsByWorkers[ 1 ] / seconds ) )
+
+	print( 'analytics:' )
+	for stepName, secondsByMethod in AnalyticsBenchmark.run( graph ).items():
+		print( '{:>20} : {:8.3f}s step {:8.3f}s traversals {:6.1f}x'.format( stepName, secondsByMethod[ 'step' ], secondsByMethod[ 'traversals' ],
+			                                                                 secondsByMethod[ 'traversals' ] / secondsByMethod[ 'step' ] ) )
+
+	print( 'server:' )
+	for measurement, value in ServerBenchmark.run( graph ).items():
+		print( '{:>16} : {:10.2f}'.format( measurement, value ) )
@@ -0,0 +1,343 @@
+import unittest
+import array
+import bisect
+
+from graph import Graph, GraphObjectNotFound
+from graphstatistics import GraphStatistics
+from graphtypes import GraphObject, GraphVertex, GraphEdge
+
+class ReadOnlyGraphError( Exception ):
+	pass
+
+class UnsupportedIdError( Exception ):
+	pass
+
+class CompactVertex:
+	__slots__ = ('id', 'labels', 'props')
+	objectType = GraphObject.VERTEX
+
+	def __init__( self, id_, labels, props ):
+		self.id, self.labels, self.props = id_, labels, props
+
+	def getProperty( self, propertyName, default=None ):
+		return self.props.get( propertyName, default )
+
+	def __repr__( self ):
+		return 'CompactVertex vertexId={} labels : {} props  : {}'.format( self.id, self.labels, self.props )
+
+class CompactEdge:
+	__slots__ = ('id', 'fromVertexId', 'toVertexId', 'label', 'props')
+	objectType = GraphObject.EDGE
+
+	def __init__( self, id_, fromVertexId, toVertexId, label, props ):
+		self.id, self.fromVertexId, self.toVertexId, self.label, self.props = id_, fromVertexId, toVertexId, label, props
+
+	@property
+	def edgeLabel( self ):
+		return self.label
+
+	@property
+	def labels( self ):
+		return [ self.label ] if self.label is not None else list()
+
+	def getProperty( self, propertyName, default=None ):
+		return self.props.get( propertyName, default )
+
+	def fromTo( self ):
+		return self.fromVertexId, self.toVertexId
+
+	def __repr__( self ):
+		return 'CompactEdge edgeId={} edgeLabel : {} Direction : {} --> {} props  : {}'.format( self.id, self.label,
+			                                                                                   self.fromVertexId, self.toVertexId, self.props )
+
+class SortedIdIndex:
+	# Maps ids, held in ascending order in any integer sequence, to their dense position by binary search. It also
+	# serves as the keys view returned by V() and E().
+	__slots__ = ('ids',)
+
+	def __init__( self, ids ):
+		self.ids = ids
+
+	def get( self, id_, default=None ):
+		try:
+			position = bisect.bisect_left( self.ids, id_ )
+		except TypeError:
+			return default
+		if position < len( self.ids ) and self.ids[ position ] == id_:
+			return position
+		return default
+
+	def __getitem__( self, id_ ):
+		position = self.get( id_ )
+		if position is None:
+			raise KeyError( id_ )
+		return position
+
+	def __contains__( self, id_ ):
+		return self.get( id_ ) is not None
+
+	def __iter__( self ):
+		return iter( self.ids )
+
+	def __len__( self ):
+		return len( self.ids )
+
+	def keys( self ):
+		return self
+
+class CompactGraph:
+	# An immutable compressed-sparse-row snapshot of a Graph. Vertices and edges are numbered densely in id order;
+	# vertex i's outgoing edges occupy outTargets/outEdges/outLabels[ outOffsets[ i ] : outOffsets[ i + 1 ] ], sorted
+	# by label code so that a labelled expansion reads one contiguous range. Incoming edges are stored the same way.
+	OUT, IN, BOTH = Graph.OUT, Graph.IN, Graph.BOTH
+	MIN_ID, MAX_ID = -2 ** 63, 2 ** 63 - 1
+	# A compact graph never changes, so the versions of Graph.dependencyVersion stay at 0.
+	version = 0
+
+	def __init__( self ):
+		self.labelTable = list()
+		self.labelCodes = dict()
+
+		self.vertexIds = array.array( 'q' )
+		self.vertexIndex = SortedIdIndex( self.vertexIds )
+		self.vertexLabels = list()
+		self.vertexProps = list()
+
+		self.edgeIds = array.array( 'q' )
+		self.edgeIndex = SortedIdIndex( self.edgeIds )
+		self.edgeFrom = array.array( 'q' )
+		self.edgeTo = array.array( 'q' )
+		self.edgeLabels = array.array( 'i' )
+		self.edgeProps = list()
+
+		self.outOffsets, self.outTargets, self.outEdges, self.outLabels = array.array( 'q', [ 0 ] ), array.array( 'q' ), array.array( 'q' ), array.array( 'i' )
+		self.inOffsets, self.inTargets, self.inEdges, self.inLabels = array.array( 'q', [ 0 ] ), array.array( 'q' ), array.array( 'q' ), array.array( 'i' )
+
+		# Indexes are built on first use; propertyIndexes maps each indexed property name to its index, or to None
+		# until it has been built.
+		self.labelIndex = None
+		self.propertyIndexes = dict()
+		# Built on first use, like the indexes.
+		self.statistics = None
+
+	@staticmethod
+	def fromGraph( graph ):
+		# Ids are stored in arrays of 64 bit integers, while a Graph takes ids of any hashable type.
+		for ids in (graph.vertices, graph.edges):
+			for id_ in ids:
+				if type( id_ ) is not int or not CompactGraph.MIN_ID <= id_ <= CompactGraph.MAX_ID:
+					raise UnsupportedIdError( 'compact graphs only hold 64 bit integer ids, got {!r}'.format( id_ ) )
+		compactGraph = CompactGraph()
+
+		compactGraph.vertexIds.extend( sorted( graph.vertices ) )
+		compactGraph.edgeIds.extend( sorted( graph.edges ) )
+
+		for vertexId in compactGraph.vertexIds:
+			graphVertex = graph.vertices[ vertexId ]
+			compactGraph.vertexLabels.append( frozenset( compactGraph._labelString( label ) for label in graphVertex.labels ) )
+			compactGraph.vertexProps.append( dict( graphVertex.props ) )
+
+		for edgeId in compactGraph.edgeIds:
+			graphEdge = graph.edges[ edgeId ]
+			fromVertexId, toVertexId = graphEdge.fromTo()
+			compactGraph.edgeFrom.append( compactGraph.vertexIndex[ fromVertexId ] )
+			compactGraph.edgeTo.append( compactGraph.vertexIndex[ toVertexId ] )
+			compactGraph.edgeLabels.append( compactGraph._labelCode( graphEdge.label ) )
+			compactGraph.edgeProps.append( dict( graphEdge.props ) )
+
+		for vertexId in compactGraph.vertexIds:
+			graphVertex = graph.vertices[ vertexId ]
+			compactGraph._appendAdjacency( graphVertex.outAdjacency, compactGraph.outOffsets, compactGraph.outTargets, compactGraph.outEdges, compactGraph.outLabels )
+			compactGraph._appendAdjacency( graphVertex.inAdjacency, compactGraph.inOffsets, compactGraph.inTargets, compactGraph.inEdges, compactGraph.inLabels )
+
+		for propertyName in graph.propertyIndexes:
+			compactGraph.propertyIndexes[ propertyName ] = None
+		return compactGraph
+
+	def _labelCode( self, label ):
+		if label not in self.labelCodes:
+			self.labelCodes[ label ] = len( self.labelTable )
+			self.labelTable.append( label )
+		return self.labelCodes[ label ]
+
+	def _labelString( self, label ):
+		return self.labelTable[ self._labelCode( label ) ]
+
+	def _appendAdjacency( self, adjacency, offsets, targets, edges, labels ):
+		for edgeLabel in sorted( adjacency, key=self._labelCode ):
+			labelCode = self._labelCode( edgeLabel )
+			adjacentEdges = adjacency[ edgeLabel ]
+			for edgeId, neighbourVertexId in zip( adjacentEdges[ 0 : : 2 ], adjacentEdges[ 1 : : 2 ] ):
+				targets.append( self.vertexIndex[ neighbourVertexId ] )
+				edges.append( self.edgeIndex[ edgeId ] )
+				labels.append( labelCode )
+		offsets.append( len( targets ) )
+
+	def _labelRange( self, offsets, labels, vertexIndex, edgeLabel ):
+		start, end = offsets[ vertexIndex ], offsets[ vertexIndex + 1 ]
+		if edgeLabel is None:
+			return start, end
+		labelCode = self.labelCodes.get( edgeLabel )
+		if labelCode is None:
+			return start, start
+		return bisect.bisect_left( labels, labelCode, start, end ), bisect.bisect_right( labels, labelCode, start, end )
+
+	def _adjacency( self, offsets, targets, edges, labels, vertexId, edgeLabel ):
+		start, end = self._labelRange( offsets, labels, self.vertexIndex[ vertexId ], edgeLabel )
+		edgeIds, vertexIds = self.edgeIds, self.vertexIds
+		return [ (edgeIds[ edges[ position ] ], vertexIds[ targets[ position ] ]) for position in range( start, end ) ]
+
+	def outAdjacency( self, vertexId, edgeLabel=None ):
+		return self._adjacency( self.outOffsets, self.outTargets, self.outEdges, self.outLabels, vertexId, edgeLabel )
+
+	def inAdjacency( self, vertexId, edgeLabel=None ):
+		return self._adjacency( self.inOffsets, self.inTargets, self.inEdges, self.inLabels, vertexId, edgeLabel )
+
+	def expandFrontier( self, vertexIds, bulks, direction, edgeLabel=None ):
+		# Expands a whole frontier at once: returns the distinct neighbours of vertexIds along with their bulks, which
+		# are the number of walks reaching them. Nothing is allocated per edge.
+		adjacencyArrays = list()
+		if direction in (CompactGraph.OUT, CompactGraph.BOTH):
+			adjacencyArrays.append( (self.outOffsets, self.outTargets, self.outLabels) )
+		if direction in (CompactGraph.IN, CompactGraph.BOTH):
+			adjacencyArrays.append( (self.inOffsets, self.inTargets, self.inLabels) )
+
+		newBulks = dict()
+		for vertexId, bulk in zip( vertexIds, bulks ):
+			vertexIndex = self.vertexIndex[ vertexId ]
+			for offsets, targets, labels in adjacencyArrays:
+				start, end = self._labelRange( offsets, labels, vertexIndex, edgeLabel )
+				for target in targets[ start : end ]:
+					newBulks[ target ] = newBulks.get( target, 0 ) + bulk
+
+		return array.array( 'q', [ self.vertexIds[ target ] for target in newBulks ] ), array.array( 'q', newBulks.values() )
+
+	def getGraphObjectReference( self, id_ ):
+		vertexIndex = self.vertexIndex.get( id_ )
+		if vertexIndex is not None:
+			return CompactVertex( id_, self.vertexLabels[ vertexIndex ], self.vertexProps[ vertexIndex ] )
+		edgeIndex = self.edgeIndex.get( id_ )
+		if edgeIndex is None:
+			raise GraphObjectNotFound( 'object with id = {} not present'.format( id_ ) )
+		return CompactEdge( id_, self.vertexIds[ self.edgeFrom[ edgeIndex ] ], self.vertexIds[ self.edgeTo[ edgeIndex ] ],
+			                self.labelTable[ self.edgeLabels[ edgeIndex ] ], self.edgeProps[ edgeIndex ] )
+
+	def outDegree( self, vertexId, edgeLabel=None ):
+		start, end = self._labelRange( self.outOffsets, self.outLabels, self.vertexIndex[ vertexId ], edgeLabel )
+		return end - start
+
+	def inDegree( self, vertexId, edgeLabel=None ):
+		start, end = self._labelRange( self.inOffsets, self.inLabels, self.vertexIndex[ vertexId ], edgeLabel )
+		return end - start
+
+	def createLabelIndex( self ):
+		self.labelIndex = dict()
+		for vertexIndex, vertexId in enumerate( self.vertexIds ):
+			for label in self.vertexLabels[ vertexIndex ]:
+				self.labelIndex.setdefault( label, set() ).add( vertexId )
+
+	def createPropertyIndex( self, propertyName ):
+		index = self.propertyIndexes[ propertyName ] = dict()
+		for vertexIndex, vertexId in enumerate( self.vertexIds ):
+			props = self.vertexProps[ vertexIndex ]
+			if propertyName in props:
+				index.setdefault( props[ propertyName ], set() ).add( vertexId )
+
+	def hasLabelIndex( self ):
+		return True
+
+	def hasPropertyIndex( self, propertyName ):
+		return propertyName in self.propertyIndexes
+
+	def lookupLabel( self, label ):
+		if self.labelIndex is None:
+			self.createLabelIndex()
+		return self.labelIndex.get( label, set() )
+
+	def lookupProperty( self, propertyName, propertyValue ):
+		if self.propertyIndexes[ propertyName ] is None:
+			self.createPropertyIndex( propertyName )
+		return self.propertyIndexes[ propertyName ].get( propertyValue, set() )
+
+	def labelCount( self, label ):
+		return self._statistics().labelCount( label )
+
+	def propertyValueCount( self, propertyName, propertyValue ):
+		return self._statistics().propertyValueCount( propertyName, propertyValue )
+
+	def stats( self ):
+		return self._statistics().summary()
+
+	def _statistics( self ):
+		if self.statistics is None:
+			statistics = GraphStatistics()
+			outOffsets, inOffsets = self.outOffsets, self.inOffsets
+			for vertexIndex in range( len( self.vertexIds ) ):
+				statistics.addVertex( self.vertexLabels[ vertexIndex ], self.vertexProps[ vertexIndex ],
+					                  outOffsets[ vertexIndex + 1 ] - outOffsets[ vertexIndex ], inOffsets[ vertexIndex + 1 ] - inOffsets[ vertexIndex ] )
+			for edgeIndex in range( len( self.edgeIds ) ):
+				statistics.countEdge( self.labelTable[ self.edgeLabels[ edgeIndex ] ], self.edgeProps[ edgeIndex ], 1 )
+			self.statistics = statistics
+		return self.statistics
+
+	def addVertex( self, graphVertex, id_=None ):
+		raise ReadOnlyGraphError( 'cannot add a vertex to a compact graph' )
+
+	def addEdge( self, graphEdge, id_=None ):
+		raise ReadOnlyGraphError( 'cannot add an edge to a compact graph' )
+
+	def setProperty( self, id_, propertyName, propertyValue ):
+		raise ReadOnlyGraphError( 'cannot set a property on a compact graph' )
+
+	def addLabel( self, id_, label ):
+		raise ReadOnlyGraphError( 'cannot add a label on a compact graph' )
+
+	def dependencyVersion( self, key ):
+		return 0
+
+	def V( self ):
+		return self.vertexIndex.keys()
+
+	def vertexSnapshot( self ):
+		# The graph never changes, so its id view needs no copying.
+		return self.V()
+
+	def E( self ):
+		return self.edgeIndex.keys()
+
+	def __repr__( self ):
+		return 'compact graph @{} vertices: {} edges: {}'.format( id( self ), len( self.vertexIds ), len( self.edgeIds ) )
+
+class CompactGraphTest( unittest.TestCase ):
+	def test_adjacencyMatchesGraph( self ):
+		graph = Graph()
+		austin, dallas, houston, texas = [ graph.addVertex( GraphVertex( labels=[ 'airport' ] ) ) for _ in range( 4 ) ]
+		for fromVertexId, toVertexId, edgeLabel in [ (austin, dallas, 'route'), (austin, houston, 'route'), (dallas, houston, 'route'),
+		                                             (texas, austin, 'contains'), (austin, texas, 'in') ]:
+			graph.addEdge( GraphEdge( fromVertexId, toVertexId, edgeLabel ) )
+		compactGraph = graph.freeze()
+
+		for vertexId in graph.V():
+			for edgeLabel in (None, 'route', 'contains', 'in', 'missing'):
+				self.assertEqual( sorted( compactGraph.outAdjacency( vertexId, edgeLabel ) ), sorted( graph.outAdjacency( vertexId, edgeLabel ) ) )
+				self.assertEqual( sorted( compactGraph.inAdjacency( vertexId, edgeLabel ) ), sorted( graph.inAdjacency( vertexId, edgeLabel ) ) )
+
+		vertexIds, bulks = compactGraph.expandFrontier( [ austin, dallas ], [ 1, 2 ], CompactGraph.OUT, 'route' )
+		self.assertEqual( dict( zip( vertexIds, bulks ) ), { dallas : 1, houston : 3 } )
+		vertexIds, bulks = compactGraph.expandFrontier( [ austin ], [ 1 ], CompactGraph.BOTH )
+		self.assertEqual( dict( zip( vertexIds, bulks ) ), { dallas : 1, houston : 1, texas : 2 } )
+
+		self.assertEqual( compactGraph.lookupLabel( 'airport' ), { austin, dallas, houston, texas } )
+		self.assertEqual( compactGraph.stats(), graph.stats() )
+		with self.assertRaises( ReadOnlyGraphError ):
+			compactGraph.setProperty( austin, 'code', 'AUS' )
+
+	def test_unsupportedIds( self ):
+		for id_ in ('JFK', 2 ** 63, 1.5):
+			graph = Graph()
+			graph.addVertex( GraphVertex( labels=[ 'airport' ] ), id_=id_ )
+			with self.assertRaises( UnsupportedIdError ):
+				graph.freeze()
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 
-from graphtypes import GraphVertex, GraphEdge
+from graphtypes import GraphObject, GraphVertex, GraphEdge
+from graphstatistics import GraphStatistics
+from utilities import IdAllocator
 
 class GraphObjectNotFound( Exception ):
 	pass
@@ -9,16 +11,39 @@ class VertexDeletionError( Exception ):
 	pass
 
 class Graph:
+	OUT, IN, BOTH = 'OUT', 'IN', 'BOTH'
+	# Keys of the versions kept for cached query results. VERTICES and EDGES change whenever a vertex or edge is added
+	# or removed, PROPERTIES whenever a property is set and VERTEX_LABELS whenever a vertex is given another label; the
+	# others are completed by a label or a property name.
+	VERTICES, EDGES, PROPERTIES, VERTEX_LABELS = ('vertices',), ('edges',), ('properties',), ('vertexLabels',)
+	VERTEX_LABEL, EDGE_LABEL, PROPERTY = 'vertexLabel', 'edgeLabel', 'property'
+
 	def __init__( self ):
 		self.vertices = dict()
 		self.edges = dict()
 
-		self.nextObjectId = 0
+		# Optional hash indexes over vertices. labelIndex maps label -> set of vertex ids and is None until
+		# createLabelIndex() is called; propertyIndexes maps propertyName -> { propertyValue -> set of vertex ids }.
+		self.labelIndex = None
+		self.propertyIndexes = dict()
+		# Label, degree and property value counts, kept whether or not there are indexes.
+		self.statistics = GraphStatistics()
+
+		# Vertices and edges share one id space.
+		self.idAllocator = IdAllocator()
+
+		# version counts mutations; versions maps each key above to the version of the last mutation it covers.
+		self.version = 0
+		self.versions = dict()
 
 	def addVertex( self, graphVertex, id_=None ):
-		id_ = id_ or self._allocateId()
+		id_ = self._allocateId( id_ )
 		graphVertex.setId( id_ )
+		# The statistics are updated first, so that the graph is left unchanged should they fail.
+		self.statistics.addVertex( graphVertex.labels, graphVertex.props )
+		self._indexVertex( graphVertex )
 		self.vertices[ id_ ] = graphVertex
+		self._bumpVersions( Graph._vertexKeys( graphVertex ) )
 		return id_
 
 	def addEdge( self, graphEdge, id_=None ):
@@ -26,13 +51,56 @@ class Graph:
 		assert fromVertexId in self.vertices
 		assert toVertexId in self.vertices
 
-		id_ = id_ or self._allocateId()
+		id_ = self._allocateId( id_ )
 		graphEdge.setId( id_ )
-		self.vertices[ fromVertexId ].addOutgoingEdge( id_ )
-		self.vertices[ toVertexId ].addIncomingEdge( id_ )
+		self.statistics.addEdge( graphEdge.label, graphEdge.props, self.vertices[ fromVertexId ].outDegree(), self.vertices[ toVertexId ].inDegree() )
+		self.vertices[ fromVertexId ].addOutgoingEdge( id_, graphEdge.label, toVertexId )
+		self.vertices[ toVertexId ].addIncomingEdge( id_, graphEdge.label, fromVertexId )
 		self.edges[ id_ ] = graphEdge
+		self._bumpVersions( Graph._edgeKeys( graphEdge ) )
 		return id_
 
+	def bulkAddVertices( self, vertexBatch ):
+		# vertexBatch holds (id_, labels, props) tuples with explicit ids, which may come from reserveIds(). Unlike
+		# addVertex, ids are not checked for reuse; indexes are kept up to date.
+		vertices = self.vertices
+		schemas, labelSets = set(), set()
+		batchVertices = list()
+		for id_, labels, props in vertexBatch:
+			graphVertex = GraphVertex( labels=labels, props=props )
+			graphVertex.id = id_
+			schemas.add( graphVertex.schema )
+			labelSets.add( graphVertex.labels )
+			batchVertices.append( graphVertex )
+		# As in addVertex, the statistics are updated before the graph.
+		self.statistics.addVertexBatch( batchVertices )
+		for graphVertex in batchVertices:
+			vertices[ graphVertex.id ] = graphVertex
+			self._indexVertex( graphVertex )
+		self.idAllocator.claimAll( graphVertex.id for graphVertex in batchVertices )
+		self._bumpVersions( [ Graph.VERTICES ] + [ (Graph.VERTEX_LABEL, label) for labels in labelSets for label in labels ] +
+			                [ (Graph.PROPERTY, key) for schema in schemas for key in schema.keys ] )
+
+	def bulkAddEdges( self, edgeBatch ):
+		# edgeBatch holds (id_, fromVertexId, toVertexId, edgeLabel, props) tuples with explicit ids. Endpoints must
+		# already be present; adjacency for the whole batch is built in the same pass that creates the edges.
+		vertices, edges = self.vertices, self.edges
+		schemas, edgeLabels = set(), set()
+		batchEdges = list()
+		for id_, fromVertexId, toVertexId, edgeLabel, props in edgeBatch:
+			graphEdge = GraphEdge( fromVertexId, toVertexId, edgeLabel=edgeLabel, props=props )
+			graphEdge.id = id_
+			edges[ id_ ] = graphEdge
+			vertices[ fromVertexId ].addOutgoingEdge( id_, graphEdge.label, toVertexId )
+			vertices[ toVertexId ].addIncomingEdge( id_, graphEdge.label, fromVertexId )
+			schemas.add( graphEdge.schema )
+			edgeLabels.add( graphEdge.label )
+			batchEdges.append( graphEdge )
+		self.idAllocator.claimAll( graphEdge.id for graphEdge in batchEdges )
+		self.statistics.addEdgeBatch( batchEdges, self.outDegree, self.inDegree )
+		self._bumpVersions( [ Graph.EDGES ] + [ (Graph.EDGE_LABEL, edgeLabel) for edgeLabel in edgeLabels ] +
+			                [ (Graph.PROPERTY, key) for schema in schemas for key in schema.keys ] )
+
 	def getGraphObjectReference( self, id_ ):
 		if id_ in self.vertices:
 			return self.vertices[ id_ ]
@@ -48,7 +116,10 @@ class Graph:
 		if graphVertex.inDegree() > 0 or graphVertex.outDegree() > 0:
 			raise VertexDeletionError( 'object with id = {} cannot be deleted while in use'.format( id_ ) )
 
+		self.statistics.removeVertex( graphVertex.labels, graphVertex.props )
+		self._unindexVertex( graphVertex )
 		del self.vertices[ id_ ]
+		self._bumpVersions( Graph._vertexKeys( graphVertex ) )
 
 	def detachAndDeleteVertex( self, id_ ):
 		if id_ not in self.vertices:
@@ -63,29 +134,284 @@ class Graph:
 		if id_ not in self.edges:
 			raise GraphObjectNotFound( 'object with id = {} not present'.format( id_ ) )
 
-		fromVertexId, toVertexId = self.edges[ id_ ].fromTo()
-		self.vertices[ fromVertexId ].removeOutgoingEdge( id_ )
-		self.vertices[ toVertexId ].removeIncomingEdge( id_ )
+		graphEdge = self.edges[ id_ ]
+		fromVertexId, toVertexId = graphEdge.fromTo()
+		self.statistics.removeEdge( graphEdge.label, graphEdge.props, self.vertices[ fromVertexId ].outDegree(), self.vertices[ toVertexId ].inDegree() )
+		self.vertices[ fromVertexId ].removeOutgoingEdge( id_, graphEdge.label )
+		self.vertices[ toVertexId ].removeIncomingEdge( id_, graphEdge.label )
 
 		del self.edges[ id_ ]
+		self._bumpVersions( Graph._edgeKeys( graphEdge ) )
+
+	def outAdjacency( self, vertexId, edgeLabel=None ):
+		return self.vertices[ vertexId ].outgoingAdjacency( edgeLabel )
+
+	def outDegree( self, vertexId, edgeLabel=None ):
+		return self.vertices[ vertexId ].outDegree( edgeLabel )
+
+	def inDegree( self, vertexId, edgeLabel=None ):
+		return self.vertices[ vertexId ].inDegree( edgeLabel )
+
+	def inAdjacency( self, vertexId, edgeLabel=None ):
+		return self.vertices[ vertexId ].incomingAdjacency( edgeLabel )
+
+	def expandFrontier( self, vertexIds, bulks, direction, edgeLabel=None ):
+		# Returns the distinct neighbours of vertexIds along with their bulks, the number of walks reaching them.
+		newBulks = dict()
+		for vertexId, bulk in zip( vertexIds, bulks ):
+			graphVertex = self.vertices[ vertexId ]
+			if direction in (Graph.OUT, Graph.BOTH):
+				for neighbourVertexId in graphVertex.outgoingNeighbours( edgeLabel ):
+					newBulks[ neighbourVertexId ] = newBulks.get( neighbourVertexId, 0 ) + bulk
+			if direction in (Graph.IN, Graph.BOTH):
+				for neighbourVertexId in graphVertex.incomingNeighbours( edgeLabel ):
+					newBulks[ neighbourVertexId ] = newBulks.get( neighbourVertexId, 0 ) + bulk
+		return list( newBulks ), list( newBulks.values() )
+
+	def setProperty( self, id_, propertyName, propertyValue ):
+		graphObject = self.getGraphObjectReference( id_ )
+		self.statistics.setProperty( graphObject.objectType == GraphObject.VERTEX, propertyName, graphObject.props, propertyValue )
+		if graphObject.objectType == GraphObject.VERTEX and propertyName in self.propertyIndexes:
+			index = self.propertyIndexes[ propertyName ]
+			if propertyName in graphObject.schema.positions:
+				Graph._removeFromIndex( index, graphObject.getProperty( propertyName ), id_ )
+			index.setdefault( propertyValue, set() ).add( id_ )
+		graphObject.setProperty( propertyName, propertyValue )
+		self._bumpVersions( (Graph.PROPERTIES, (Graph.PROPERTY, propertyName)) )
+
+	def addLabel( self, id_, label ):
+		if id_ not in self.vertices:
+			raise GraphObjectNotFound( 'object with id = {} not present'.format( id_ ) )
+
+		if label not in self.vertices[ id_ ].labels:
+			self.statistics.addLabel( label )
+		self.vertices[ id_ ].addLabel( label )
+		if self.labelIndex is not None:
+			self.labelIndex.setdefault( label, set() ).add( id_ )
+		self._bumpVersions( (Graph.VERTEX_LABELS, (Graph.VERTEX_LABEL, label)) )
+
+	def labelCount( self, label ):
+		return self.statistics.labelCount( label )
+
+	def propertyValueCount( self, propertyName, propertyValue ):
+		# The number of vertices with propertyName set to propertyValue.
+		return self.statistics.propertyValueCount( propertyName, propertyValue )
+
+	def stats( self ):
+		return self.statistics.summary()
+
+	def dependencyVersion( self, key ):
+		return self.versions.get( key, 0 )
+
+	def _bumpVersions( self, keys ):
+		self.version += 1
+		for key in keys:
+			self.versions[ key ] = self.version
+
+	@staticmethod
+	def _vertexKeys( graphVertex ):
+		return [ Graph.VERTICES ] + [ (Graph.VERTEX_LABEL, label) for label in graphVertex.labels ] + [ (Graph.PROPERTY, key) for key in graphVertex.schema.keys ]
+
+	@staticmethod
+	def _edgeKeys( graphEdge ):
+		return [ Graph.EDGES, (Graph.EDGE_LABEL, graphEdge.label) ] + [ (Graph.PROPERTY, key) for key in graphEdge.schema.keys ]
+
+	def createLabelIndex( self ):
+		self.labelIndex = dict()
+		for id_, graphVertex in self.vertices.items():
+			for label in graphVertex.labels:
+				self.labelIndex.setdefault( label, set() ).add( id_ )
+
+	def createPropertyIndex( self, propertyName ):
+		index = self.propertyIndexes[ propertyName ] = dict()
+		for id_, graphVertex in self.vertices.items():
+			if propertyName in graphVertex.props:
+				index.setdefault( graphVertex.props[ propertyName ], set() ).add( id_ )
+
+	def dropPropertyIndex( self, propertyName ):
+		del self.propertyIndexes[ propertyName ]
+
+	def hasLabelIndex( self ):
+		return self.labelIndex is not None
+
+	def hasPropertyIndex( self, propertyName ):
+		return propertyName in self.propertyIndexes
+
+	def lookupLabel( self, label ):
+		return self.labelIndex.get( label, set() )
+
+	def lookupProperty( self, propertyName, propertyValue ):
+		return self.propertyIndexes[ propertyName ].get( propertyValue, set() )
+
+	def _indexVertex( self, graphVertex ):
+		if self.labelIndex is not None:
+			for label in graphVertex.labels:
+				self.labelIndex.setdefault( label, set() ).add( graphVertex.id )
+		for propertyName, index in self.propertyIndexes.items():
+			if propertyName in graphVertex.props:
+				index.setdefault( graphVertex.props[ propertyName ], set() ).add( graphVertex.id )
+
+	def _unindexVertex( self, graphVertex ):
+		if self.labelIndex is not None:
+			for label in graphVertex.labels:
+				Graph._removeFromIndex( self.labelIndex, label, graphVertex.id )
+		for propertyName, index in self.propertyIndexes.items():
+			if propertyName in graphVertex.props:
+				Graph._removeFromIndex( index, graphVertex.props[ propertyName ], graphVertex.id )
+
+	@staticmethod
+	def _removeFromIndex( index, key, id_ ):
+		bucket = index[ key ]
+		bucket.discard( id_ )
+		if len( bucket ) == 0:
+			del index[ key ]
+
+	def freeze( self ):
+		# Imported here as compactgraph builds on this module.
+		from compactgraph import CompactGraph
+		return CompactGraph.fromGraph( self )
 
 	def V( self ):
 		return self.vertices.keys()
 
+	def vertexSnapshot( self ):
+		# The ids of the vertices present now, which vertices added or deleted afterwards leave unchanged; V() is a
+		# live view.
+		return tuple( self.vertices )
+
 	def E( self ):
 		return self.edges.keys()
 
-	def _allocateId( self ):
-		while True:
-			id_ = self.nextObjectId
-			self.nextObjectId += 1
-			if id_ in self.vertices or id_ in self.edges:
-				continue
-			break
+	def reserveIds( self, count ):
+		# Returns a range of count unused contiguous ids, which no later addVertex or addEdge will allocate.
+		return self.idAllocator.reserve( count )
+
+	def _allocateId( self, id_ ):
+		# Returns id_, or a new id when it is None; an explicit id, 0 included, is used as given.
+		if id_ is None:
+			return self.idAllocator.allocate()
+		self.idAllocator.claim( id_ )
 		return id_
 
 	def __repr__( self ):
 		return 'graph @{} vertices: {} edges: {}'.format( id( self ), len( self.vertices ), len( self.edges ) )
 
+class GraphIndexTest( unittest.TestCase ):
+	def test_indexMaintenance( self ):
+		graph = Graph()
+		graph.createLabelIndex()
+		graph.createPropertyIndex( 'code' )
+
+		austin = graph.addVertex( GraphVertex( labels=[ 'airport' ], props={ 'code' : 'AUS' } ) )
+		dallas = graph.addVertex( GraphVertex( labels=[ 'airport' ], props={ 'code' : 'DFW' } ) )
+		self.assertEqual( graph.lookupLabel( 'airport' ), { austin, dallas } )
+		self.assertEqual( graph.lookupProperty( 'code', 'AUS' ), { austin } )
+
+		graph.setProperty( austin, 'code', 'ATX' )
+		self.assertEqual( graph.lookupProperty( 'code', 'AUS' ), set() )
+		self.assertEqual( graph.lookupProperty( 'code', 'ATX' ), { austin } )
+
+		graph.addLabel( dallas, 'hub' )
+		self.assertEqual( graph.lookupLabel( 'hub' ), { dallas } )
+
+		graph.deleteVertex( dallas )
+		self.assertEqual( graph.lookupLabel( 'airport' ), { austin } )
+		self.assertEqual( graph.lookupLabel( 'hub' ), set() )
+		self.assertEqual( graph.lookupProperty( 'code', 'DFW' ), set() )
+
+		# Indexes created after the fact are built from the existing vertices.
+		graph.createPropertyIndex( 'city' )
+		graph.setProperty( austin, 'city', 'Austin' )
+		self.assertEqual( graph.lookupProperty( 'city', 'Austin' ), { austin } )
+
+class GraphVersionTest( unittest.TestCase ):
+	def test_versions( self ):
+		graph = Graph()
+		austin = graph.addVertex( GraphVertex( labels=[ 'airport' ], props={ 'code' : 'AUS' } ) )
+		dallas = graph.addVertex( GraphVertex( labels=[ 'airport' ], props={ 'code' : 'DFW' } ) )
+		usa = graph.addVertex( GraphVertex( labels=[ 'country' ] ) )
+		self.assertEqual( (graph.version, graph.dependencyVersion( (Graph.VERTEX_LABEL, 'airport') ), graph.dependencyVersion( Graph.VERTICES )), (3, 2, 3) )
+
+		routeId = graph.addEdge( GraphEdge( austin, dallas, 'route', props={ 'dist' : 190 } ) )
+		graph.addEdge( GraphEdge( usa, austin, 'contains' ) )
+		self.assertEqual( [ graph.dependencyVersion( key ) for key in (Graph.EDGES, (Graph.EDGE_LABEL, 'route'), (Graph.PROPERTY, 'dist')) ], [ 5, 4, 4 ] )
+
+		graph.setProperty( austin, 'city', 'Austin' )
+		graph.addLabel( dallas, 'hub' )
+		graph.deleteEdge( routeId )
+		self.assertEqual( [ graph.dependencyVersion( key ) for key in ((Graph.PROPERTY, 'city'), Graph.PROPERTIES, (Graph.VERTEX_LABEL, 'hub'), (Graph.EDGE_LABEL, 'route'),
+		                                                               (Graph.EDGE_LABEL, 'contains'), (Graph.PROPERTY, 'code')) ], [ 6, 6, 7, 8, 5, 2 ] )
+
+		graph.detachAndDeleteVertex( usa )
+		self.assertEqual( [ graph.dependencyVersion( key ) for key in ((Graph.EDGE_LABEL, 'contains'), (Graph.VERTEX_LABEL, 'country'), (Graph.VERTEX_LABEL, 'airport')) ], [ 9, 10, 2 ] )
+
+class GraphStatsTest( unittest.TestCase ):
+	def test_incrementalStats( self ):
+		graph = Graph()
+		austin = graph.addVertex( GraphVertex( labels=[ 'airport' ], props={ 'code' : 'AUS', 'country' : 'US' } ) )
+		graph.bulkAddVertices( [ (10, [ 'airport' ], { 'code' : 'DFW', 'country' : 'US' }), (11, [ 'airport' ], { 'code' : 'YYZ', 'country' : 'CA' }) ] )
+		graph.bulkAddEdges( [ (20, austin, 10, 'route', { 'dist' : 190 }), (21, austin, 11, 'route', { 'dist' : 1357 }) ] )
+		contains = graph.addEdge( GraphEdge( 11, austin, 'contains' ) )
+		graph.setProperty( 11, 'country', 'US' )
+		graph.addLabel( austin, 'hub' )
+
+		stats = graph.stats()
+		self.assertEqual( (stats[ 'vertices' ], stats[ 'edges' ]), (3, 3) )
+		self.assertEqual( (stats[ 'vertexLabels' ], stats[ 'edgeLabels' ]), ({ 'airport' : 3, 'hub' : 1 }, { 'route' : 2, 'contains' : 1 }) )
+		self.assertEqual( (stats[ 'outDegrees' ], stats[ 'inDegrees' ]), ({ 0 : 1, 1 : 1, 2 : 1 }, { 1 : 3 }) )
+		self.assertEqual( stats[ 'vertexProperties' ], { 'code' : { 'count' : 3, 'distinct' : 3 }, 'country' : { 'count' : 3, 'distinct' : 1 } } )
+		self.assertEqual( graph.propertyValueCount( 'country', 'US' ), 3 )
+
+		graph.deleteEdge( contains )
+		graph.detachAndDeleteVertex( 10 )
+		stats = graph.stats()
+		self.assertEqual( (stats[ 'vertices' ], stats[ 'edgeLabels' ], stats[ 'outDegrees' ], stats[ 'inDegrees' ]), (2, { 'route' : 1 }, { 0 : 1, 1 : 1 }, { 0 : 1, 1 : 1 }) )
+		self.assertEqual( stats[ 'edgeProperties' ], { 'dist' : { 'count' : 1, 'distinct' : 1 } } )
+
+	def test_unhashableValues( self ):
+		# Values such as lists are counted together, as a single distinct value.
+		graph = Graph()
+		tagged = graph.addVertex( GraphVertex( labels=[ 'person' ], props={ 'tags' : [ 'x' ] } ) )
+		graph.bulkAddVertices( [ (10, [ 'person' ], { 'tags' : [ 'y' ] }), (11, [ 'person' ], { 'tags' : 'z' }) ] )
+		graph.setProperty( 11, 'tags', [ 'z' ] )
+		graph.setProperty( tagged, 'scores', { 'a' : 1 } )
+		self.assertEqual( graph.stats()[ 'vertexProperties' ], { 'tags' : { 'count' : 3, 'distinct' : 1 }, 'scores' : { 'count' : 1, 'distinct' : 1 } } )
+		self.assertEqual( (graph.propertyValueCount( 'tags', [ 'x' ] ), graph.propertyValueCount( 'tags', 'z' )), (3, 0) )
+
+		graph.deleteVertex( tagged )
+		self.assertEqual( (len( graph.vertices ), graph.stats()[ 'vertexProperties' ]), (2, { 'tags' : { 'count' : 2, 'distinct' : 1 } }) )
+
+class GraphIdTest( unittest.TestCase ):
+	def test_idAllocation( self ):
+		graph = Graph()
+		self.assertEqual( graph.addVertex( GraphVertex(), id_=1 ), 1 )
+		self.assertEqual( graph.addVertex( GraphVertex(), id_=0 ), 0 )
+		self.assertEqual( graph.addVertex( GraphVertex() ), 2 )
+
+		graph.bulkAddVertices( (id_, [ 'airport' ], dict()) for id_ in range( 5, 1005 ) )
+		self.assertEqual( [ graph.addVertex( GraphVertex() ) for _ in range( 3 ) ], [ 3, 4, 1005 ] )
+		reserved = graph.reserveIds( 2 )
+		self.assertEqual( reserved, range( 1006, 1008 ) )
+		graph.bulkAddEdges( (id_, 0, 1, 'route', dict()) for id_ in reserved )
+		self.assertEqual( graph.addEdge( GraphEdge( 1, 0, 'route' ) ), 1008 )
+		self.assertEqual( graph.addVertex( GraphVertex(), id_='JFK' ), 'JFK' )
+
+class GraphAdjacencyTest( unittest.TestCase ):
+	def test_labelPartitionedAdjacency( self ):
+		graph = Graph()
+		austin, dallas, texas = [ graph.addVertex( GraphVertex() ) for _ in range( 3 ) ]
+		route = graph.addEdge( GraphEdge( austin, dallas, 'route' ) )
+		contains = graph.addEdge( GraphEdge( texas, austin, 'contains' ) )
+
+		self.assertEqual( list( graph.outAdjacency( austin, 'route' ) ), [ (route, dallas) ] )
+		self.assertEqual( list( graph.outAdjacency( austin, 'contains' ) ), list() )
+		self.assertEqual( list( graph.inAdjacency( austin ) ), [ (contains, texas) ] )
+		self.assertEqual( graph.vertices[ austin ].outDegree( 'route' ), 1 )
+
+		graph.detachAndDeleteVertex( austin )
+		self.assertEqual( graph.vertices[ dallas ].inDegree(), 0 )
+		self.assertEqual( graph.vertices[ texas ].outDegree(), 0 )
+		self.assertEqual( len( graph.edges ), 0 )
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -0,0 +1,120 @@
+import unittest
+import array
+import operator
+
+from graph import Graph
+from graphtypes import GraphVertex, GraphEdge
+
+class GraphAnalytics:
+	# Whole-graph algorithms over any graph exposing V(), outDegree/inDegree and inAdjacency, which covers Graph and
+	# CompactGraph. Each first numbers the vertices densely and copies the edges into arrays, so that its iterations
+	# run over the arrays rather than the graph's objects. Results are dicts from vertex id to value.
+	DAMPING_FACTOR = 0.85
+	TOLERANCE = 1e-6
+	MAX_ITERATIONS = 100
+
+	@staticmethod
+	def adjacencyArrays( graph, edgeLabel=None ):
+		# Returns ( vertexIds, outDegrees, inOffsets, inSources ): the edges into vertexIds[ i ] come from the vertices
+		# numbered inSources[ inOffsets[ i ] : inOffsets[ i + 1 ] ].
+		vertexIds = list( graph.V() )
+		positions = { vertexId : position for position, vertexId in enumerate( vertexIds ) }
+		outDegrees, inOffsets, inSources = array.array( 'q' ), array.array( 'q', [ 0 ] ), array.array( 'q' )
+		neighbour = operator.itemgetter( 1 )
+		for vertexId in vertexIds:
+			outDegrees.append( graph.outDegree( vertexId, edgeLabel ) )
+			inSources.extend( map( positions.__getitem__, map( neighbour, graph.inAdjacency( vertexId, edgeLabel ) ) ) )
+			inOffsets.append( len( inSources ) )
+		return vertexIds, outDegrees, inOffsets, inSources
+
+	@staticmethod
+	def pageRank( graph, edgeLabel=None, tolerance=TOLERANCE, maxIterations=MAX_ITERATIONS, dampingFactor=DAMPING_FACTOR ):
+		# Power iteration, each vertex pulling the rank of its in-neighbours divided by their out degrees. The rank of
+		# vertices without outgoing edges is spread over every vertex. Stops once the ranks change by less than tolerance
+		# in total, or after maxIterations. Returns ( ranks, iterations run ).
+		vertexIds, outDegrees, inOffsets, inSources = GraphAnalytics.adjacencyArrays( graph, edgeLabel )
+		vertexCount = len( vertexIds )
+		if vertexCount == 0:
+			return dict(), 0
+		ranks = [ 1.0 / vertexCount ] * vertexCount
+		iterations = 0
+		while iterations < maxIterations:
+			iterations += 1
+			contributions = [ rank / outDegree if outDegree > 0 else 0.0 for rank, outDegree in zip( ranks, outDegrees ) ]
+			danglingRank = sum( rank for rank, outDegree in zip( ranks, outDegrees ) if outDegree == 0 )
+			baseRank = ( 1.0 - dampingFactor + dampingFactor * danglingRank ) / vertexCount
+			contribution = contributions.__getitem__
+			newRanks = [ baseRank + dampingFactor * sum( map( contribution, inSources[ inOffsets[ position ] : inOffsets[ position + 1 ] ] ) )
+			             for position in range( vertexCount ) ]
+			change = sum( abs( newRank - rank ) for newRank, rank in zip( newRanks, ranks ) )
+			ranks = newRanks
+			if change < tolerance:
+				break
+		return dict( zip( vertexIds, ranks ) ), iterations
+
+	@staticmethod
+	def connectedComponent( graph, edgeLabel=None ):
+		# Weakly connected components, by union-find over the edge arrays. Each vertex is mapped to the smallest vertex
+		# id of its component.
+		vertexIds, _, inOffsets, inSources = GraphAnalytics.adjacencyArrays( graph, edgeLabel )
+		parents = list( range( len( vertexIds ) ) )
+
+		def find( position ):
+			while parents[ position ] != position:
+				parents[ position ] = parents[ parents[ position ] ]
+				position = parents[ position ]
+			return position
+
+		for position in range( len( vertexIds ) ):
+			for sourcePosition in inSources[ inOffsets[ position ] : inOffsets[ position + 1 ] ]:
+				root, sourceRoot = find( position ), find( sourcePosition )
+				if root != sourceRoot:
+					parents[ max( root, sourceRoot ) ] = min( root, sourceRoot )
+
+		componentIds = dict()
+		for position, vertexId in enumerate( vertexIds ):
+			root = find( position )
+			componentIds[ root ] = min( componentIds.get( root, vertexId ), vertexId )
+		return { vertexId : componentIds[ find( position ) ] for position, vertexId in enumerate( vertexIds ) }
+
+	@staticmethod
+	def degreeCentrality( graph, direction=Graph.BOTH, edgeLabel=None ):
+		# The number of edges at each vertex in direction, which the graphs keep per vertex.
+		degrees = dict()
+		for vertexId in graph.V():
+			degree = 0
+			if direction in (Graph.OUT, Graph.BOTH):
+				degree += graph.outDegree( vertexId, edgeLabel )
+			if direction in (Graph.IN, Graph.BOTH):
+				degree += graph.inDegree( vertexId, edgeLabel )
+			degrees[ vertexId ] = degree
+		return degrees
+
+class GraphAnalyticsTest( unittest.TestCase ):
+	def setUp( self ):
+		# Two components: a 0 -> 1 -> 2 -> 0 cycle with a spoke 3 -> 0, and a single edge 10 -> 11.
+		self.graph = Graph()
+		for vertexId in (0, 1, 2, 3, 10, 11):
+			self.graph.addVertex( GraphVertex( labels=[ 'airport' ] ), id_=vertexId )
+		for fromVertexId, toVertexId in [ (0, 1), (1, 2), (2, 0), (3, 0), (10, 11) ]:
+			self.graph.addEdge( GraphEdge( fromVertexId, toVertexId, 'route' ) )
+
+	def test_pageRank( self ):
+		for graph in (self.graph, self.graph.freeze()):
+			ranks, iterations = GraphAnalytics.pageRank( graph, tolerance=1e-10, maxIterations=1000 )
+			self.assertAlmostEqual( sum( ranks.values() ), 1.0 )
+			self.assertEqual( max( ranks, key=ranks.get ), 0 )
+			self.assertAlmostEqual( ranks[ 11 ], ranks[ 10 ] * ( 1 + GraphAnalytics.DAMPING_FACTOR ) )
+			self.assertLess( iterations, 1000 )
+		_, iterations = GraphAnalytics.pageRank( self.graph, maxIterations=3 )
+		self.assertEqual( iterations, 3 )
+		self.assertEqual( GraphAnalytics.pageRank( self.graph, edgeLabel='missing' )[ 0 ][ 0 ], 1 / 6 )
+
+	def test_componentsAndDegrees( self ):
+		self.assertEqual( GraphAnalytics.connectedComponent( self.graph ), { 0 : 0, 1 : 0, 2 : 0, 3 : 0, 10 : 10, 11 : 10 } )
+		self.assertEqual( GraphAnalytics.connectedComponent( self.graph, 'missing' )[ 11 ], 11 )
+		self.assertEqual( GraphAnalytics.degreeCentrality( self.graph ), { 0 : 3, 1 : 2, 2 : 2, 3 : 1, 10 : 1, 11 : 1 } )
+		self.assertEqual( GraphAnalytics.degreeCentrality( self.graph.freeze(), Graph.IN )[ 0 ], 2 )
+
+if __name__ == '__main__':
+	unittest.main()
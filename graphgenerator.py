@@ -0,0 +1,186 @@
+import unittest
+import io
+import random
+import bisect
+import itertools
+
+from graph import Graph
+from graphml import GraphMLLoader, GraphMLWriter
+
+class UnknownModelError( Exception ):
+	pass
+
+class GraphSizeError( Exception ):
+	pass
+
+class GraphGenerator:
+	# Generates synthetic graphs for scale testing, with labelled vertices and edges carrying typed properties:
+	#   erdosRenyi      edgeCount edges between uniformly chosen vertices (G(n, m), duplicate edges allowed);
+	#   barabasiAlbert  each new vertex gets edgeCount // vertexCount edges from vertices picked in proportion to
+	#                   their degree, so the oldest vertices become hubs and degrees follow a power law;
+	#   rmat            each edge falls recursively into a quadrant of the adjacency matrix with RMAT_PROBABILITIES,
+	#                   giving skewed degrees and community structure, the lowest ids being the hubs.
+	# Vertex ids are 0 .. vertexCount - 1 and edge ids follow them. Vertices and edges are produced as streams in the
+	# tuples of Graph's bulk-load API, from random generators seeded by seed alone, so the same arguments always give
+	# the same graph whether it is loaded in batches or streamed to disk.
+	MODELS = ('erdosRenyi', 'barabasiAlbert', 'rmat')
+	VERTEX_LABELS = { 'person' : 0.9, 'company' : 0.1 }
+	EDGE_LABELS = { 'knows' : 0.8, 'follows' : 0.2 }
+	VERTEX_KEYS = { 'name' : str, 'age' : int, 'score' : float, 'active' : bool }
+	EDGE_KEYS = { 'weight' : float, 'since' : int }
+	RMAT_PROBABILITIES = (0.57, 0.19, 0.19, 0.05)
+	RMAT_LEVELS_PER_DRAW = 4
+	BATCH_SIZE = 100000
+
+	def __init__( self, model, vertexCount, edgeCount, seed=0 ):
+		if model not in GraphGenerator.MODELS:
+			raise UnknownModelError( 'Unknown graph model {}, expected one of {}'.format( model, ', '.join( GraphGenerator.MODELS ) ) )
+		# Edges join two distinct vertices.
+		if edgeCount > 0 and vertexCount < 2:
+			raise GraphSizeError( '{} edges need at least 2 vertices, got {}'.format( edgeCount, vertexCount ) )
+		self.model = model
+		self.vertexCount, self.edgeCount = vertexCount, edgeCount
+		self.seed = seed
+
+	def vertices( self ):
+		randomGenerator = random.Random( '{}/vertices'.format( self.seed ) )
+		labels, cumulativeWeights = GraphGenerator._cumulative( GraphGenerator.VERTEX_LABELS )
+		for id_ in range( self.vertexCount ):
+			label = labels[ bisect.bisect( cumulativeWeights, randomGenerator.random() * cumulativeWeights[ -1 ] ) ]
+			yield (id_, [ label ], { 'name' : 'v{}'.format( id_ ), 'age' : randomGenerator.randint( 18, 80 ),
+			                         'score' : round( randomGenerator.random(), 4 ), 'active' : randomGenerator.random() < 0.5 })
+
+	def edges( self ):
+		randomGenerator = random.Random( '{}/edges'.format( self.seed ) )
+		labels, cumulativeWeights = GraphGenerator._cumulative( GraphGenerator.EDGE_LABELS )
+		pairs = getattr( self, '_{}Pairs'.format( self.model ) )( random.Random( '{}/{}'.format( self.seed, self.model ) ) )
+		for id_, (fromVertexId, toVertexId) in zip( itertools.count( self.vertexCount ), pairs ):
+			label = labels[ bisect.bisect( cumulativeWeights, randomGenerator.random() * cumulativeWeights[ -1 ] ) ]
+			yield (id_, fromVertexId, toVertexId, label, { 'weight' : round( randomGenerator.random(), 4 ), 'since' : randomGenerator.randint( 1990, 2024 ) })
+
+	def load( self, graph=None, batchSize=BATCH_SIZE ):
+		# Adds the generated graph to graph, a new Graph by default, batchSize objects at a time through the bulk-load
+		# API, so only one batch of tuples is held at once. Indexes created on graph beforehand are filled as it loads.
+		graph = graph if graph is not None else Graph()
+		for objects, bulkAdd in ((self.vertices(), graph.bulkAddVertices), (self.edges(), graph.bulkAddEdges)):
+			while True:
+				batch = list( itertools.islice( objects, batchSize ) )
+				if len( batch ) == 0:
+					break
+				bulkAdd( batch )
+		return graph
+
+	def write( self, path ):
+		# Streams the generated graph to a GraphML file, which GraphMLLoader loads. Returns ( vertices, edges ) written.
+		with open( path, 'w', encoding='utf-8' ) as stream:
+			return GraphMLWriter( stream, GraphGenerator.VERTEX_KEYS, GraphGenerator.EDGE_KEYS ).write( self.vertices(), self.edges() )
+
+	def _erdosRenyiPairs( self, randomGenerator ):
+		vertexCount = self.vertexCount
+		for _ in range( self.edgeCount ):
+			# Draws the target among the other vertices, so there are no self loops.
+			fromVertexId, toVertexId = randomGenerator.randrange( vertexCount ), randomGenerator.randrange( vertexCount - 1 )
+			yield fromVertexId, toVertexId + 1 if toVertexId >= fromVertexId else toVertexId
+
+	def _barabasiAlbertPairs( self, randomGenerator ):
+		if self.edgeCount == 0:
+			return
+		# Vertex 0 starts the graph, and the edges are spread evenly over the vertices which follow it, each getting
+		# edgeCount // ( vertexCount - 1 ) or one more. Every vertex appears in endpoints once per edge it has, so a
+		# uniform choice from it is a choice by degree; vertex 0 starts out connected to nothing, and is picked by the
+		# first new vertex. A vertex's sources are distinct while there are enough connected vertices to pick from,
+		# and the rest are picked again by degree, as duplicate edges are allowed.
+		newVertexCount = self.vertexCount - 1
+		endpoints, connectedCount = [ 0 ], 1
+		for toVertexId in range( 1, self.vertexCount ):
+			edgeCount = toVertexId * self.edgeCount // newVertexCount - ( toVertexId - 1 ) * self.edgeCount // newVertexCount
+			if edgeCount == 0:
+				continue
+			fromVertexIds = set()
+			while len( fromVertexIds ) < min( edgeCount, connectedCount ):
+				fromVertexIds.add( randomGenerator.choice( endpoints ) )
+			fromVertexIds = sorted( fromVertexIds ) + [ randomGenerator.choice( endpoints ) for _ in range( edgeCount - len( fromVertexIds ) ) ]
+			for fromVertexId in fromVertexIds:
+				yield fromVertexId, toVertexId
+				endpoints.append( fromVertexId )
+				endpoints.append( toVertexId )
+			connectedCount += 1
+
+	def _rmatPairs( self, randomGenerator ):
+		# Ids are drawn over the next power of two, RMAT_LEVELS_PER_DRAW levels at a time, and pairs falling outside
+		# vertexCount or on a single vertex are drawn again.
+		scale = max( 1, ( self.vertexCount - 1 ).bit_length() )
+		levelsPerDraw = min( GraphGenerator.RMAT_LEVELS_PER_DRAW, scale )
+		draws = [ (levelsPerDraw, GraphGenerator._rmatOutcomes( levelsPerDraw )) ] * ( scale // levelsPerDraw )
+		if scale % levelsPerDraw > 0:
+			draws.append( (scale % levelsPerDraw, GraphGenerator._rmatOutcomes( scale % levelsPerDraw )) )
+		pairCount = 0
+		while pairCount < self.edgeCount:
+			fromVertexId, toVertexId = 0, 0
+			for levels, (cumulativeProbabilities, fromBits, toBits) in draws:
+				outcome = bisect.bisect( cumulativeProbabilities, randomGenerator.random() * cumulativeProbabilities[ -1 ] )
+				fromVertexId, toVertexId = ( fromVertexId << levels ) | fromBits[ outcome ], ( toVertexId << levels ) | toBits[ outcome ]
+			if fromVertexId < self.vertexCount and toVertexId < self.vertexCount and fromVertexId != toVertexId:
+				pairCount += 1
+				yield fromVertexId, toVertexId
+
+	@staticmethod
+	def _rmatOutcomes( levels ):
+		# The 4 ** levels ways of descending levels quadrants at once, as ( cumulative probabilities, from id bits, to
+		# id bits ), so that a single draw replaces one per level.
+		cumulativeProbabilities, fromBits, toBits = list(), list(), list()
+		probability = 0.0
+		for quadrants in itertools.product( range( 4 ), repeat=levels ):
+			fromId, toId, outcomeProbability = 0, 0, 1.0
+			for quadrant in quadrants:
+				fromId, toId = fromId * 2 + quadrant // 2, toId * 2 + quadrant % 2
+				outcomeProbability *= GraphGenerator.RMAT_PROBABILITIES[ quadrant ]
+			probability += outcomeProbability
+			cumulativeProbabilities.append( probability )
+			fromBits.append( fromId )
+			toBits.append( toId )
+		return cumulativeProbabilities, fromBits, toBits
+
+	@staticmethod
+	def _cumulative( weights ):
+		return list( weights ), list( itertools.accumulate( weights.values() ) )
+
+class GraphGeneratorTest( unittest.TestCase ):
+	def test_models( self ):
+		for model in GraphGenerator.MODELS:
+			graph = GraphGenerator( model, 500, 2000, seed=7 ).load( batchSize=300 )
+			self.assertEqual( len( graph.vertices ), 500, model )
+			self.assertGreater( len( graph.edges ), 1500, model )
+			self.assertTrue( all( graphEdge.fromVertexId != graphEdge.toVertexId for graphEdge in graph.edges.values() ), model )
+			self.assertEqual( set( graph.stats()[ 'vertexLabels' ] ), set( GraphGenerator.VERTEX_LABELS ) )
+			self.assertEqual( { propertyName : type( propertyValue ) for propertyName, propertyValue in graph.vertices[ 42 ].props.items() }, GraphGenerator.VERTEX_KEYS )
+			degrees = sorted( ( graph.outDegree( vertexId ) + graph.inDegree( vertexId ) for vertexId in graph.vertices ), reverse=True )
+			if model == 'erdosRenyi':
+				self.assertLess( degrees[ 0 ], 30 )
+			else:
+				# The hubs of the power-law models have many times the mean degree of 8.
+				self.assertGreater( degrees[ 0 ], 40, model )
+		with self.assertRaises( UnknownModelError ):
+			GraphGenerator( 'smallWorld', 10, 10 )
+		for model in GraphGenerator.MODELS:
+			with self.assertRaises( GraphSizeError ):
+				GraphGenerator( model, 1, 2 )
+			self.assertEqual( len( GraphGenerator( model, 1, 0 ).load().vertices ), 1 )
+			for vertexCount, edgeCount in ((10, 0), (2, 3), (100, 150), (500, 2000), (50, 1234)):
+				self.assertEqual( len( GraphGenerator( model, vertexCount, edgeCount ).load().edges ), edgeCount, (model, vertexCount, edgeCount) )
+
+	def test_determinism( self ):
+		generator = GraphGenerator( 'rmat', 300, 1000, seed=3 )
+		self.assertEqual( list( generator.edges() ), list( GraphGenerator( 'rmat', 300, 1000, seed=3 ).edges() ) )
+		self.assertNotEqual( list( generator.edges() ), list( GraphGenerator( 'rmat', 300, 1000, seed=4 ).edges() ) )
+
+		stream = io.StringIO()
+		GraphMLWriter( stream, GraphGenerator.VERTEX_KEYS, GraphGenerator.EDGE_KEYS ).write( generator.vertices(), generator.edges() )
+		graph, loadedGraph = generator.load(), Graph()
+		GraphMLLoader( loadedGraph ).load( io.BytesIO( stream.getvalue().encode( 'utf-8' ) ) )
+		self.assertEqual( loadedGraph.stats(), graph.stats() )
+		self.assertEqual( [ (graphEdge.fromVertexId, graphEdge.toVertexId, graphEdge.props) for graphEdge in loadedGraph.edges.values() ],
+		                  [ (graphEdge.fromVertexId, graphEdge.toVertexId, graphEdge.props) for graphEdge in graph.edges.values() ] )
+
+if __name__ == '__main__':
+	unittest.main()
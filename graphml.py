@@ -0,0 +1,194 @@
+import unittest
+import io
+import time
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+from graph import Graph
+
+class GraphMLLoader:
+	# Streams a GraphML file into a Graph. Elements are parsed with iterparse, and vertices and edges are handed to the
+	# graph's bulk-load API in batches, after which the elements read are removed from the document, so peak memory
+	# stays close to the size of the resulting graph rather than that of the XML document.
+	BATCH_SIZE = 10000
+	VERTEX_LABEL_KEY, EDGE_LABEL_KEY = 'labelV', 'labelE'
+	TYPES = {
+	'boolean' : lambda value : value.lower() == 'true',
+	'int' : int,
+	'long' : int,
+	'float' : float,
+	'double' : float,
+	'string' : str,
+	}
+
+	def __init__( self, graph, batchSize=BATCH_SIZE ):
+		self.graph = graph
+		self.batchSize = batchSize
+
+		self.vertexCount, self.edgeCount = 0, 0
+		self.elapsedSeconds = 0.0
+
+	def load( self, source ):
+		# source is a path or a binary file object. Returns a report of what was loaded and how quickly.
+		startTime = time.perf_counter()
+
+		keys = dict()
+		vertexBatch, edgeBatch = list(), list()
+		localNames = dict()
+		# The <graph> element, whose node and edge children are removed once they have been flushed.
+		graphElement = None
+
+		for event, element in ET.iterparse( source, events=('start', 'end') ):
+			tag = localNames.get( element.tag )
+			if tag is None:
+				tag = localNames[ element.tag ] = element.tag.rsplit( '}', 1 )[ -1 ]
+			if event == 'start':
+				if tag == 'graph':
+					graphElement = element
+				continue
+
+			if tag == 'node':
+				props = GraphMLLoader._readProperties( element, keys )
+				label = props.pop( GraphMLLoader.VERTEX_LABEL_KEY, None )
+				vertexBatch.append( (int( element.attrib[ 'id' ] ), [ label ] if label is not None else None, props) )
+				if len( vertexBatch ) >= self.batchSize:
+					self._flushVertices( vertexBatch )
+					GraphMLLoader._removeChildren( graphElement )
+			elif tag == 'edge':
+				props = GraphMLLoader._readProperties( element, keys )
+				label = props.pop( GraphMLLoader.EDGE_LABEL_KEY, None )
+				edgeBatch.append( (int( element.attrib[ 'id' ] ), int( element.attrib[ 'source' ] ), int( element.attrib[ 'target' ] ), label, props) )
+				if len( edgeBatch ) >= self.batchSize:
+					# Edges may only refer to vertices which have already been added.
+					self._flushVertices( vertexBatch )
+					self._flushEdges( edgeBatch )
+					GraphMLLoader._removeChildren( graphElement )
+			elif tag == 'key':
+				keys[ element.attrib[ 'id' ] ] = ( element.attrib.get( 'attr.name', element.attrib[ 'id' ] ),
+					                               GraphMLLoader.TYPES.get( element.attrib.get( 'attr.type' ), str ) )
+
+		self._flushVertices( vertexBatch )
+		self._flushEdges( edgeBatch )
+
+		self.elapsedSeconds = time.perf_counter() - startTime
+		return self.report()
+
+	def report( self ):
+		objectCount = self.vertexCount + self.edgeCount
+		return { 'vertices' : self.vertexCount, 'edges' : self.edgeCount, 'seconds' : self.elapsedSeconds,
+		         'objectsPerSecond' : objectCount / self.elapsedSeconds if self.elapsedSeconds > 0 else 0.0 }
+
+	def _flushVertices( self, vertexBatch ):
+		self.graph.bulkAddVertices( vertexBatch )
+		self.vertexCount += len( vertexBatch )
+		vertexBatch.clear()
+
+	def _flushEdges( self, edgeBatch ):
+		self.graph.bulkAddEdges( edgeBatch )
+		self.edgeCount += len( edgeBatch )
+		edgeBatch.clear()
+
+	@staticmethod
+	def _removeChildren( graphElement ):
+		# The children are all complete, as flushes happen at the end of an element.
+		if graphElement is not None:
+			del graphElement[ : ]
+
+	@staticmethod
+	def _readProperties( element, keys ):
+		props = dict()
+		for dataElement in element:
+			key = dataElement.attrib[ 'key' ]
+			propertyName, propertyType = keys.get( key, (key, str) )
+			props[ propertyName ] = propertyType( dataElement.text or str() )
+		return props
+
+class GraphMLWriter:
+	# Streams vertices and edges, given as for Graph.bulkAddVertices() and bulkAddEdges(), to a text stream as GraphML
+	# in the layout GraphMLLoader reads, one element at a time. Each object has a single label. The property keys are
+	# declared up front, as propertyName -> Python type.
+	TYPES = { bool : 'boolean', int : 'long', float : 'double', str : 'string' }
+
+	def __init__( self, stream, vertexKeys, edgeKeys ):
+		self.stream = stream
+		self.vertexKeyIds = { propertyName : propertyName for propertyName in vertexKeys }
+		self.edgeKeyIds = { propertyName : 'edge.' + propertyName if propertyName in vertexKeys else propertyName for propertyName in edgeKeys }
+		self.vertexKeys, self.edgeKeys = vertexKeys, edgeKeys
+
+	def write( self, vertexBatch, edgeBatch ):
+		# Returns ( vertices written, edges written ).
+		stream = self.stream
+		stream.write( '<?xml version="1.0" encoding="UTF-8"?>\n<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n' )
+		for keyId, keyFor, propertyName, propertyType in ( [ (GraphMLLoader.VERTEX_LABEL_KEY, 'node', GraphMLLoader.VERTEX_LABEL_KEY, str),
+			                                                 (GraphMLLoader.EDGE_LABEL_KEY, 'edge', GraphMLLoader.EDGE_LABEL_KEY, str) ] +
+			                                               [ (self.vertexKeyIds[ name ], 'node', name, keyType) for name, keyType in self.vertexKeys.items() ] +
+			                                               [ (self.edgeKeyIds[ name ], 'edge', name, keyType) for name, keyType in self.edgeKeys.items() ] ):
+			stream.write( '  <key id={} for="{}" attr.name={} attr.type="{}"/>\n'.format( quoteattr( keyId ), keyFor, quoteattr( propertyName ),
+				                                                                          GraphMLWriter.TYPES[ propertyType ] ) )
+		stream.write( '  <graph id="G" edgedefault="directed">\n' )
+		vertexCount, edgeCount = 0, 0
+		for id_, labels, props in vertexBatch:
+			label, = labels
+			stream.write( '    <node id="{}">{}</node>\n'.format( id_, GraphMLWriter._data( GraphMLLoader.VERTEX_LABEL_KEY, label, props, self.vertexKeyIds ) ) )
+			vertexCount += 1
+		for id_, fromVertexId, toVertexId, edgeLabel, props in edgeBatch:
+			stream.write( '    <edge id="{}" source="{}" target="{}">{}</edge>\n'.format( id_, fromVertexId, toVertexId,
+				                                                                         GraphMLWriter._data( GraphMLLoader.EDGE_LABEL_KEY, edgeLabel, props, self.edgeKeyIds ) ) )
+			edgeCount += 1
+		stream.write( '  </graph>\n</graphml>\n' )
+		return vertexCount, edgeCount
+
+	@staticmethod
+	def _data( labelKey, label, props, keyIds ):
+		data = [ '<data key="{}">{}</data>'.format( labelKey, escape( label ) ) ]
+		for propertyName, propertyValue in props.items():
+			if type( propertyValue ) is bool:
+				propertyValue = 'true' if propertyValue else 'false'
+			data.append( '<data key={}>{}</data>'.format( quoteattr( keyIds[ propertyName ] ), escape( str( propertyValue ) ) ) )
+		return ''.join( data )
+
+class GraphMLLoaderTest( unittest.TestCase ):
+	GRAPHML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<graphml xmlns="http://graphml.graphdrawing.org/xmlns">
+  <key id="labelV" for="node" attr.name="labelV" attr.type="string"/>
+  <key id="code" for="node" attr.name="code" attr.type="string"/>
+  <key id="runways" for="node" attr.name="runways" attr.type="int"/>
+  <key id="labelE" for="edge" attr.name="labelE" attr.type="string"/>
+  <key id="dist" for="edge" attr.name="dist" attr.type="int"/>
+  <graph id="routes" edgedefault="directed">
+    <node id="1"><data key="labelV">airport</data><data key="code">AUS</data><data key="runways">2</data></node>
+    <node id="2"><data key="labelV">airport</data><data key="code">DFW</data><data key="runways">7</data></node>
+    <node id="3"><data key="labelV">airport</data><data key="code">IAH</data><data key="runways">5</data></node>
+    <edge id="4" source="1" target="2"><data key="labelE">route</data><data key="dist">190</data></edge>
+    <edge id="5" source="2" target="3"><data key="labelE">route</data><data key="dist">224</data></edge>
+  </graph>
+</graphml>'''
+
+	def test_load( self ):
+		graph = Graph()
+		graph.createPropertyIndex( 'code' )
+		report = GraphMLLoader( graph, batchSize=2 ).load( io.BytesIO( GraphMLLoaderTest.GRAPHML ) )
+
+		self.assertEqual( (report[ 'vertices' ], report[ 'edges' ]), (3, 2) )
+		self.assertEqual( graph.vertices[ 2 ].labels, { 'airport' } )
+		self.assertEqual( graph.vertices[ 2 ].props, { 'code' : 'DFW', 'runways' : 7 } )
+		self.assertEqual( graph.lookupProperty( 'code', 'IAH' ), { 3 } )
+		self.assertEqual( (graph.edges[ 5 ].label, graph.edges[ 5 ].props), ('route', { 'dist' : 224 }) )
+		self.assertEqual( list( graph.outAdjacency( 1, 'route' ) ), [ (4, 2) ] )
+		self.assertEqual( list( graph.inAdjacency( 3 ) ), [ (5, 2) ] )
+
+	def test_write( self ):
+		vertexBatch = [ (1, [ 'airport' ], { 'code' : 'A&B', 'runways' : 2, 'open' : True }), (2, [ 'airport' ], { 'code' : '<DFW>', 'open' : False }) ]
+		edgeBatch = [ (3, 1, 2, 'route', { 'dist' : 190.5, 'code' : 'R1' }) ]
+		stream = io.StringIO()
+		writer = GraphMLWriter( stream, { 'code' : str, 'runways' : int, 'open' : bool }, { 'dist' : float, 'code' : str } )
+		self.assertEqual( writer.write( iter( vertexBatch ), iter( edgeBatch ) ), (2, 1) )
+
+		graph = Graph()
+		GraphMLLoader( graph ).load( io.BytesIO( stream.getvalue().encode( 'utf-8' ) ) )
+		self.assertEqual( [ (graph.vertices[ id_ ].labels, graph.vertices[ id_ ].props) for id_, _, _ in vertexBatch ],
+		                  [ ({ 'airport' }, props) for _, _, props in vertexBatch ] )
+		self.assertEqual( (graph.edges[ 3 ].label, graph.edges[ 3 ].props), ('route', { 'dist' : 190.5, 'code' : 'R1' }) )
+
+if __name__ == '__main__':
+	unittest.main()
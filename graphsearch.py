@@ -0,0 +1,173 @@
+import unittest
+import heapq
+import itertools
+
+from graph import Graph
+from graphtypes import GraphVertex, GraphEdge
+
+class GraphSearch:
+	# Path searches over any graph exposing outAdjacency/inAdjacency and getGraphObjectReference, which covers both
+	# Graph and CompactGraph. Paths are returned as lists of vertex ids, from the source to the target.
+	DEFAULT_WEIGHT = 1
+
+	@staticmethod
+	def shortestPath( graph, sourceVertexId, targetVertexId, edgeLabel=None, maxHops=None ):
+		# Bidirectional breadth first search: the forward search follows outgoing edges from the source, the backward
+		# search incoming edges from the target, and each round expands whichever frontier is smaller by one level.
+		if sourceVertexId == targetVertexId:
+			return [ sourceVertexId ]
+		forwardParents, backwardParents = { sourceVertexId : None }, { targetVertexId : None }
+		forwardDepths, backwardDepths = { sourceVertexId : 0 }, { targetVertexId : 0 }
+		forwardFrontier, backwardFrontier = [ sourceVertexId ], [ targetVertexId ]
+		forwardDepth, backwardDepth = 0, 0
+
+		while len( forwardFrontier ) > 0 and len( backwardFrontier ) > 0:
+			if maxHops is not None and forwardDepth + backwardDepth >= maxHops:
+				return None
+			if len( forwardFrontier ) <= len( backwardFrontier ):
+				forwardDepth += 1
+				forwardFrontier, meetings = GraphSearch._expandLevel( graph.outAdjacency, forwardFrontier, edgeLabel, forwardDepth,
+					                                                  forwardParents, forwardDepths, backwardDepths )
+			else:
+				backwardDepth += 1
+				backwardFrontier, meetings = GraphSearch._expandLevel( graph.inAdjacency, backwardFrontier, edgeLabel, backwardDepth,
+					                                                   backwardParents, backwardDepths, forwardDepths )
+			if len( meetings ) > 0:
+				# Vertices met in the same level may lie at different depths of the other search.
+				meetingVertexId = min( meetings, key=lambda vertexId : forwardDepths[ vertexId ] + backwardDepths[ vertexId ] )
+				return GraphSearch._joinPaths( forwardParents, backwardParents, meetingVertexId )
+		return None
+
+	@staticmethod
+	def _expandLevel( adjacency, frontier, edgeLabel, depth, parents, depths, otherDepths ):
+		nextFrontier, meetings = list(), list()
+		for vertexId in frontier:
+			for _, neighbourVertexId in adjacency( vertexId, edgeLabel ):
+				if neighbourVertexId in parents:
+					continue
+				parents[ neighbourVertexId ] = vertexId
+				depths[ neighbourVertexId ] = depth
+				nextFrontier.append( neighbourVertexId )
+				if neighbourVertexId in otherDepths:
+					meetings.append( neighbourVertexId )
+		return nextFrontier, meetings
+
+	@staticmethod
+	def _joinPaths( forwardParents, backwardParents, meetingVertexId ):
+		path = GraphSearch._pathTo( forwardParents, meetingVertexId )
+		vertexId = backwardParents[ meetingVertexId ]
+		while vertexId is not None:
+			path.append( vertexId )
+			vertexId = backwardParents[ vertexId ]
+		return path
+
+	@staticmethod
+	def _pathTo( parents, vertexId ):
+		path = list()
+		while vertexId is not None:
+			path.append( vertexId )
+			vertexId = parents[ vertexId ]
+		path.reverse()
+		return path
+
+	@staticmethod
+	def weightedShortestPath( graph, sourceVertexId, targetVertexId, weightProperty, edgeLabel=None, maxHops=None ):
+		# Dijkstra's algorithm over outgoing edges, weighted by the edge property weightProperty; edges without it weigh
+		# DEFAULT_WEIGHT. With maxHops, the search runs over (vertex, hops) states, so that a heavier path with fewer
+		# hops is still found when the lightest path is too long. Returns (path, total weight), or (None, None).
+		counter = itertools.count()
+		queue = [ (0, next( counter ), sourceVertexId, 0) ]
+		parents = { (sourceVertexId, 0) : None }
+		settled = set()
+		while len( queue ) > 0:
+			distance, _, vertexId, hops = heapq.heappop( queue )
+			state = (vertexId, hops if maxHops is not None else 0)
+			if state in settled:
+				continue
+			settled.add( state )
+			if vertexId == targetVertexId:
+				return GraphSearch._statePath( parents, state ), distance
+			if maxHops is not None and hops >= maxHops:
+				continue
+			for edgeId, neighbourVertexId in graph.outAdjacency( vertexId, edgeLabel ):
+				neighbourState = (neighbourVertexId, hops + 1 if maxHops is not None else 0)
+				if neighbourState in settled:
+					continue
+				weight = graph.getGraphObjectReference( edgeId ).getProperty( weightProperty, GraphSearch.DEFAULT_WEIGHT )
+				if weight < 0:
+					raise ValueError( 'edge {} has negative weight {}'.format( edgeId, weight ) )
+				if neighbourState not in parents or parents[ neighbourState ][ 1 ] > distance + weight:
+					parents[ neighbourState ] = (state, distance + weight)
+					heapq.heappush( queue, (distance + weight, next( counter ), neighbourVertexId, hops + 1) )
+		return None, None
+
+	@staticmethod
+	def _statePath( parents, state ):
+		path = list()
+		while state is not None:
+			path.append( state[ 0 ] )
+			parent = parents[ state ]
+			state = parent[ 0 ] if parent is not None else None
+		path.reverse()
+		return path
+
+	@staticmethod
+	def khop( graph, sourceVertexId, hops, edgeLabel=None ):
+		# Breadth first search along outgoing edges, up to hops levels deep. Returns the parent of every vertex reached,
+		# the source included with a parent of None, so that the shortest path to each of them can be rebuilt.
+		parents = { sourceVertexId : None }
+		frontier = [ sourceVertexId ]
+		for _ in range( hops ):
+			nextFrontier = list()
+			for vertexId in frontier:
+				for _, neighbourVertexId in graph.outAdjacency( vertexId, edgeLabel ):
+					if neighbourVertexId not in parents:
+						parents[ neighbourVertexId ] = vertexId
+						nextFrontier.append( neighbourVertexId )
+			if len( nextFrontier ) == 0:
+				break
+			frontier = nextFrontier
+		return parents
+
+	@staticmethod
+	def pathTo( parents, vertexId ):
+		return GraphSearch._pathTo( parents, vertexId )
+
+class GraphSearchTest( unittest.TestCase ):
+	def setUp( self ):
+		# A chain 0 -> 1 -> ... -> 5 of short hops, plus a long direct hop 0 -> 5 and a dead end 2 -> 6.
+		self.graph = Graph()
+		self.vertexIds = [ self.graph.addVertex( GraphVertex( labels=[ 'airport' ] ) ) for _ in range( 7 ) ]
+		v = self.vertexIds
+		for fromIndex, toIndex, dist in [ (0, 1, 10), (1, 2, 10), (2, 3, 10), (3, 4, 10), (4, 5, 10), (0, 5, 100), (2, 6, 1) ]:
+			self.graph.addEdge( GraphEdge( v[ fromIndex ], v[ toIndex ], 'route', props={ 'dist' : dist } ) )
+		self.graph.addEdge( GraphEdge( v[ 0 ], v[ 3 ], 'ferry', props={ 'dist' : 1 } ) )
+
+	def test_shortestPath( self ):
+		v = self.vertexIds
+		for graph in (self.graph, self.graph.freeze()):
+			self.assertEqual( GraphSearch.shortestPath( graph, v[ 0 ], v[ 5 ] ), [ v[ 0 ], v[ 5 ] ] )
+			self.assertEqual( GraphSearch.shortestPath( graph, v[ 1 ], v[ 5 ] ), [ v[ 1 ], v[ 2 ], v[ 3 ], v[ 4 ], v[ 5 ] ] )
+			self.assertEqual( GraphSearch.shortestPath( graph, v[ 0 ], v[ 4 ] ), [ v[ 0 ], v[ 3 ], v[ 4 ] ] )
+			self.assertEqual( GraphSearch.shortestPath( graph, v[ 0 ], v[ 4 ], edgeLabel='route' ), [ v[ 0 ], v[ 1 ], v[ 2 ], v[ 3 ], v[ 4 ] ] )
+			self.assertIsNone( GraphSearch.shortestPath( graph, v[ 0 ], v[ 4 ], edgeLabel='route', maxHops=3 ) )
+			self.assertIsNone( GraphSearch.shortestPath( graph, v[ 6 ], v[ 0 ] ) )
+
+	def test_weightedShortestPath( self ):
+		v = self.vertexIds
+		for graph in (self.graph, self.graph.freeze()):
+			self.assertEqual( GraphSearch.weightedShortestPath( graph, v[ 0 ], v[ 5 ], 'dist', edgeLabel='route' ),
+				              ([ v[ 0 ], v[ 1 ], v[ 2 ], v[ 3 ], v[ 4 ], v[ 5 ] ], 50) )
+			self.assertEqual( GraphSearch.weightedShortestPath( graph, v[ 0 ], v[ 5 ], 'dist' ), ([ v[ 0 ], v[ 3 ], v[ 4 ], v[ 5 ] ], 21) )
+			self.assertEqual( GraphSearch.weightedShortestPath( graph, v[ 0 ], v[ 5 ], 'dist', edgeLabel='route', maxHops=3 ), ([ v[ 0 ], v[ 5 ] ], 100) )
+			self.assertEqual( GraphSearch.weightedShortestPath( graph, v[ 6 ], v[ 0 ], 'dist' ), (None, None) )
+
+	def test_khop( self ):
+		v = self.vertexIds
+		parents = GraphSearch.khop( self.graph, v[ 0 ], 2, edgeLabel='route' )
+		self.assertEqual( set( parents ), { v[ 0 ], v[ 1 ], v[ 2 ], v[ 5 ] } )
+		self.assertEqual( GraphSearch.pathTo( parents, v[ 2 ] ), [ v[ 0 ], v[ 1 ], v[ 2 ] ] )
+		self.assertEqual( set( GraphSearch.khop( self.graph, v[ 0 ], 3 ) ), { v[ 0 ], v[ 1 ], v[ 2 ], v[ 3 ], v[ 4 ], v[ 5 ], v[ 6 ] } )
+
+if __name__ == '__main__':
+	unittest.main()
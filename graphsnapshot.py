@@ -0,0 +1,288 @@
+import unittest
+import array
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from graph import Graph
+from graphtypes import GraphVertex, GraphEdge
+from compactgraph import CompactGraph, SortedIdIndex, UnsupportedIdError
+
+class SnapshotFormatError( Exception ):
+	pass
+
+class SnapshotStrings:
+	# A table of strings decoded on access from offset pairs into a UTF-8 blob. A negative length denotes None.
+	__slots__ = ('offsets', 'data')
+
+	def __init__( self, offsets, data ):
+		self.offsets, self.data = offsets, data
+
+	def __getitem__( self, code ):
+		start, length = self.offsets[ 2 * code ], self.offsets[ 2 * code + 1 ]
+		if length < 0:
+			return None
+		return bytes( self.data[ start : start + length ] ).decode()
+
+	def __len__( self ):
+		return len( self.offsets ) // 2
+
+class SnapshotLabels:
+	# Per-object label sets, decoded on access from the snapshot's label code arrays.
+	__slots__ = ('offsets', 'codes', 'symbols')
+
+	def __init__( self, offsets, codes, symbols ):
+		self.offsets, self.codes, self.symbols = offsets, codes, symbols
+
+	def __getitem__( self, index ):
+		return frozenset( self.symbols[ code ] for code in self.codes[ self.offsets[ index ] : self.offsets[ index + 1 ] ] )
+
+	def __len__( self ):
+		return len( self.offsets ) - 1
+
+class SnapshotProperties:
+	# Per-object property dicts, decoded on access from fixed-width (key, type, value) property records.
+	__slots__ = ('offsets', 'keys', 'types', 'integerValues', 'floatValues', 'symbols', 'strings')
+
+	def __init__( self, offsets, keys, types, integerValues, floatValues, symbols, strings ):
+		self.offsets, self.keys, self.types = offsets, keys, types
+		self.integerValues, self.floatValues = integerValues, floatValues
+		self.symbols, self.strings = symbols, strings
+
+	def __getitem__( self, index ):
+		props = dict()
+		for record in range( self.offsets[ index ], self.offsets[ index + 1 ] ):
+			valueType = self.types[ record ]
+			if valueType == GraphSnapshot.INTEGER:
+				value = self.integerValues[ record ]
+			elif valueType == GraphSnapshot.FLOAT:
+				value = self.floatValues[ record ]
+			elif valueType == GraphSnapshot.STRING:
+				value = self.strings[ self.integerValues[ record ] ]
+			else:
+				value = self.integerValues[ record ] != 0
+			props[ self.symbols[ self.keys[ record ] ] ] = value
+		return props
+
+	def __len__( self ):
+		return len( self.offsets ) - 1
+
+class GraphSnapshot:
+	# Binary snapshot of a CompactGraph. The file starts with a header holding the (offset, length) of every section;
+	# each section is an 8 byte aligned array of native int64 values, except the two UTF-8 blobs. Symbols (labels and
+	# property keys) form a small table which is decoded on load; everything else - string property values, vertex
+	# and edge records, property records and adjacency - is read in place from a read-only memory map, so loading is
+	# close to instant and processes mapping the same file share its physical pages.
+	MAGIC, VERSION, BYTE_ORDER_MARK = b'OGRAPHSS', 1, 0x0102030405060708
+	INTEGER, FLOAT, STRING, BOOLEAN = 0, 1, 2, 3
+	BLOB_SECTIONS = { 'symbolData', 'stringData' }
+	SECTIONS = ( 'symbolOffsets', 'symbolData', 'stringOffsets', 'stringData', 'indexedProperties',
+	             'vertexIds', 'vertexLabelOffsets', 'vertexLabelCodes', 'vertexPropertyOffsets',
+	             'edgeIds', 'edgeFrom', 'edgeTo', 'edgeLabels', 'edgePropertyOffsets',
+	             'propertyKeys', 'propertyTypes', 'propertyValues',
+	             'outOffsets', 'outTargets', 'outEdges', 'outLabels',
+	             'inOffsets', 'inTargets', 'inEdges', 'inLabels' )
+	HEADER = struct.Struct( '<8sqq' + 'qq' * len( SECTIONS ) )
+
+	@staticmethod
+	def save( graph, path ):
+		# graph is a Graph or a CompactGraph.
+		compactGraph = graph.freeze() if isinstance( graph, Graph ) else graph
+
+		# Edge label codes in the adjacency arrays index labelTable, so it forms the start of the symbol table.
+		symbols = list( compactGraph.labelTable )
+		symbolCodes = { symbol : code for code, symbol in enumerate( symbols ) }
+		strings, stringCodes = list(), dict()
+
+		def symbolCode( symbol ):
+			if symbol not in symbolCodes:
+				symbolCodes[ symbol ] = len( symbols )
+				symbols.append( symbol )
+			return symbolCodes[ symbol ]
+
+		def stringCode( string ):
+			if string not in stringCodes:
+				stringCodes[ string ] = len( strings )
+				strings.append( string )
+			return stringCodes[ string ]
+
+		sections = { name : array.array( 'q' ) for name in GraphSnapshot.SECTIONS if name not in GraphSnapshot.BLOB_SECTIONS }
+		propertyKeys, propertyTypes, propertyValues = sections[ 'propertyKeys' ], sections[ 'propertyTypes' ], sections[ 'propertyValues' ]
+
+		def appendProperties( props, offsets ):
+			for propertyName, propertyValue in props.items():
+				if isinstance( propertyValue, bool ):
+					valueType, value = GraphSnapshot.BOOLEAN, int( propertyValue )
+				elif isinstance( propertyValue, int ):
+					valueType, value = GraphSnapshot.INTEGER, propertyValue
+				elif isinstance( propertyValue, float ):
+					valueType, value = GraphSnapshot.FLOAT, struct.unpack( '=q', struct.pack( '=d', propertyValue ) )[ 0 ]
+				elif isinstance( propertyValue, str ):
+					valueType, value = GraphSnapshot.STRING, stringCode( propertyValue )
+				else:
+					raise TypeError( 'property {} has a value of unsupported type {}'.format( propertyName, type( propertyValue ) ) )
+				propertyKeys.append( symbolCode( propertyName ) )
+				propertyTypes.append( valueType )
+				propertyValues.append( value )
+			offsets.append( len( propertyKeys ) )
+
+		sections[ 'vertexLabelOffsets' ].append( 0 )
+		sections[ 'vertexPropertyOffsets' ].append( 0 )
+		for vertexIndex in range( len( compactGraph.vertexIds ) ):
+			sections[ 'vertexLabelCodes' ].extend( symbolCode( label ) for label in sorted( compactGraph.vertexLabels[ vertexIndex ] ) )
+			sections[ 'vertexLabelOffsets' ].append( len( sections[ 'vertexLabelCodes' ] ) )
+			appendProperties( compactGraph.vertexProps[ vertexIndex ], sections[ 'vertexPropertyOffsets' ] )
+
+		sections[ 'edgePropertyOffsets' ].append( len( propertyKeys ) )
+		for edgeIndex in range( len( compactGraph.edgeIds ) ):
+			appendProperties( compactGraph.edgeProps[ edgeIndex ], sections[ 'edgePropertyOffsets' ] )
+
+		for name in ('vertexIds', 'edgeIds', 'edgeFrom', 'edgeTo', 'edgeLabels', 'outOffsets', 'outTargets', 'outEdges', 'outLabels',
+		             'inOffsets', 'inTargets', 'inEdges', 'inLabels'):
+			sections[ name ].extend( iter( getattr( compactGraph, name ) ) )
+		sections[ 'indexedProperties' ].extend( symbolCode( propertyName ) for propertyName in compactGraph.propertyIndexes )
+
+		sections[ 'symbolOffsets' ], sections[ 'symbolData' ] = GraphSnapshot._encodeStrings( symbols )
+		sections[ 'stringOffsets' ], sections[ 'stringData' ] = GraphSnapshot._encodeStrings( strings )
+
+		GraphSnapshot._write( path, sections )
+
+	@staticmethod
+	def load( path ):
+		with open( path, 'rb' ) as snapshotFile:
+			# An empty file cannot be mapped, and a shorter one has no room for the header.
+			if os.fstat( snapshotFile.fileno() ).st_size < GraphSnapshot.HEADER.size:
+				raise SnapshotFormatError( '{} is not a graph snapshot'.format( path ) )
+			mapping = mmap.mmap( snapshotFile.fileno(), 0, access=mmap.ACCESS_READ )
+		magic, version, byteOrderMark, * sectionTable = GraphSnapshot.HEADER.unpack_from( mapping, 0 )
+		if magic != GraphSnapshot.MAGIC:
+			raise SnapshotFormatError( '{} is not a graph snapshot'.format( path ) )
+		if version != GraphSnapshot.VERSION:
+			raise SnapshotFormatError( '{} has snapshot version {}, expected {}'.format( path, version, GraphSnapshot.VERSION ) )
+		if byteOrderMark != GraphSnapshot.BYTE_ORDER_MARK:
+			raise SnapshotFormatError( '{} was written on a machine with a different byte order'.format( path ) )
+
+		view = memoryview( mapping )
+		sections = dict()
+		for index, name in enumerate( GraphSnapshot.SECTIONS ):
+			offset, length = sectionTable[ 2 * index ], sectionTable[ 2 * index + 1 ]
+			if offset < GraphSnapshot.HEADER.size or length < 0 or offset + length > len( mapping ):
+				raise SnapshotFormatError( '{} is truncated: section {} ends past the end of the file'.format( path, name ) )
+			section = view[ offset : offset + length ]
+			sections[ name ] = section if name in GraphSnapshot.BLOB_SECTIONS else section.cast( 'q' )
+
+		symbolTable = SnapshotStrings( sections[ 'symbolOffsets' ], sections[ 'symbolData' ] )
+		symbols = [ symbolTable[ code ] for code in range( len( symbolTable ) ) ]
+		strings = SnapshotStrings( sections[ 'stringOffsets' ], sections[ 'stringData' ] )
+		# Property values are 8 byte words; float values are read through a second view of the same bytes.
+		floatValues = sections[ 'propertyValues' ].cast( 'B' ).cast( 'd' )
+
+		compactGraph = CompactGraph()
+		compactGraph.labelTable = symbols
+		compactGraph.labelCodes = { symbol : code for code, symbol in enumerate( symbols ) }
+		for name in ('vertexIds', 'edgeIds', 'edgeFrom', 'edgeTo', 'edgeLabels', 'outOffsets', 'outTargets', 'outEdges', 'outLabels',
+		             'inOffsets', 'inTargets', 'inEdges', 'inLabels'):
+			setattr( compactGraph, name, sections[ name ] )
+		compactGraph.vertexIndex = SortedIdIndex( compactGraph.vertexIds )
+		compactGraph.edgeIndex = SortedIdIndex( compactGraph.edgeIds )
+		compactGraph.vertexLabels = SnapshotLabels( sections[ 'vertexLabelOffsets' ], sections[ 'vertexLabelCodes' ], symbols )
+
+		propertyRecords = ( sections[ 'propertyKeys' ], sections[ 'propertyTypes' ], sections[ 'propertyValues' ], floatValues, symbols, strings )
+		compactGraph.vertexProps = SnapshotProperties( sections[ 'vertexPropertyOffsets' ], * propertyRecords )
+		compactGraph.edgeProps = SnapshotProperties( sections[ 'edgePropertyOffsets' ], * propertyRecords )
+		compactGraph.propertyIndexes = { symbols[ code ] : None for code in sections[ 'indexedProperties' ] }
+
+		compactGraph.snapshotPath = path
+		return compactGraph
+
+	@staticmethod
+	def isFresh( snapshotPath, sourcePath ):
+		# A snapshot can be used in place of its source when it exists and was written after the source last changed.
+		if not os.path.exists( snapshotPath ):
+			return False
+		return not os.path.exists( sourcePath ) or os.path.getmtime( snapshotPath ) >= os.path.getmtime( sourcePath )
+
+	@staticmethod
+	def _encodeStrings( strings ):
+		offsets, data = array.array( 'q' ), bytearray()
+		for string in strings:
+			if string is None:
+				offsets.extend( (len( data ), -1) )
+				continue
+			encoded = string.encode()
+			offsets.extend( (len( data ), len( encoded )) )
+			data.extend( encoded )
+		return offsets, bytes( data )
+
+	@staticmethod
+	def _write( path, sections ):
+		payloads = [ sections[ name ] if name in GraphSnapshot.BLOB_SECTIONS else sections[ name ].tobytes() for name in GraphSnapshot.SECTIONS ]
+
+		sectionTable, offset = list(), GraphSnapshot.HEADER.size
+		for payload in payloads:
+			offset += -offset % 8
+			sectionTable.extend( (offset, len( payload )) )
+			offset += len( payload )
+
+		# Write to a temporary file first, so that readers never map a partially written snapshot.
+		temporaryPath = path + '.tmp'
+		with open( temporaryPath, 'wb' ) as snapshotFile:
+			snapshotFile.write( GraphSnapshot.HEADER.pack( GraphSnapshot.MAGIC, GraphSnapshot.VERSION, GraphSnapshot.BYTE_ORDER_MARK, * sectionTable ) )
+			for payload, sectionOffset in zip( payloads, sectionTable[ 0 : : 2 ] ):
+				snapshotFile.write( bytes( sectionOffset - snapshotFile.tell() ) )
+				snapshotFile.write( payload )
+		os.replace( temporaryPath, path )
+
+class GraphSnapshotTest( unittest.TestCase ):
+	def test_roundTrip( self ):
+		graph = Graph()
+		graph.createPropertyIndex( 'code' )
+		austin = graph.addVertex( GraphVertex( labels=[ 'airport' ], props={ 'code' : 'AUS', 'runways' : 2, 'lat' : 30.19, 'hub' : False } ) )
+		dallas = graph.addVertex( GraphVertex( labels=[ 'airport', 'hub' ], props={ 'code' : 'DFW', 'runways' : 7, 'lat' : 32.89, 'hub' : True } ) )
+		texas = graph.addVertex( GraphVertex( labels=[ 'region' ], props={ 'code' : 'US-TX' } ) )
+		route = graph.addEdge( GraphEdge( austin, dallas, 'route', props={ 'dist' : 190 } ) )
+		graph.addEdge( GraphEdge( texas, austin, 'contains' ) )
+		graph.addEdge( GraphEdge( texas, dallas ) )
+
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join( directory, 'graph.snapshot' )
+			GraphSnapshot.save( graph, path )
+			snapshot = GraphSnapshot.load( path )
+
+			self.assertIsInstance( snapshot.outTargets, memoryview )
+			for vertexId in graph.V():
+				self.assertEqual( snapshot.getGraphObjectReference( vertexId ).labels, graph.vertices[ vertexId ].labels )
+				self.assertEqual( snapshot.getGraphObjectReference( vertexId ).props, graph.vertices[ vertexId ].props )
+				for edgeLabel in (None, 'route', 'contains'):
+					self.assertEqual( sorted( snapshot.outAdjacency( vertexId, edgeLabel ) ), sorted( graph.outAdjacency( vertexId, edgeLabel ) ) )
+					self.assertEqual( sorted( snapshot.inAdjacency( vertexId, edgeLabel ) ), sorted( graph.inAdjacency( vertexId, edgeLabel ) ) )
+			self.assertEqual( snapshot.getGraphObjectReference( route ).props, { 'dist' : 190 } )
+			self.assertEqual( snapshot.lookupProperty( 'code', 'DFW' ), { dallas } )
+			self.assertEqual( snapshot.lookupLabel( 'hub' ), { dallas } )
+			self.assertEqual( set( snapshot.V() ), { austin, dallas, texas } )
+
+			vertexIds, bulks = snapshot.expandFrontier( [ texas ], [ 2 ], CompactGraph.OUT )
+			self.assertEqual( sorted( zip( vertexIds, bulks ) ), [ (austin, 2), (dallas, 2) ] )
+
+	def test_truncated( self ):
+		graph = Graph()
+		graph.addEdge( GraphEdge( graph.addVertex( GraphVertex( labels=[ 'airport' ] ) ), graph.addVertex( GraphVertex( labels=[ 'airport' ] ) ), 'route' ) )
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join( directory, 'graph.snapshot' )
+			GraphSnapshot.save( graph, path )
+			with open( path, 'rb' ) as snapshotFile:
+				data = snapshotFile.read()
+			for length in (0, GraphSnapshot.HEADER.size // 2, GraphSnapshot.HEADER.size, len( data ) - 8):
+				with open( path, 'wb' ) as snapshotFile:
+					snapshotFile.write( data[ : length ] )
+				with self.assertRaises( SnapshotFormatError ):
+					GraphSnapshot.load( path )
+
+			graph.addVertex( GraphVertex( labels=[ 'airport' ] ), id_='JFK' )
+			with self.assertRaises( UnsupportedIdError ):
+				GraphSnapshot.save( graph, path )
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,200 @@
+import unittest
+import collections
+import itertools
+import operator
+
+from graphtypes import GraphVertex, GraphEdge
+
+class GraphStatistics:
+	# Counts kept up to date as a graph changes, so that planning and capacity estimates read them instead of scanning:
+	# vertices per label, edges per label, how many vertices have each out and in degree, and how many vertices or
+	# edges hold each value of each property. Every update is O(1) in the size of the graph, per label and property
+	# of the object changed.
+	# Property values which cannot be counted by themselves, such as lists, are all counted as this one value.
+	UNHASHABLE = object()
+
+	def __init__( self ):
+		self.vertexCount = 0
+		self.edgeCount = 0
+		self.vertexLabelCounts = collections.Counter()
+		self.edgeLabelCounts = collections.Counter()
+		# degree -> number of vertices with that degree.
+		self.outDegrees = collections.Counter()
+		self.inDegrees = collections.Counter()
+		# propertyName -> { propertyValue -> number of objects with that value }.
+		self.vertexPropertyValues = dict()
+		self.edgePropertyValues = dict()
+
+	def addVertex( self, labels, props, outDegree=0, inDegree=0 ):
+		self.countVertex( labels, props, 1 )
+		GraphStatistics._adjust( self.outDegrees, outDegree, 1 )
+		GraphStatistics._adjust( self.inDegrees, inDegree, 1 )
+
+	def removeVertex( self, labels, props, outDegree=0, inDegree=0 ):
+		self.countVertex( labels, props, -1 )
+		GraphStatistics._adjust( self.outDegrees, outDegree, -1 )
+		GraphStatistics._adjust( self.inDegrees, inDegree, -1 )
+
+	def countVertex( self, labels, props, delta ):
+		self.vertexCount += delta
+		for label in labels:
+			GraphStatistics._adjust( self.vertexLabelCounts, label, delta )
+		GraphStatistics._countValues( self.vertexPropertyValues, props, delta )
+
+	def addVertexBatch( self, graphVertices ):
+		# Counts a list of vertices bulk loaded together, which have no edges yet. A batch is counted with a few passes
+		# over it rather than vertex by vertex.
+		self.vertexCount += len( graphVertices )
+		self.vertexLabelCounts.update( itertools.chain.from_iterable( map( operator.attrgetter( 'labels' ), graphVertices ) ) )
+		GraphStatistics._addValues( self.vertexPropertyValues, graphVertices )
+		self.outDegrees[ 0 ] += len( graphVertices )
+		self.inDegrees[ 0 ] += len( graphVertices )
+
+	def addEdgeBatch( self, graphEdges, outDegree, inDegree ):
+		# Counts a list of edges bulk loaded together, like addVertexBatch. outDegree and inDegree give the degree of
+		# a vertex id once the batch has been added.
+		self.edgeCount += len( graphEdges )
+		self.edgeLabelCounts.update( map( operator.attrgetter( 'label' ), graphEdges ) )
+		GraphStatistics._addValues( self.edgePropertyValues, graphEdges )
+		for degrees, degree, endpoint in ((self.outDegrees, outDegree, 'fromVertexId'), (self.inDegrees, inDegree, 'toVertexId')):
+			for vertexId, added in collections.Counter( map( operator.attrgetter( endpoint ), graphEdges ) ).items():
+				degreeAfter = degree( vertexId )
+				GraphStatistics._adjust( degrees, degreeAfter - added, -1 )
+				degrees[ degreeAfter ] += 1
+
+	def addEdge( self, edgeLabel, props, fromOutDegree, toInDegree ):
+		# The degrees are those of the edge's endpoints before it is added.
+		self.countEdge( edgeLabel, props, 1 )
+		GraphStatistics._moveDegree( self.outDegrees, fromOutDegree, 1 )
+		GraphStatistics._moveDegree( self.inDegrees, toInDegree, 1 )
+
+	def removeEdge( self, edgeLabel, props, fromOutDegree, toInDegree ):
+		# The degrees are those of the edge's endpoints before it is removed.
+		self.countEdge( edgeLabel, props, -1 )
+		GraphStatistics._moveDegree( self.outDegrees, fromOutDegree, -1 )
+		GraphStatistics._moveDegree( self.inDegrees, toInDegree, -1 )
+
+	def countEdge( self, edgeLabel, props, delta ):
+		self.edgeCount += delta
+		GraphStatistics._adjust( self.edgeLabelCounts, edgeLabel, delta )
+		GraphStatistics._countValues( self.edgePropertyValues, props, delta )
+
+	def addLabel( self, label ):
+		GraphStatistics._adjust( self.vertexLabelCounts, label, 1 )
+
+	def setProperty( self, isVertex, propertyName, oldProps, propertyValue ):
+		# oldProps are the object's properties before the change.
+		propertyValues = self.vertexPropertyValues if isVertex else self.edgePropertyValues
+		if propertyName in oldProps:
+			GraphStatistics._adjust( propertyValues[ propertyName ], GraphStatistics._valueKey( oldProps[ propertyName ] ), -1 )
+		GraphStatistics._adjust( propertyValues.setdefault( propertyName, collections.Counter() ), GraphStatistics._valueKey( propertyValue ), 1 )
+
+	def labelCount( self, label ):
+		return self.vertexLabelCounts[ label ]
+
+	def edgeLabelCount( self, edgeLabel ):
+		return self.edgeLabelCounts[ edgeLabel ]
+
+	def propertyValueCount( self, propertyName, propertyValue ):
+		# The number of vertices with propertyName set to propertyValue.
+		propertyValues = self.vertexPropertyValues.get( propertyName )
+		return propertyValues[ GraphStatistics._valueKey( propertyValue ) ] if propertyValues is not None else 0
+
+	def distinctValueCount( self, propertyName ):
+		return len( self.vertexPropertyValues.get( propertyName, tuple() ) )
+
+	def summary( self ):
+		# The statistics as plain values; its size depends on the numbers of labels, degrees and properties, not on
+		# the size of the graph.
+		return { 'vertices' : self.vertexCount, 'edges' : self.edgeCount,
+		         'vertexLabels' : dict( self.vertexLabelCounts ), 'edgeLabels' : dict( self.edgeLabelCounts ),
+		         'outDegrees' : dict( sorted( self.outDegrees.items() ) ), 'inDegrees' : dict( sorted( self.inDegrees.items() ) ),
+		         'vertexProperties' : GraphStatistics._propertySummary( self.vertexPropertyValues ),
+		         'edgeProperties' : GraphStatistics._propertySummary( self.edgePropertyValues ) }
+
+	@staticmethod
+	def _propertySummary( propertyValues ):
+		return { propertyName : { 'count' : sum( valueCounts.values() ), 'distinct' : len( valueCounts ) }
+		         for propertyName, valueCounts in propertyValues.items() if len( valueCounts ) > 0 }
+
+	@staticmethod
+	def _valueKey( propertyValue ):
+		try:
+			hash( propertyValue )
+		except TypeError:
+			return GraphStatistics.UNHASHABLE
+		return propertyValue
+
+	@staticmethod
+	def _countValues( propertyValues, props, delta ):
+		for propertyName, propertyValue in props.items():
+			GraphStatistics._adjust( propertyValues.setdefault( propertyName, collections.Counter() ), GraphStatistics._valueKey( propertyValue ), delta )
+
+	@staticmethod
+	def _addValues( propertyValues, graphObjects ):
+		def propertyPairs():
+			return itertools.chain.from_iterable( map( zip, map( operator.attrgetter( 'schema.keys' ), graphObjects ), map( operator.attrgetter( 'values' ), graphObjects ) ) )
+		try:
+			pairCounts = collections.Counter( propertyPairs() )
+		except TypeError:
+			# Only batches holding an unhashable value pay for mapping every value.
+			pairCounts = collections.Counter( (propertyName, GraphStatistics._valueKey( propertyValue )) for propertyName, propertyValue in propertyPairs() )
+		for (propertyName, propertyValue), count in pairCounts.items():
+			valueCounts = propertyValues.get( propertyName )
+			if valueCounts is None:
+				valueCounts = propertyValues[ propertyName ] = collections.Counter()
+			valueCounts[ propertyValue ] += count
+
+	@staticmethod
+	def _moveDegree( degrees, degree, delta ):
+		GraphStatistics._adjust( degrees, degree, -1 )
+		GraphStatistics._adjust( degrees, degree + delta, 1 )
+
+	@staticmethod
+	def _adjust( counter, key, delta ):
+		# Keys whose count drops to zero are removed, so that distinct counts and histograms only hold what is present.
+		count = counter[ key ] + delta
+		if count == 0:
+			del counter[ key ]
+		else:
+			counter[ key ] = count
+
+class GraphStatisticsTest( unittest.TestCase ):
+	def test_updates( self ):
+		statistics = GraphStatistics()
+		for labels, props in [ ([ 'person' ], { 'name' : 'marko' }), ([ 'person' ], { 'name' : 'vadas' }), ([ 'software' ], { 'name' : 'lop' }) ]:
+			statistics.addVertex( labels, props )
+		statistics.addEdge( 'knows', { 'weight' : 0.5 }, 0, 0 )
+		statistics.addEdge( 'created', { 'weight' : 0.4 }, 1, 0 )
+		statistics.setProperty( True, 'name', { 'name' : 'vadas' }, 'marko' )
+
+		summary = statistics.summary()
+		self.assertEqual( (summary[ 'vertices' ], summary[ 'edges' ]), (3, 2) )
+		self.assertEqual( summary[ 'vertexLabels' ], { 'person' : 2, 'software' : 1 } )
+		self.assertEqual( summary[ 'outDegrees' ], { 0 : 2, 2 : 1 } )
+		self.assertEqual( summary[ 'inDegrees' ], { 0 : 1, 1 : 2 } )
+		self.assertEqual( summary[ 'vertexProperties' ], { 'name' : { 'count' : 3, 'distinct' : 2 } } )
+		self.assertEqual( statistics.propertyValueCount( 'name', 'marko' ), 2 )
+
+		statistics.removeEdge( 'created', { 'weight' : 0.4 }, 2, 1 )
+		statistics.removeVertex( [ 'software' ], { 'name' : 'lop' } )
+		self.assertEqual( (statistics.edgeLabelCount( 'created' ), statistics.labelCount( 'software' ), statistics.distinctValueCount( 'name' )), (0, 0, 1) )
+		self.assertEqual( statistics.summary()[ 'outDegrees' ], { 0 : 1, 1 : 1 } )
+		self.assertEqual( statistics.summary()[ 'edgeProperties' ], { 'weight' : { 'count' : 1, 'distinct' : 1 } } )
+
+	def test_batches( self ):
+		statistics, batchStatistics = GraphStatistics(), GraphStatistics()
+		vertices = [ GraphVertex( [ 'airport' ], { 'code' : 'AUS', 'country' : 'US' } ), GraphVertex( [ 'airport' ], { 'code' : 'DFW', 'country' : 'US' } ),
+		             GraphVertex( [ 'country' ] ) ]
+		for graphVertex in vertices:
+			statistics.addVertex( graphVertex.labels, graphVertex.props )
+		batchStatistics.addVertexBatch( vertices )
+		statistics.addEdge( 'route', { 'dist' : 190 }, 0, 0 )
+		statistics.addEdge( 'route', { 'dist' : 190 }, 1, 1 )
+		statistics.addEdge( 'contains', dict(), 0, 0 )
+		edges = [ GraphEdge( 0, 1, 'route', { 'dist' : 190 } ), GraphEdge( 0, 1, 'route', { 'dist' : 190 } ), GraphEdge( 2, 0, 'contains' ) ]
+		batchStatistics.addEdgeBatch( edges, { 0 : 2, 2 : 1 }.get, { 1 : 2, 0 : 1 }.get )
+		self.assertEqual( batchStatistics.summary(), statistics.summary() )
+
+if __name__ == '__main__':
+	unittest.main()
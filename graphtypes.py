@@ -1,85 +1,326 @@
 import unittest
+import array
+import sys
+import weakref
+from collections.abc import Mapping
+
+class PropertySchema:
+	# The ordered property names shared by every graph object having exactly those names. An object stores only a
+	# tuple of values laid out in its schema's order; schemas are interned, and adding a name moves an object to the
+	# schema reached by the cached transition for that name. Schemas are held weakly, so that the ones no object
+	# uses any more are dropped.
+	__slots__ = ('keys', 'positions', 'transitions', '__weakref__')
+	SCHEMAS = weakref.WeakValueDictionary()
+
+	def __init__( self, keys ):
+		self.keys = keys
+		self.positions = { key : position for position, key in enumerate( keys ) }
+		self.transitions = weakref.WeakValueDictionary()
+
+	@staticmethod
+	def forKeys( keys ):
+		keys = tuple( sys.intern( key ) if type( key ) is str else key for key in keys )
+		schema = PropertySchema.SCHEMAS.get( keys )
+		if schema is None:
+			schema = PropertySchema.SCHEMAS[ keys ] = PropertySchema( keys )
+		return schema
+
+	def withKey( self, key ):
+		schema = self.transitions.get( key )
+		if schema is None:
+			schema = self.transitions[ key ] = PropertySchema.forKeys( self.keys + (key,) )
+		return schema
+
+class PropertyMap( Mapping ):
+	# Read-only dict view over a graph object's property values; GraphObject.setProperty is the only writer.
+	__slots__ = ('schema', 'values')
+
+	def __init__( self, schema, values ):
+		self.schema, self.values = schema, values
+
+	def __getitem__( self, propertyName ):
+		return self.values[ self.schema.positions[ propertyName ] ]
+
+	def get( self, propertyName, default=None ):
+		position = self.schema.positions.get( propertyName )
+		return default if position is None else self.values[ position ]
+
+	def __contains__( self, propertyName ):
+		return propertyName in self.schema.positions
+
+	def __iter__( self ):
+		return iter( self.schema.keys )
+
+	def __len__( self ):
+		return len( self.values )
+
+	def __repr__( self ):
+		return repr( dict( zip( self.schema.keys, self.values ) ) )
 
 class GraphObject:
 	VERTEX, EDGE = 'VERTEX', 'EDGE'
+	EMPTY_SCHEMA = PropertySchema.forKeys( tuple() )
+	__slots__ = ('id', 'schema', 'values')
 
-	def __init__( self, objectType, props=None ):
+	def __init__( self, props=None ):
 		self.id = None
-		assert objectType in (GraphObject.VERTEX, GraphObject.EDGE)
-		self.objectType = objectType
-		self.props = props or dict()	
+		if props:
+			self.schema, self.values = PropertySchema.forKeys( props.keys() ), tuple( props.values() )
+		else:
+			self.schema, self.values = GraphObject.EMPTY_SCHEMA, tuple()
+
+	@property
+	def props( self ):
+		return PropertyMap( self.schema, self.values )
+
+	def getProperty( self, propertyName, default=None ):
+		position = self.schema.positions.get( propertyName )
+		return default if position is None else self.values[ position ]
 
 	def setProperty( self, propertyName, propertyValue ):
-		self.props[ propertyName ] = propertyValue
+		position = self.schema.positions.get( propertyName )
+		if position is None:
+			self.schema, self.values = self.schema.withKey( propertyName ), self.values + (propertyValue,)
+		else:
+			self.values = self.values[ : position ] + (propertyValue,) + self.values[ position + 1 : ]
 
 	def setId( self, id ):
 		assert self.id is None
 		self.id = id
 
 class GraphEdge( GraphObject ):
+	objectType = GraphObject.EDGE
+	__slots__ = ('fromVertexId', 'toVertexId', 'label')
+
 	def __init__( self, fromVertexId, toVertexId, edgeLabel=None, props=None ):
 		self.fromVertexId, self.toVertexId = fromVertexId, toVertexId
-		self.edgeLabel = edgeLabel
-		
-		GraphObject.__init__( self, GraphObject.EDGE, props )
+		self.label = sys.intern( edgeLabel ) if type( edgeLabel ) is str else edgeLabel
+
+		GraphObject.__init__( self, props )
+
+	@property
+	def labels( self ):
+		return [ self.label ] if self.label is not None else list()
+
+	@property
+	def edgeLabel( self ):
+		return self.label
 
 	def setEdgeLabel( self, edgeLabel ):
-		assert self.edgeLabel is None
-		self.edgeLabel = edgeLabel
+		assert self.label is None
+		self.label = sys.intern( edgeLabel ) if type( edgeLabel ) is str else edgeLabel
 
 	def fromTo( self ):
 		return self.fromVertexId, self.toVertexId
 
 	def __repr__( self ):
 		header = 'GraphEdge @{} edgeId={}'.format( id( self ), self.id )
-		edgeInfo = 'edgeLabel : {} Direction : {} --> {}'.format( self.edgeLabel, self.fromVertexId, self.toVertexId )
+		edgeInfo = 'edgeLabel : {} Direction : {} --> {}'.format( self.label, self.fromVertexId, self.toVertexId )
 		props  = 'props  : {}'.format( self.props )
 		return '{} {} {}'.format( header, edgeInfo, props )
 
-	def __getattr__( self, attribute ):
-		if attribute == 'labels':
-			return [ self.edgeLabel ] if self.edgeLabel is not None else list()
-		elif attribute == 'label':
-			return self.edgeLabel
-		return super().__getattribute__( attribute )
-
 class GraphVertex( GraphObject ):
+	objectType = GraphObject.VERTEX
+	__slots__ = ('labels', 'outAdjacency', 'inAdjacency', 'positions')
+	# Held weakly, like PropertySchema.SCHEMAS; each entry is keyed by a copy of its label set, which would otherwise
+	# keep itself alive.
+	LABEL_SETS = weakref.WeakValueDictionary()
+	OUT, IN = 'OUT', 'IN'
+	# Adjacency arrays of more edges than this get a position map on their first removal.
+	POSITION_MAP_THRESHOLD = 32
+
 	def __init__( self, labels=None, props=None ):
-		self._labels = set()
-		if labels is not None:
-			self.labels = set( labels )
-		
-		self.outgoingEdges = set()
-		self.incomingEdges = set()
+		# labels is an interned frozenset shared by every vertex with the same labels.
+		self.labels = GraphVertex._internLabels( labels if labels is not None else tuple() )
+
+		# Adjacency is partitioned by edge label: edgeLabel -> array of interleaved edgeId, neighbourVertexId pairs.
+		# Keeping the neighbour next to the edge id lets a labelled expansion skip both non-matching edges and the
+		# edge object lookup.
+		self.outAdjacency = dict()
+		self.inAdjacency = dict()
+		# (direction, edgeLabel) -> { edgeId : position in the adjacency array }, for the large arrays edges have
+		# been removed from; None until there is one.
+		self.positions = None
+
+		GraphObject.__init__( self, props )
 
-		GraphObject.__init__( self, GraphObject.VERTEX, props )
+	@staticmethod
+	def _internLabels( labels ):
+		labels = frozenset( sys.intern( label ) if type( label ) is str else label for label in labels )
+		internedLabels = GraphVertex.LABEL_SETS.get( labels )
+		if internedLabels is None:
+			# frozenset( labels ) would return labels itself.
+			internedLabels = GraphVertex.LABEL_SETS[ frozenset( list( labels ) ) ] = labels
+		return internedLabels
 
-	def addOutgoingEdge( self, edgeId ):
-		self.outgoingEdges.add( edgeId )
+	def addOutgoingEdge( self, edgeId, edgeLabel, toVertexId ):
+		self._addAdjacentEdge( GraphVertex.OUT, self.outAdjacency, edgeId, edgeLabel, toVertexId )
 
-	def removeOutgoingEdge( self, edgeId ):
-		self.outgoingEdges.remove( edgeId )
+	def removeOutgoingEdge( self, edgeId, edgeLabel ):
+		self._removeAdjacentEdge( GraphVertex.OUT, self.outAdjacency, edgeId, edgeLabel )
 
-	def addIncomingEdge( self, edgeId ):
-		self.incomingEdges.add( edgeId )
+	def addIncomingEdge( self, edgeId, edgeLabel, fromVertexId ):
+		self._addAdjacentEdge( GraphVertex.IN, self.inAdjacency, edgeId, edgeLabel, fromVertexId )
 
-	def removeIncomingEdge( self, edgeId ):
-		self.incomingEdges.remove( edgeId )
+	def removeIncomingEdge( self, edgeId, edgeLabel ):
+		self._removeAdjacentEdge( GraphVertex.IN, self.inAdjacency, edgeId, edgeLabel )
 
-	def outDegree( self ):
-		return len( self.outgoingEdges )
+	def outgoingEdges( self, edgeLabel=None ):
+		return { edgeId for edgeId, _ in self.outgoingAdjacency( edgeLabel ) }
 
-	def inDegree( self ):
-		return len( self.incomingEdges )
+	def incomingEdges( self, edgeLabel=None ):
+		return { edgeId for edgeId, _ in self.incomingAdjacency( edgeLabel ) }
+
+	def outgoingAdjacency( self, edgeLabel=None ):
+		return GraphVertex._adjacentEdges( self.outAdjacency, edgeLabel )
+
+	def incomingAdjacency( self, edgeLabel=None ):
+		return GraphVertex._adjacentEdges( self.inAdjacency, edgeLabel )
+
+	def outgoingNeighbours( self, edgeLabel=None ):
+		return GraphVertex._neighbours( self.outAdjacency, edgeLabel )
+
+	def incomingNeighbours( self, edgeLabel=None ):
+		return GraphVertex._neighbours( self.inAdjacency, edgeLabel )
+
+	def outDegree( self, edgeLabel=None ):
+		return GraphVertex._degree( self.outAdjacency, edgeLabel )
+
+	def inDegree( self, edgeLabel=None ):
+		return GraphVertex._degree( self.inAdjacency, edgeLabel )
+
+	def _addAdjacentEdge( self, direction, adjacency, edgeId, edgeLabel, neighbourVertexId ):
+		edges = adjacency.get( edgeLabel )
+		if edges is None:
+			edges = adjacency[ edgeLabel ] = array.array( 'q' )
+		if self.positions is not None:
+			positions = self.positions.get( (direction, edgeLabel) )
+			if positions is not None:
+				positions[ edgeId ] = len( edges )
+		edges.append( edgeId )
+		edges.append( neighbourVertexId )
+
+	@staticmethod
+	def _adjacentEdges( adjacency, edgeLabel ):
+		# Returns (edgeId, neighbourVertexId) pairs.
+		if edgeLabel is None:
+			return [ pair for edges in adjacency.values() for pair in zip( edges[ 0 : : 2 ], edges[ 1 : : 2 ] ) ]
+		edges = adjacency.get( edgeLabel )
+		return zip( edges[ 0 : : 2 ], edges[ 1 : : 2 ] ) if edges is not None else tuple()
+
+	@staticmethod
+	def _neighbours( adjacency, edgeLabel ):
+		if edgeLabel is None:
+			return [ neighbourVertexId for edges in adjacency.values() for neighbourVertexId in edges[ 1 : : 2 ] ]
+		edges = adjacency.get( edgeLabel )
+		return edges[ 1 : : 2 ] if edges is not None else tuple()
+
+	@staticmethod
+	def _degree( adjacency, edgeLabel ):
+		if edgeLabel is None:
+			return sum( len( edges ) for edges in adjacency.values() ) // 2
+		return len( adjacency.get( edgeLabel, tuple() ) ) // 2
+
+	def _removeAdjacentEdge( self, direction, adjacency, edgeId, edgeLabel ):
+		# The last pair is moved into the removed one's place. Small arrays are searched; large ones are given a position
+		# map, so that removing all the edges of a hub takes time linear in its degree.
+		edges = adjacency[ edgeLabel ]
+		positionsKey = (direction, edgeLabel)
+		positions = self.positions.get( positionsKey ) if self.positions is not None else None
+		if positions is None and len( edges ) > 2 * GraphVertex.POSITION_MAP_THRESHOLD:
+			positions = { edges[ position ] : position for position in range( 0, len( edges ), 2 ) }
+			if self.positions is None:
+				self.positions = dict()
+			self.positions[ positionsKey ] = positions
+
+		if positions is not None:
+			position = positions.pop( edgeId )
+		else:
+			for position in range( 0, len( edges ), 2 ):
+				if edges[ position ] == edgeId:
+					break
+			else:
+				raise KeyError( edgeId )
+
+		lastPosition = len( edges ) - 2
+		if position != lastPosition:
+			edges[ position ], edges[ position + 1 ] = edges[ lastPosition ], edges[ lastPosition + 1 ]
+			if positions is not None:
+				positions[ edges[ position ] ] = position
+		del edges[ lastPosition : ]
+
+		if len( edges ) == 0:
+			del adjacency[ edgeLabel ]
+			if positions is not None:
+				del self.positions[ positionsKey ]
+				if len( self.positions ) == 0:
+					self.positions = None
 
 	def addLabel( self, label ):
-		self.labels.add( label )
+		self.labels = GraphVertex._internLabels( self.labels | { label } )
 
 	def __repr__( self ):
 		header = 'GraphVertex @{} vertexId={}'.format( id( self ), self.id )
-		labels = 'labels : {}'.format( self.labels )
+		labels = 'labels : {}'.format( set( self.labels ) )
 		props  = 'props  : {}'.format( self.props )
 		return '{} {} {}'.format( header, labels, props )
 
+class GraphTypesTest( unittest.TestCase ):
+	def test_sharedRepresentation( self ):
+		austin = GraphVertex( labels=[ 'airport' ], props={ 'code' : 'AUS', 'runways' : 2 } )
+		dallas = GraphVertex( labels=[ 'air' + 'port' ], props={ 'code' : 'DFW', 'runways' : 7 } )
+		self.assertIs( austin.labels, dallas.labels )
+		self.assertIs( austin.schema, dallas.schema )
+		self.assertFalse( hasattr( austin, '__dict__' ) )
+
+		austin.setProperty( 'city', 'Austin' )
+		dallas.setProperty( 'city', 'Dallas' )
+		dallas.setProperty( 'runways', 8 )
+		self.assertIs( austin.schema, dallas.schema )
+		self.assertEqual( dallas.props, { 'code' : 'DFW', 'runways' : 8, 'city' : 'Dallas' } )
+		self.assertEqual( (austin.getProperty( 'city' ), austin.getProperty( 'country' )), ('Austin', None) )
+
+		austin.addLabel( 'hub' )
+		self.assertEqual( (austin.labels, dallas.labels), ({ 'airport', 'hub' }, { 'airport' }) )
+
+	def test_adjacency( self ):
+		graphVertex = GraphVertex()
+		for edgeId, edgeLabel, toVertexId in [ (10, 'route', 2), (11, 'route', 3), (12, 'contains', 4) ]:
+			graphVertex.addOutgoingEdge( edgeId, edgeLabel, toVertexId )
+		self.assertEqual( sorted( graphVertex.outgoingAdjacency() ), [ (10, 2), (11, 3), (12, 4) ] )
+		self.assertEqual( list( graphVertex.outgoingNeighbours( 'route' ) ), [ 2, 3 ] )
+
+		graphVertex.removeOutgoingEdge( 10, 'route' )
+		graphVertex.removeOutgoingEdge( 12, 'contains' )
+		self.assertEqual( (graphVertex.outDegree(), graphVertex.outDegree( 'route' ), list( graphVertex.outAdjacency )), (1, 1, [ 'route' ]) )
+
+		graphEdge = GraphEdge( 1, 2, 'route', props={ 'dist' : 190 } )
+		self.assertEqual( (graphEdge.label, graphEdge.labels, graphEdge.props.get( 'dist' )), ('route', [ 'route' ], 190) )
+
+	def test_hubRemoval( self ):
+		hub = GraphVertex()
+		for edgeId in range( 1000 ):
+			hub.addIncomingEdge( edgeId, 'route', edgeId + 5000 )
+		for edgeId in list( range( 0, 1000, 3 ) ) + [ 1000 ]:
+			if edgeId < 1000:
+				hub.removeIncomingEdge( edgeId, 'route' )
+			else:
+				hub.addIncomingEdge( edgeId, 'route', edgeId + 5000 )
+		self.assertEqual( sorted( hub.incomingAdjacency( 'route' ) ), [ (edgeId, edgeId + 5000) for edgeId in range( 1001 ) if edgeId % 3 > 0 or edgeId == 1000 ] )
+		with self.assertRaises( KeyError ):
+			hub.removeIncomingEdge( 0, 'route' )
+
+		for edgeId, _ in list( hub.incomingAdjacency() ):
+			hub.removeIncomingEdge( edgeId, 'route' )
+		self.assertEqual( (hub.inAdjacency, hub.positions), (dict(), None) )
+
+	def test_internedPruning( self ):
+		graphVertex = GraphVertex( labels=[ 'pruned' ], props={ 'prunedKey' : 1 } )
+		self.assertIn( frozenset( [ 'pruned' ] ), GraphVertex.LABEL_SETS )
+		self.assertIn( ('prunedKey',), PropertySchema.SCHEMAS )
+		del graphVertex
+		self.assertNotIn( frozenset( [ 'pruned' ] ), GraphVertex.LABEL_SETS )
+		self.assertNotIn( ('prunedKey',), PropertySchema.SCHEMAS )
+
 if __name__ == '__main__':
-	unittest.main()
\ No newline at end of file
+	unittest.main()
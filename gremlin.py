@@ -1,17 +1,38 @@
 import unittest
+import sys
 import codecs
-import copy
 import statistics
+import itertools
+import operator
+import collections
+import os
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 
 from graph import Graph
 from graphtypes import GraphVertex, GraphEdge
-from gremlinparser import GremlinParser, GremlinFunction, GremlinToken
+from gremlinparser import GremlinParser, GremlinFunction, GremlinToken, GremlinSyntaxError
+from graphsearch import GraphSearch
+from graphanalytics import GraphAnalytics
+from graphgenerator import GraphGenerator
+from graphsnapshot import GraphSnapshot
+from compactgraph import UnsupportedIdError
+from gremlinoptimizer import GremlinOptimizer
+from gremlinprofiler import GremlinProfiler, GremlinStepHook
+from gremlinresults import GremlinVertexReference, GremlinEdgeReference, GremlinPath, GremlinSerializer, TextSerializer
+from utilities import LRUCache
 
 import sample_graph
+import gremlinworker
 
 class GremlinGraph:
-	def __init__( self ):
-		self.graph = Graph()
+	def __init__( self, graph=None ):
+		self.graph = graph if graph is not None else Graph()
+
+	def freeze( self ):
+		return GremlinGraph( self.graph.freeze() )
 
 	def addVertex( self, labels=None, props=None, id_=None ):
 		graphVertex = GraphVertex( labels=labels, props=props )
@@ -26,9 +47,67 @@ class GremlinGraph:
 	def getGraphObjectReference( self, id_ ):
 		return self.graph.getGraphObjectReference( id_ )
 
+	def outAdjacency( self, vertexId, edgeLabel=None ):
+		return self.graph.outAdjacency( vertexId, edgeLabel )
+
+	def inAdjacency( self, vertexId, edgeLabel=None ):
+		return self.graph.inAdjacency( vertexId, edgeLabel )
+
+	def expandFrontier( self, vertexIds, bulks, direction, edgeLabel=None ):
+		return self.graph.expandFrontier( vertexIds, bulks, direction, edgeLabel )
+
+	def outDegree( self, vertexId, edgeLabel=None ):
+		return self.graph.outDegree( vertexId, edgeLabel )
+
+	def inDegree( self, vertexId, edgeLabel=None ):
+		return self.graph.inDegree( vertexId, edgeLabel )
+
+	def setProperty( self, id_, propertyName, propertyValue ):
+		self.graph.setProperty( id_, propertyName, propertyValue )
+
+	def addLabel( self, id_, label ):
+		self.graph.addLabel( id_, label )
+
+	def createLabelIndex( self ):
+		self.graph.createLabelIndex()
+
+	def createPropertyIndex( self, propertyName ):
+		self.graph.createPropertyIndex( propertyName )
+
+	def hasLabelIndex( self ):
+		return self.graph.hasLabelIndex()
+
+	def hasPropertyIndex( self, propertyName ):
+		return self.graph.hasPropertyIndex( propertyName )
+
+	def lookupLabel( self, label ):
+		return self.graph.lookupLabel( label )
+
+	def lookupProperty( self, propertyName, propertyValue ):
+		return self.graph.lookupProperty( propertyName, propertyValue )
+
+	def labelCount( self, label ):
+		return self.graph.labelCount( label )
+
+	def propertyValueCount( self, propertyName, propertyValue ):
+		return self.graph.propertyValueCount( propertyName, propertyValue )
+
+	def stats( self ):
+		return self.graph.stats()
+
+	@property
+	def version( self ):
+		return self.graph.version
+
+	def dependencyVersion( self, key ):
+		return self.graph.dependencyVersion( key )
+
 	def V( self ):
 		return self.graph.V()
 
+	def vertexSnapshot( self ):
+		return self.graph.vertexSnapshot()
+
 	def E( self ):
 		return self.graph.E()
 
@@ -36,28 +115,32 @@ class DataTraverserExpected( Exception ):
 	pass
 
 class GremlinTraverser:
-	graphReference = None
+	# Traversers do not know their graph: the helpers which look up graph objects take it as their first argument, so
+	# that traversals over different graphs can run side by side.
 	COMPUTATION_OBJECT_ID, COMPUTATION_TAG = -1, 'compute'
+	EMPTY_LABEL_DICT = dict()
 
 	@staticmethod
-	def setGraphReference( graphReference ):
-		GremlinTraverser.graphReference = graphReference
+	def init( objectId, labelDict=None, path=None, bulk=1 ):
+		# GremlinTraverser object is a tuple - (objectId, labelDict, path, bulk)
+		# path is a persistent linked list of (objectId, parentPath) nodes, so traversers cloned from the same parent
+		# share their history; it is None when the traversal does not track paths. labelDict is copy-on-write: it is
+		# shared between clones and never modified in place. bulk is the number of identical traversers represented.
+		labelDict = labelDict or GremlinTraverser.EMPTY_LABEL_DICT
+		return (objectId, labelDict, path, bulk)
 
 	@staticmethod
-	def init( objectId, labelDict=None, pathList=None ):
-		# GremlinTraverser object is a tuple - (objectId, labelDict, pathList)
-		labelDict = labelDict or dict()
-		pathList = pathList or list()
-		return (objectId, labelDict, pathList)
+	def initPath( objectId ):
+		return (objectId, None)
 
 	@staticmethod
-	def initDataTraverser( data ):
+	def initDataTraverser( data, bulk=1 ):
 		return GremlinTraverser.init( GremlinTraverser.COMPUTATION_OBJECT_ID,
-			                          labelDict={ GremlinTraverser.COMPUTATION_TAG : data } )
+			                          labelDict={ GremlinTraverser.COMPUTATION_TAG : data }, bulk=bulk )
 
 	@staticmethod
 	def isDataTraverser( gremlinTraverser ):
-		objectId, labelDict, _ = gremlinTraverser
+		objectId, labelDict, _, _ = gremlinTraverser
 		if objectId == GremlinTraverser.COMPUTATION_OBJECT_ID:
 			return True, labelDict[ GremlinTraverser.COMPUTATION_TAG ]
 		return False, None
@@ -71,62 +154,91 @@ class GremlinTraverser:
 
 	@staticmethod
 	def clone( gremlinTraverser, newObjectId, newLabel=None ):
-		_, labelDict, pathList = gremlinTraverser
-		newLabelDict = copy.deepcopy( labelDict )
-		newPathList = copy.deepcopy( pathList )
+		_, labelDict, path, bulk = gremlinTraverser
 		if newLabel is not None:
-			newLabelDict[ newLabel ] = newObjectId
-		newPathList.append( newObjectId )
-		return (newObjectId, newLabelDict, newPathList)
+			labelDict = dict( labelDict )
+			labelDict[ newLabel ] = newObjectId
+		if path is not None:
+			path = (newObjectId, path)
+		return (newObjectId, labelDict, path, bulk)
+
+	@staticmethod
+	def bulk( gremlinTraverser ):
+		_, _, _, bulk = gremlinTraverser
+		return bulk
+
+	@staticmethod
+	def withBulk( gremlinTraverser, bulk ):
+		objectId, labelDict, path, _ = gremlinTraverser
+		return (objectId, labelDict, path, bulk)
+
+	@staticmethod
+	def merge( traverserList ):
+		# Collapses traversers with the same signature into a single traverser carrying the combined bulk.
+		mergedTraversers = dict()
+		for traverser in traverserList:
+			signature = GremlinTraverser.signature( traverser )
+			mergedTraverser = mergedTraversers.get( signature )
+			if mergedTraverser is None:
+				mergedTraversers[ signature ] = traverser
+			else:
+				mergedTraversers[ signature ] = GremlinTraverser.withBulk( mergedTraverser,
+					                                                       GremlinTraverser.bulk( mergedTraverser ) + GremlinTraverser.bulk( traverser ) )
+		return list( mergedTraversers.values() )
+
+	@staticmethod
+	def pathList( gremlinTraverser ):
+		_, _, path, _ = gremlinTraverser
+		pathList = list()
+		while path is not None:
+			objectId, path = path
+			pathList.append( objectId )
+		pathList.reverse()
+		return pathList
 
 	@staticmethod
 	def signature( gremlinTraverser ):
-		objectId, labelDict, pathList = gremlinTraverser
-		return (objectId, tuple( sorted( labelDict.items() ) ), tuple( pathList ) )
+		objectId, labelDict, _, _ = gremlinTraverser
+		return (objectId, tuple( sorted( labelDict.items() ) ), tuple( GremlinTraverser.pathList( gremlinTraverser ) ) )
 
 	@staticmethod
-	def get( gremlinTraverser ):
-		objectId, _, _ = gremlinTraverser
-		return GremlinTraverser.graphReference.getGraphObjectReference( objectId )
+	def get( graphReference, gremlinTraverser ):
+		objectId, _, _, _ = gremlinTraverser
+		return graphReference.getGraphObjectReference( objectId )
 
 	@staticmethod
 	def applyLabel( gremlinTraverser, label ):
-		objectId, labelDict, _ = gremlinTraverser
-		labelDict[ label ] = objectId
+		return GremlinTraverser.applyLabels( gremlinTraverser, [ label ] )
 
 	@staticmethod
 	def applyLabels( gremlinTraverser, labels ):
+		objectId, labelDict, path, bulk = gremlinTraverser
+		labelDict = dict( labelDict )
 		for label in labels:
-			GremlinTraverser.applyLabel( gremlinTraverser, label )
+			labelDict[ label ] = objectId
+		return (objectId, labelDict, path, bulk)
 
 	@staticmethod
 	def addPath( gremlinTraverser, vertexId ):
-		_, _, pathList = gremlinTraverser
-		pathList.append( vertexId )
+		objectId, labelDict, path, bulk = gremlinTraverser
+		return (objectId, labelDict, (vertexId, path), bulk)
 
 	@staticmethod
-	def toString( objectId ):
-		graphObjectReference = GremlinTraverser.graphReference.getGraphObjectReference( objectId )
-		return GremlinTraverser.__repr__( graphObjectReference )
+	def reference( graphReference, objectId ):
+		graphObjectReference = graphReference.getGraphObjectReference( objectId )
+		if graphObjectReference.objectType == 'VERTEX':
+			return GremlinVertexReference( objectId, graphObjectReference.labels )
+		fromVertex, toVertex = graphObjectReference.fromTo()
+		return GremlinEdgeReference( objectId, graphObjectReference.label, fromVertex, toVertex )
 
 	@staticmethod
-	def repr( gremlinTraverser ):
+	def result( graphReference, gremlinTraverser ):
+		# The traverser's data, or a reference to the graph object it is on.
 		isDataTraverser, data = GremlinTraverser.isDataTraverser( gremlinTraverser )
 		if isDataTraverser:
-			return str( data )
-		
-		graphObjectReference = GremlinTraverser.get( gremlinTraverser )
-		return GremlinTraverser.__repr__( graphObjectReference )
-
-	@staticmethod
-	def __repr__( graphObjectReference ):
-		if graphObjectReference.objectType == 'VERTEX':
-			objectDescription = 'v[{}]'.format( graphObjectReference.id )
-		elif graphObjectReference.objectType == 'EDGE':
-			fromVertex, toVertex = graphObjectReference.fromTo()
-			edgeLabel = graphObjectReference.edgeLabel
-			objectDescription = 'e[{}][{}-{}->{}]'.format( graphObjectReference.id, fromVertex, edgeLabel, toVertex )
-		return objectDescription
+			return data
+		objectId, _, _, _ = gremlinTraverser
+		return GremlinTraverser.reference( graphReference, objectId )
 
 class VertexNotPresentError( Exception ):
 	pass
@@ -134,68 +246,212 @@ class VertexNotPresentError( Exception ):
 class EdgeNotPresentError( Exception ):
 	pass
 
+class NoSuchElementError( Exception ):
+	pass
+
+class LoopLimitExceededError( Exception ):
+	pass
+
 class GremlinPredicates:
 	pass
 
-class GremlinTraversal:
+class GremlinVertexScan:
+	# The vertex ids scanned by V(). They are taken from the graph when the scan is first read, or by addV() before it
+	# adds a vertex, so that vertices added by later steps neither show up in the scan nor break it, while a scan which
+	# a has() or hasLabel() seeds from an index instead never lists the vertices at all.
 	def __init__( self, graphReference ):
 		self.graphReference = graphReference
-		self.traverserList = list()
+		self.vertexIds = None
+
+	def ids( self ):
+		if self.vertexIds is None:
+			self.vertexIds = self.graphReference.vertexSnapshot()
+		return self.vertexIds
+
+	def __iter__( self ):
+		# A generator, so that iter() does not take the ids before the first one is pulled.
+		yield from self.ids()
 
-		self.sideEffects = dict()
+	def __len__( self ):
+		return len( self.ids() )
 
-		GremlinTraverser.setGraphReference( graphReference )
+	def __contains__( self, vertexId ):
+		return vertexId in ( self.vertexIds if self.vertexIds is not None else self.graphReference.V() )
+
+class GremlinTraversal:
+	# Steps which read traverser paths. When a query uses none of them, paths are not tracked and traversers that
+	# reach the same object with the same labels are merged into one bulked traverser.
+	PATH_STEPS = { 'path', 'simplePath' }
+	# Steps which read or write traverser labels.
+	LABEL_STEPS = { 'as', 'select' }
+	# Steps which stop pulling traversers once they have enough of them. Frontier mode computes whole frontiers, so
+	# queries using these steps run as a lazy pipeline instead.
+	LAZY_STEPS = { 'limit', 'next', 'hasNext', 'tryNext' }
+	# Gremlin step names which are also Python keywords, mapped to the methods implementing them.
+	KEYWORD_STEPS = { 'as' : '_as', 'is' : '_is' }
+	# Without paths, traversers are merged this many at a time, which bounds how far a merge reads ahead of the steps
+	# consuming its output.
+	BULK_CHUNK_SIZE = 1024
+	# A repeat() loop which is still running after this many iterations is abandoned.
+	MAX_LOOPS = 1000
+
+	def __init__( self, graphReference, trackPaths=True ):
+		self.graphReference = graphReference
+		self.trackPaths = trackPaths
+		self.traverserList = list()
+		# Set by V() to the (lazy) full vertex scan, so that a has()/hasLabel() applied directly to it can seed
+		# traverserList from an index instead of filtering every vertex.
+		self.vertexScan = None
+		# The GremlinVertexScan of the last V(), whose ids mutating steps take before they change the graph.
+		self.vertexScanIds = None
+		# The number of iterations completed by the innermost running repeat() loop, as read by loops().
+		self.loopCount = 0
+		# Values computed for every vertex by analytics steps such as pageRank(): propertyName -> { vertexId -> value }.
+		# values() reads them as transient properties of the vertices, in place of any stored property of that name.
+		self.computedProperties = dict()
 
 		# Gremlin function names which are also Python keywords are added using setattr.
-		setattr( self, 'as', self.__as )
+		setattr( self, 'as', self._as )
+		setattr( self, 'is', self._is )
 
 	def materialize( self ):
-		if isinstance( self.traverserList, filter ):
+		if not isinstance( self.traverserList, list ):
 			self.traverserList = list( self.traverserList )
 
+	def _isVertexScan( self ):
+		return self.vertexScan is not None and self.traverserList is self.vertexScan
+
+	def _traverserCounts( self ):
+		# Returns ( traversers, total bulk ), for profiling. The traversers are materialized to count them, except for a
+		# full vertex scan, which is left as it is so that a filter applied to it can still seed it from an index.
+		if self._isVertexScan():
+			vertexCount = len( self.graphReference.V() )
+			return vertexCount, vertexCount
+		self.materialize()
+		return len( self.traverserList ), sum( GremlinTraverser.bulk( traverser ) for traverser in self.traverserList )
+
+	@staticmethod
+	def usesSteps( gremlinTokenList, stepNames ):
+		for gremlinToken in gremlinTokenList:
+			if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION:
+				if gremlinToken.functionName in stepNames or GremlinTraversal.usesSteps( gremlinToken.argumentList, stepNames ):
+					return True
+		return False
+
+	def _initTraverser( self, objectId ):
+		path = GremlinTraverser.initPath( objectId ) if self.trackPaths else None
+		return GremlinTraverser.init( objectId, path=path )
+
+	def _seedFromIndex( self, vertexIds ):
+		self.traverserList = [ self._initTraverser( vertexId ) for vertexId in vertexIds ]
+
+	def _bulk( self, traversers ):
+		# Without paths, traversers only differ by object and labels, so merging them is cheap and keeps the
+		# traverser count bounded by the number of distinct objects reached.
+		return traversers if self.trackPaths else GremlinTraversal._mergeChunks( traversers, GremlinTraversal.BULK_CHUNK_SIZE )
+
+	@staticmethod
+	def _mergeChunks( traversers, chunkSize ):
+		traversers = iter( traversers )
+		while True:
+			chunk = list( itertools.islice( traversers, chunkSize ) )
+			if len( chunk ) == 0:
+				return
+			yield from GremlinTraverser.merge( chunk )
+
+	@staticmethod
+	def _limit( traversers, amount ):
+		# A bulked traverser counts as many traversers as its bulk, so the last one taken may be split.
+		if amount <= 0:
+			return
+		for traverser in traversers:
+			bulk = GremlinTraverser.bulk( traverser )
+			if bulk >= amount:
+				yield GremlinTraverser.withBulk( traverser, amount )
+				return
+			amount -= bulk
+			yield traverser
+
+	def _dataList( self ):
+		return [ (GremlinTraverser.getDataFromTraverser( traverser ), GremlinTraverser.bulk( traverser ) ) for traverser in self.traverserList ]
+
+	def results( self ):
+		# Yields the traversal's results, repeating each traverser's result as many times as its bulk.
+		for traverser in self.traverserList:
+			result = GremlinTraverser.result( self.graphReference, traverser )
+			for _ in range( GremlinTraverser.bulk( traverser ) ):
+				yield result
+
 	def _toString( self ):
-		return [ GremlinTraverser.repr( traverser ) for traverser in self.traverserList ]
+		return [ str( result ) for result in self.results() ]
 
 	def V( self, * arguments ):
 		if len( arguments ) == 0:
-			self.traverserList = [ GremlinTraverser.init( vertexId, pathList=[ vertexId ] ) for vertexId in self.graphReference.V() ]
+			self.vertexScanIds = GremlinVertexScan( self.graphReference )
+			self.traverserList = ( self._initTraverser( vertexId ) for vertexId in self.vertexScanIds )
+			self.vertexScan = self.traverserList
 		else:
 			vertexId, * _ = arguments
 			vertexId = int( vertexId )
 			if vertexId in self.graphReference.V():
-				self.traverserList = [ GremlinTraverser.init( vertexId, pathList=[ vertexId ] ) ]
+				self.traverserList = [ self._initTraverser( vertexId ) ]
 			else:
 				raise VertexNotPresentError( 'Vertex with id={} not present'.format( vertexId ) )
 
 	def E( self, * arguments ):
 		if len( arguments ) == 0:
-			self.traverserList = [ GremlinTraverser.init( edgeId , pathList=[ edgeId ] ) for edgeId in self.graphReference.E() ]
+			self.traverserList = ( self._initTraverser( edgeId ) for edgeId in self.graphReference.E() )
 		else:
 			edgeId, * _ = arguments
 			edgeId = int( edgeId )
 			if edgeId in self.graphReference.E():
-				self.traverserList = [ GremlinTraverser.init( edgeId, pathList=[ edgeId ] ) ]
+				self.traverserList = [ self._initTraverser( edgeId ) ]
 			else:
 				raise EdgeNotPresentError( 'Edge with id={} not present'.format( edgeId ) )
 
 	def addV( self, * labels ):
+		# The scan of an earlier V() is read after the vertex is added, so it takes its ids now to leave the vertex out.
+		if self.vertexScanIds is not None:
+			self.vertexScanIds.ids()
 		id_ = self.graphReference.addVertex( labels=labels )
 
 	def addE( self, edgeLabel ):
 		pass
 
 	def property( self, propertyName, propertyValue ):
+		self.materialize()
 		for traverser in self.traverserList:
-			GremlinTraverser.get( traverser ).setProperty( propertyName, propertyValue )
+			objectId, _, _, _ = traverser
+			self.graphReference.setProperty( objectId, propertyName, propertyValue )
 
 	def hasLabel( self, * labels ):
 		labels = set( labels )
-		self.traverserList = filter( lambda traverser : len( set.intersection( labels, GremlinTraverser.get( traverser ).labels ) ) > 0,
+		if self._isVertexScan() and self.graphReference.hasLabelIndex():
+			self._seedFromIndex( set().union( * [ self.graphReference.lookupLabel( label ) for label in labels ] ) )
+			return
+		self.traverserList = filter( lambda traverser : len( set.intersection( labels, GremlinTraverser.get( self.graphReference, traverser ).labels ) ) > 0,
 			                         self.traverserList )
 
 	def has( self, * arguments ):
 		def matchProperty( traverser, propertyName, propertyValue ):
-			return GremlinTraverser.get( traverser ).props.get( propertyName ) == propertyValue
+			return GremlinTraverser.get( self.graphReference, traverser ).getProperty( propertyName ) == propertyValue
+
+		if self._isVertexScan():
+			if len( arguments ) == 2:
+				propertyName, propertyValue = arguments
+				if self.graphReference.hasPropertyIndex( propertyName ):
+					self._seedFromIndex( self.graphReference.lookupProperty( propertyName, propertyValue ) )
+					return
+			elif len( arguments ) == 3:
+				label, propertyName, propertyValue = arguments
+				if self.graphReference.hasPropertyIndex( propertyName ):
+					self._seedFromIndex( self.graphReference.lookupProperty( propertyName, propertyValue ) )
+					self.hasLabel( label )
+					return
+				if self.graphReference.hasLabelIndex():
+					self._seedFromIndex( self.graphReference.lookupLabel( label ) )
+					self.has( propertyName, propertyValue )
+					return
 
 		if len( arguments ) == 2:
 			propertyName, propertyValue = arguments
@@ -203,195 +459,1073 @@ class GremlinTraversal:
 				                         self.traverserList )
 		elif len( arguments ) == 1:
 			propertyName, * _ = arguments
-			self.traverserList = filter( lambda traverser : GremlinTraverser.get( traverser ).props.get( propertyName ) is not None,
+			self.traverserList = filter( lambda traverser : GremlinTraverser.get( self.graphReference, traverser ).getProperty( propertyName ) is not None,
 				                         self.traverserList )
 		elif len( arguments ) == 3:
 			label, propertyName, propertyValue = arguments
-			self.traverserList = filter( lambda traverser : label in GremlinTraverser.get( traverser ).labels and
+			self.traverserList = filter( lambda traverser : label in GremlinTraverser.get( self.graphReference, traverser ).labels and
 				                         matchProperty( traverser, propertyName, propertyValue ),
 				                         self.traverserList )
 
+	def hasId( self, * ids ):
+		ids = { int( id_ ) for id_ in ids }
+		if self._isVertexScan():
+			self._seedFromIndex( [ id_ for id_ in ids if id_ in self.graphReference.V() ] )
+			return
+		self.traverserList = filter( lambda traverser : traverser[ 0 ] in ids, self.traverserList )
+
 	def count( self ):
-		self.materialize()
-		self.traverserList = [ GremlinTraverser.initDataTraverser( len( self.traverserList ) ) ]
+		self.traverserList = [ GremlinTraverser.initDataTraverser( sum( GremlinTraverser.bulk( traverser ) for traverser in self.traverserList ) ) ]
 
-	def out( self, edgeLabel=None ):
-		newTraverserList = list()
+	# out( edgeLabel ).count() and both( edgeLabel ).count(), as rewritten by GremlinOptimizer: the degrees of the
+	# traversers' vertices are summed instead of expanding them.
+	def outDegreeCount( self, edgeLabel=None ):
+		self._degreeCount( Graph.OUT, edgeLabel )
+
+	def bothDegreeCount( self, edgeLabel=None ):
+		self._degreeCount( Graph.BOTH, edgeLabel )
+
+	def _degreeCount( self, direction, edgeLabel ):
+		degreeCount = 0
 		for traverser in self.traverserList:
-			for outgoingEdgeId in GremlinTraverser.get( traverser ).outgoingEdges:
-				edgeObjectReference = self.graphReference.getGraphObjectReference( outgoingEdgeId )
-				if edgeLabel is None or edgeObjectReference.label == edgeLabel:
-					fromVertex, toVertex = edgeObjectReference.fromTo()
-					newGremlinTraverser = GremlinTraverser.clone( traverser, toVertex )
-					newTraverserList.append( newGremlinTraverser )
-		self.traverserList = newTraverserList
+			objectId, _, _, bulk = traverser
+			degreeCount += bulk * self._degree( objectId, direction, edgeLabel )
+		self.traverserList = [ GremlinTraverser.initDataTraverser( degreeCount ) ]
+
+	def _degree( self, vertexId, direction, edgeLabel ):
+		degree = 0
+		if direction in (Graph.OUT, Graph.BOTH):
+			degree += self.graphReference.outDegree( vertexId, edgeLabel )
+		if direction in (Graph.IN, Graph.BOTH):
+			degree += self.graphReference.inDegree( vertexId, edgeLabel )
+		return degree
+
+	def outHasId( self, * arguments ):
+		# out( edgeLabel ).hasId( vertexId ), as rewritten by GremlinOptimizer: the edges into vertexId are looked up
+		# once, instead of expanding every traverser and discarding all but the neighbours equal to vertexId.
+		edgeLabel, vertexId = arguments if len( arguments ) == 2 else (None, * arguments)
+		vertexId = int( vertexId )
+		edgeCounts = collections.Counter()
+		if vertexId in self.graphReference.V():
+			edgeCounts.update( fromVertexId for _, fromVertexId in self.graphReference.inAdjacency( vertexId, edgeLabel ) )
+		def traverserMapper( traverser ):
+			objectId, _, _, bulk = traverser
+			edgeCount = edgeCounts.get( objectId, 0 )
+			if edgeCount == 0:
+				return
+			if self.trackPaths:
+				for _ in range( edgeCount ):
+					yield GremlinTraverser.clone( traverser, vertexId )
+			else:
+				yield GremlinTraverser.withBulk( GremlinTraverser.clone( traverser, vertexId ), bulk * edgeCount )
+		self.traverserList = self._bulk( reachedTraverser for traverser in self.traverserList for reachedTraverser in traverserMapper( traverser ) )
+
+	def out( self, edgeLabel=None ):
+		self._expand( Graph.OUT, edgeLabel )
 
 	def outE( self, edgeLabel=None ):
 		pass
 
 	def dedup( self ):
-		dataList = [ GremlinTraverser.getDataFromTraverser( traverser ) for traverser in self.traverserList ]
-		dedupDataList = list( set( dataList ) )
-		self.traverserList = [ GremlinTraverser.initDataTraverser( data ) for data in dedupDataList ]
+		self.traverserList = GremlinTraversal._dedup( self.traverserList )
+
+	@staticmethod
+	def _dedup( traversers ):
+		seen = set()
+		for traverser in traversers:
+			objectId, _, _, _ = traverser
+			isDataTraverser, data = GremlinTraverser.isDataTraverser( traverser )
+			key = data if isDataTraverser else objectId
+			if key in seen:
+				continue
+			seen.add( key )
+			yield GremlinTraverser.initDataTraverser( data ) if isDataTraverser else GremlinTraverser.withBulk( traverser, 1 )
 
 	def fold( self ):
 		dataList = list()
 		foldedObject = GremlinTraverser.initDataTraverser( dataList )
 		for traverser in self.traverserList:
-			dataList.append( GremlinTraverser.getDataFromTraverser( traverser ) )
+			dataList.extend( [ GremlinTraverser.getDataFromTraverser( traverser ) ] * GremlinTraverser.bulk( traverser ) )
 		self.traverserList = [ foldedObject ]
 
 	def path( self ):
 		def traverserMapper( traverser ):
-			_, _, pathList = traverser
-			pathString = ','.join( [ GremlinTraverser.toString( objectId ) for objectId in pathList ] )
-			pathDescription = '[' + pathString + ']'
-			return GremlinTraverser.initDataTraverser( pathDescription )
+			pathResult = GremlinTraversal._pathResult( self.graphReference, GremlinTraverser.pathList( traverser ) )
+			return GremlinTraverser.initDataTraverser( pathResult, GremlinTraverser.bulk( traverser ) )
 		self.traverserList = map( traverserMapper, self.traverserList )
 
+	@staticmethod
+	def _pathResult( graphReference, pathList ):
+		return GremlinPath( GremlinTraverser.reference( graphReference, objectId ) for objectId in pathList )
+
+	def shortestPath( self, targetVertexId, edgeLabel=None, weightProperty=None, maxHops=None ):
+		# Yields, in path() format, the shortest path from each vertex to targetVertexId along outgoing edges, counted in
+		# hops or, given weightProperty, weighted by that edge property. Vertices without such a path are dropped.
+		targetVertexId = int( targetVertexId )
+		maxHops = int( maxHops ) if maxHops is not None else None
+		def traverserMapper( traverser ):
+			objectId, _, _, bulk = traverser
+			if weightProperty is None:
+				pathList = GraphSearch.shortestPath( self.graphReference, objectId, targetVertexId, edgeLabel, maxHops )
+			else:
+				pathList, _ = GraphSearch.weightedShortestPath( self.graphReference, objectId, targetVertexId, weightProperty, edgeLabel, maxHops )
+			if pathList is not None:
+				yield GremlinTraverser.initDataTraverser( GremlinTraversal._pathResult( self.graphReference, pathList ), bulk )
+		self.traverserList = ( pathTraverser for traverser in self.traverserList for pathTraverser in traverserMapper( traverser ) )
+
+	def khop( self, hops, edgeLabel=None ):
+		# Moves each traverser to every vertex reachable from it in 1 to hops steps along outgoing edges, once per vertex.
+		# When paths are tracked, each traverser's path is extended by a shortest path to the vertex reached.
+		hops = int( hops )
+		def traverserMapper( traverser ):
+			objectId, _, _, _ = traverser
+			parents = GraphSearch.khop( self.graphReference, objectId, hops, edgeLabel )
+			for vertexId in parents:
+				if vertexId == objectId:
+					continue
+				if not self.trackPaths:
+					yield GremlinTraverser.clone( traverser, vertexId )
+					continue
+				reachedTraverser = traverser
+				for pathVertexId in GraphSearch.pathTo( parents, vertexId )[ 1 : ]:
+					reachedTraverser = GremlinTraverser.clone( reachedTraverser, pathVertexId )
+				yield reachedTraverser
+		self.traverserList = self._bulk( reachedTraverser for traverser in self.traverserList for reachedTraverser in traverserMapper( traverser ) )
+
 	def both( self, edgeLabel=None ):
-		newTraverserList = list()
-		for traverser in self.traverserList:
-			for outgoingEdgeId in GremlinTraverser.get( traverser ).outgoingEdges:
-				edgeObjectReference = self.graphReference.getGraphObjectReference( outgoingEdgeId )
-				if edgeLabel is None or edgeObjectReference.label == edgeLabel:
-					fromVertex, toVertex = edgeObjectReference.fromTo()
-					newGremlinTraverser = GremlinTraverser.clone( traverser, toVertex )
-					newTraverserList.append( newGremlinTraverser )
-			for incomingEdgeId in GremlinTraverser.get( traverser ).incomingEdges:
-				edgeObjectReference = self.graphReference.getGraphObjectReference( incomingEdgeId )
-				if edgeLabel is None or edgeObjectReference.label == edgeLabel:
-					fromVertex, toVertex = edgeObjectReference.fromTo()
-					newGremlinTraverser = GremlinTraverser.clone( traverser, fromVertex )
-					newTraverserList.append( newGremlinTraverser )
-		self.traverserList = newTraverserList
+		self._expand( Graph.BOTH, edgeLabel )
+
+	def _expand( self, direction, edgeLabel ):
+		self.traverserList = self._bulk( self._expandTraversers( self.traverserList, direction, edgeLabel ) )
+
+	def _expandTraversers( self, traversers, direction, edgeLabel ):
+		for traverser in traversers:
+			objectId, _, _, _ = traverser
+			if direction in (Graph.OUT, Graph.BOTH):
+				for _, toVertex in self.graphReference.outAdjacency( objectId, edgeLabel ):
+					yield GremlinTraverser.clone( traverser, toVertex )
+			if direction in (Graph.IN, Graph.BOTH):
+				for _, fromVertex in self.graphReference.inAdjacency( objectId, edgeLabel ):
+					yield GremlinTraverser.clone( traverser, fromVertex )
 
 	def values( self, * propertyNames ):
 		def traverserMapper( traverser ):
-			props = GremlinTraverser.get( traverser ).props
+			props = GremlinTraverser.get( self.graphReference, traverser ).props
+			if len( self.computedProperties ) > 0:
+				objectId, _, _, _ = traverser
+				props = dict( props )
+				props.update( (propertyName, computedValues[ objectId ]) for propertyName, computedValues in self.computedProperties.items() if objectId in computedValues )
 			if len( propertyNames ) == 0:
 				return props.values()
 			else:
 				return [ props[ propertyName ] for propertyName in propertyNames if props.get( propertyName ) is not None ]
 		
-		self.traverserList = [  GremlinTraverser.initDataTraverser( propertyValue )
+		self.traverserList = (  GremlinTraverser.initDataTraverser( propertyValue, GremlinTraverser.bulk( traverser ) )
 		                        for traverser in self.traverserList
-		                        for propertyValue in traverserMapper( traverser ) ]
+		                        for propertyValue in traverserMapper( traverser ) )
+
+	# Analytics steps compute a value for every vertex of the graph with the kernels of GraphAnalytics, and store them as
+	# the transient property propertyName, read by values(). The traversers themselves are left as they are.
+	def pageRank( self, propertyName='pageRank', edgeLabel=None, tolerance=GraphAnalytics.TOLERANCE, maxIterations=GraphAnalytics.MAX_ITERATIONS,
+		          dampingFactor=GraphAnalytics.DAMPING_FACTOR ):
+		ranks, _ = GraphAnalytics.pageRank( self.graphReference, edgeLabel, float( tolerance ), int( maxIterations ), float( dampingFactor ) )
+		self.computedProperties[ propertyName ] = ranks
+
+	def connectedComponent( self, propertyName='component', edgeLabel=None ):
+		self.computedProperties[ propertyName ] = GraphAnalytics.connectedComponent( self.graphReference, edgeLabel )
+
+	def degreeCentrality( self, propertyName='degree', direction=Graph.BOTH, edgeLabel=None ):
+		self.computedProperties[ propertyName ] = GraphAnalytics.degreeCentrality( self.graphReference, direction.upper(), edgeLabel )
 
 	def max( self ):
-		self.traverserList = [
-		GremlinTraverser.initDataTraverser( max( map( lambda traverser : GremlinTraverser.getDataFromTraverser( traverser ),
-			                                          self.traverserList ) ) )
-		]
+		self.traverserList = [ GremlinTraverser.initDataTraverser( max( data for data, _ in self._dataList() ) ) ]
 
 	def min( self ):
-		self.traverserList = [
-		GremlinTraverser.initDataTraverser( min( map( lambda traverser : GremlinTraverser.getDataFromTraverser( traverser ),
-			                                          self.traverserList ) ) )
-		]
+		self.traverserList = [ GremlinTraverser.initDataTraverser( min( data for data, _ in self._dataList() ) ) ]
 
 	def mean( self ):
-		self.traverserList = [
-		GremlinTraverser.initDataTraverser( statistics.mean( map( lambda traverser : GremlinTraverser.getDataFromTraverser( traverser ),
-			                                                      self.traverserList ) ) )
-		]
+		dataList = self._dataList()
+		if len( dataList ) == 0:
+			raise statistics.StatisticsError( 'mean requires at least one data point' )
+		self.traverserList = [ GremlinTraverser.initDataTraverser( sum( data * bulk for data, bulk in dataList ) / sum( bulk for _, bulk in dataList ) ) ]
 
 	def sum( self ):
-		self.traverserList = [
-		GremlinTraverser.initDataTraverser( sum( map( lambda traverser : GremlinTraverser.getDataFromTraverser( traverser ),
-			                                          self.traverserList ) ) )
-		]
+		self.traverserList = [ GremlinTraverser.initDataTraverser( sum( data * bulk for data, bulk in self._dataList() ) ) ]
 
-	def __as( self, * labels ):
-		for traverser in self.traverserList:
-			GremlinTraverser.applyLabels( traverser, labels )
+	def _as( self, * labels ):
+		self.traverserList = ( GremlinTraverser.applyLabels( traverser, labels ) for traverser in self.traverserList )
 
 	def select( self, * labels ):
-		for traverser in self.traverserList:
-			objectId, labelDict, _ = traverser
-			
-			objectIdList = list()
-			for label in labels:
-				objectIdList.append( labelDict.get( label ) )
-			if all( objectIdList ):
-				print( [ '{}:{}'.format( label, objectId ) for label, objectId in zip( labels, objectIdList ) ] )
-		self.terminalStepApplied = True
-
-	def times( self, numberOfTimesToRepeat ):
-		remainingLoops = self.sideEffects.get( 'loops' ) or int( numberOfTimesToRepeat )
-		remainingLoops -= 1
-		
-		self.sideEffects[ 'loops' ] = remainingLoops
-		if remainingLoops == 0:
-			del self.sideEffects[ 'loops' ]
+		# Maps each traverser carrying all of the labels to a dict from each label to the object it was applied to.
+		def traverserMapper( traverser ):
+			_, labelDict, _, bulk = traverser
+			objectIdList = [ labelDict.get( label ) for label in labels ]
+			if None not in objectIdList:
+				selected = { label : GremlinTraverser.reference( self.graphReference, objectId ) for label, objectId in zip( labels, objectIdList ) }
+				yield GremlinTraverser.initDataTraverser( selected, bulk )
+		self.traverserList = ( selectedTraverser for traverser in self.traverserList for selectedTraverser in traverserMapper( traverser ) )
+
+	def _is( self, value ):
+		self.traverserList = filter( lambda traverser : GremlinTraverser.isDataTraverser( traverser ) == (True, value ), self.traverserList )
+
+	def loops( self ):
+		loops = self.loopCount
+		self.traverserList = ( GremlinTraverser.initDataTraverser( loops, GremlinTraverser.bulk( traverser ) ) for traverser in self.traverserList )
+
+	def simplePath( self ):
+		def isSimple( traverser ):
+			pathList = GremlinTraverser.pathList( traverser )
+			return len( set( pathList ) ) == len( pathList )
+		self.traverserList = filter( isSimple, self.traverserList )
+
+	def _repeat( self, runBody, times=None, until=None, emit=None, untilFirst=False, emitFirst=False ):
+		# Runs a repeat() loop breadth first: runBody( traversal ) applies the repeated steps to the traversal's whole
+		# traverser set, once per iteration. until and emit are predicates taking ( traversal, traverser ); untilFirst and
+		# emitFirst are set when the modulator precedes repeat(), in which case it also applies before the first iteration.
+		if until is None and emit is None and times is not None:
+			# Every traverser stays in the loop, so the loop needs no per-traverser bookkeeping and frontier mode
+			# keeps working on whole frontiers.
+			outerLoops = self.loopCount
+			for self.loopCount in range( int( times ) ):
+				runBody( self )
+			self.loopCount = outerLoops
+			return
+		self.traverserList = self._loop( self.traverserList, runBody, times, until, emit, untilFirst, emitFirst )
+
+	def _loop( self, traversers, runBody, times, until, emit, untilFirst, emitFirst ):
+		# Yields the traversers leaving the loop as each iteration completes, so that steps such as limit() can stop
+		# the loop early. The loop runs on a traversal of its own, whose loopCount attribute counts completed iterations.
+		loopTraversal = type( self )( self.graphReference, trackPaths=self.trackPaths )
+		loopTraversal.computedProperties = self.computedProperties
+		merge = list if self.trackPaths else GremlinTraverser.merge
+
+		def partition( traversers, until, emit ):
+			remaining, exited = list(), list()
+			for traverser in traversers:
+				if until is not None and until( loopTraversal, traverser ):
+					exited.append( traverser )
+					continue
+				if emit is not None and emit( loopTraversal, traverser ):
+					exited.append( traverser )
+				remaining.append( traverser )
+			return remaining, exited
+
+		remaining, exited = partition( traversers, until if untilFirst else None, emit if emitFirst else None )
+		yield from merge( exited )
+		while len( remaining ) > 0:
+			if loopTraversal.loopCount >= GremlinTraversal.MAX_LOOPS:
+				raise LoopLimitExceededError( 'repeat() did not terminate within {} loops'.format( GremlinTraversal.MAX_LOOPS ) )
+			loopTraversal.traverserList = remaining
+			runBody( loopTraversal )
+			loopTraversal.loopCount += 1
+			# Traversers reaching the same vertex in the same iteration are merged, which bounds the size of each
+			# iteration by the number of vertices rather than the number of walks.
+			remaining = merge( loopTraversal.traverserList )
+			if times is not None and loopTraversal.loopCount >= int( times ):
+				yield from remaining
+				return
+			remaining, exited = partition( remaining, until, emit )
+			yield from merge( exited )
+
+	def limit( self, amount ):
+		self.traverserList = GremlinTraversal._limit( self.traverserList, int( amount ) )
+
+	def next( self, amount=1 ):
+		self.traverserList = list( GremlinTraversal._limit( self.traverserList, int( amount ) ) )
+		if len( self.traverserList ) == 0:
+			raise NoSuchElementError( 'the traversal has no more results' )
+
+	def tryNext( self ):
+		self.traverserList = list( GremlinTraversal._limit( self.traverserList, 1 ) )
+
+	def hasNext( self ):
+		hasNext = next( iter( self.traverserList ), None ) is not None
+		self.traverserList = [ GremlinTraverser.initDataTraverser( hasNext ) ]
+
+class GremlinFrontierTraversal( GremlinTraversal ):
+	# Executes steps over the whole traverser set at once. The traverser set is held as a frontier - an array of vertex
+	# ids (or of data values) plus an optional array of bulks - and steps become array operations over the graph's
+	# adjacency. Steps without a frontier implementation read traverserList, which turns the frontier back into
+	# ordinary traversers, so this mode can run any query which does not use paths or labels.
+	VERTEX, DATA = 'VERTEX', 'DATA'
+
+	@property
+	def traverserList( self ):
+		if self.frontier is not None:
+			kind, items, bulks = self.frontier
+			bulks = bulks if bulks is not None else itertools.repeat( 1 )
+			if kind == GremlinFrontierTraversal.VERTEX:
+				self._traverserList = [ GremlinTraverser.init( vertexId, bulk=bulk ) for vertexId, bulk in zip( items, bulks ) ]
+			else:
+				self._traverserList = [ GremlinTraverser.initDataTraverser( data, bulk ) for data, bulk in zip( items, bulks ) ]
+			self.frontier = None
+		return self._traverserList
+
+	@traverserList.setter
+	def traverserList( self, traverserList ):
+		self.frontier = None
+		self._traverserList = traverserList
+
+	def results( self ):
+		# Reads the results straight off the frontier, without turning it back into traversers.
+		if self.frontier is None:
+			yield from GremlinTraversal.results( self )
+			return
+		kind, items, bulks = self.frontier
+		for item, bulk in zip( items, bulks if bulks is not None else itertools.repeat( 1 ) ):
+			result = GremlinTraverser.reference( self.graphReference, item ) if kind == GremlinFrontierTraversal.VERTEX else item
+			for _ in range( bulk ):
+				yield result
+
+	def _setFrontier( self, kind, items, bulks=None ):
+		# bulks of None means every item has a bulk of 1.
+		self._traverserList = None
+		self.frontier = (kind, items, bulks)
+
+	def _getFrontier( self, kind ):
+		if self.frontier is None:
+			self.materialize()
+			isVertexFrontier = kind == GremlinFrontierTraversal.VERTEX
+			items, bulks = list(), list()
+			# Traversers are only merged chunk by chunk, so the same vertex may turn up many times. A vertex frontier
+			# holds each vertex once, with the bulks of its traversers summed.
+			vertexBulks = dict()
+			for traverser in self.traverserList:
+				objectId, labelDict, _, bulk = traverser
+				isDataTraverser, data = GremlinTraverser.isDataTraverser( traverser )
+				if isVertexFrontier and ( isDataTraverser or labelDict is not GremlinTraverser.EMPTY_LABEL_DICT or
+					                      objectId not in self.graphReference.V() ):
+					return None
+				if not isVertexFrontier and not isDataTraverser:
+					return None
+				if isVertexFrontier:
+					vertexBulks[ objectId ] = vertexBulks.get( objectId, 0 ) + bulk
+				else:
+					items.append( data )
+					bulks.append( bulk )
+			if isVertexFrontier:
+				items, bulks = list( vertexBulks ), list( vertexBulks.values() )
+			self._setFrontier( kind, items, bulks )
+
+		frontierKind, items, bulks = self.frontier
+		if frontierKind != kind:
 			return None
-		return -1
+		return items, bulks
 
-	def next( self ):
-		self.materialize()
+	def _filterFrontier( self, kind, predicate ):
+		items, bulks = self.frontier[ 1 : ]
+		if bulks is None:
+			self._setFrontier( kind, [ item for item in items if predicate( item ) ] )
+		else:
+			selected = [ (item, bulk) for item, bulk in zip( items, bulks ) if predicate( item ) ]
+			self._setFrontier( kind, [ item for item, _ in selected ], [ bulk for _, bulk in selected ] )
+
+	def _dataFrontier( self ):
+		# Returns (values, bulks) for a data frontier, with bulks always materialized.
+		frontier = self._getFrontier( GremlinFrontierTraversal.DATA )
+		if frontier is None:
+			return None
+		items, bulks = frontier
+		return items, bulks if bulks is not None else [ 1 ] * len( items )
+
+	def _isVertexScan( self ):
+		return self.frontier is not None and self.vertexScan is not None and self.frontier[ 1 ] is self.vertexScan
+
+	def _traverserCounts( self ):
+		if self.frontier is None:
+			return GremlinTraversal._traverserCounts( self )
+		_, items, bulks = self.frontier
+		return len( items ), sum( bulks ) if bulks is not None else len( items )
+
+	def V( self, * arguments ):
+		if len( arguments ) > 0:
+			return GremlinTraversal.V( self, * arguments )
+		self.vertexScan = self.vertexScanIds = GremlinVertexScan( self.graphReference )
+		self._setFrontier( GremlinFrontierTraversal.VERTEX, self.vertexScan )
+
+	def _expand( self, direction, edgeLabel ):
+		frontier = self._getFrontier( GremlinFrontierTraversal.VERTEX )
+		if frontier is None:
+			return GremlinTraversal._expand( self, direction, edgeLabel )
+		vertexIds, bulks = frontier
+		bulks = bulks if bulks is not None else itertools.repeat( 1 )
+		self._setFrontier( GremlinFrontierTraversal.VERTEX, * self.graphReference.expandFrontier( vertexIds, bulks, direction, edgeLabel ) )
+
+	def hasLabel( self, * labels ):
+		if self._getFrontier( GremlinFrontierTraversal.VERTEX ) is None:
+			return GremlinTraversal.hasLabel( self, * labels )
+		if self.graphReference.hasLabelIndex():
+			matchingVertexIds = set().union( * [ self.graphReference.lookupLabel( label ) for label in labels ] )
+			if self._isVertexScan():
+				self._setFrontier( GremlinFrontierTraversal.VERTEX, list( matchingVertexIds ) )
+			else:
+				self._filterFrontier( GremlinFrontierTraversal.VERTEX, matchingVertexIds.__contains__ )
+		else:
+			labels = set( labels )
+			self._filterFrontier( GremlinFrontierTraversal.VERTEX,
+				                  lambda vertexId : not labels.isdisjoint( self.graphReference.getGraphObjectReference( vertexId ).labels ) )
+
+	def has( self, * arguments ):
+		if len( arguments ) != 2 or self._getFrontier( GremlinFrontierTraversal.VERTEX ) is None:
+			return GremlinTraversal.has( self, * arguments )
+		propertyName, propertyValue = arguments
+		if self.graphReference.hasPropertyIndex( propertyName ):
+			matchingVertexIds = self.graphReference.lookupProperty( propertyName, propertyValue )
+			if self._isVertexScan():
+				self._setFrontier( GremlinFrontierTraversal.VERTEX, list( matchingVertexIds ) )
+			else:
+				self._filterFrontier( GremlinFrontierTraversal.VERTEX, matchingVertexIds.__contains__ )
+		else:
+			self._filterFrontier( GremlinFrontierTraversal.VERTEX,
+				                  lambda vertexId : self.graphReference.getGraphObjectReference( vertexId ).getProperty( propertyName ) == propertyValue )
+
+	def values( self, * propertyNames ):
+		if len( propertyNames ) != 1 or self._getFrontier( GremlinFrontierTraversal.VERTEX ) is None:
+			return GremlinTraversal.values( self, * propertyNames )
+		propertyName, = propertyNames
+		vertexIds, bulks = self.frontier[ 1 : ]
+		bulks = bulks if bulks is not None else itertools.repeat( 1 )
+		values, valueBulks = list(), list()
+		computedValues = self.computedProperties.get( propertyName )
+		for vertexId, bulk in zip( vertexIds, bulks ):
+			if computedValues is not None:
+				value = computedValues.get( vertexId )
+			else:
+				value = self.graphReference.getGraphObjectReference( vertexId ).getProperty( propertyName )
+			if value is not None:
+				values.append( value )
+				valueBulks.append( bulk )
+		self._setFrontier( GremlinFrontierTraversal.DATA, values, valueBulks )
+
+	def dedup( self ):
+		if self.frontier is not None and self.frontier[ 0 ] == GremlinFrontierTraversal.VERTEX:
+			# Vertex frontiers hold each vertex once, as _getFrontier merges them, so only the bulks need resetting.
+			self._setFrontier( GremlinFrontierTraversal.VERTEX, self.frontier[ 1 ] )
+			return
+		dataFrontier = self._dataFrontier()
+		if dataFrontier is None:
+			return GremlinTraversal.dedup( self )
+		values, _ = dataFrontier
+		try:
+			self._setFrontier( GremlinFrontierTraversal.DATA, list( dict.fromkeys( values ) ) )
+		except TypeError:
+			GremlinTraversal.dedup( self )
+
+	def hasId( self, * ids ):
+		if self._getFrontier( GremlinFrontierTraversal.VERTEX ) is None:
+			return GremlinTraversal.hasId( self, * ids )
+		ids = { int( id_ ) for id_ in ids }
+		if self._isVertexScan():
+			self._setFrontier( GremlinFrontierTraversal.VERTEX, [ id_ for id_ in ids if id_ in self.vertexScan ] )
+		else:
+			self._filterFrontier( GremlinFrontierTraversal.VERTEX, ids.__contains__ )
+
+	def _degreeCount( self, direction, edgeLabel ):
+		frontier = self._getFrontier( GremlinFrontierTraversal.VERTEX )
+		if frontier is None:
+			return GremlinTraversal._degreeCount( self, direction, edgeLabel )
+		vertexIds, bulks = frontier
+		bulks = bulks if bulks is not None else itertools.repeat( 1 )
+		self._setFrontier( GremlinFrontierTraversal.DATA, [ sum( bulk * self._degree( vertexId, direction, edgeLabel ) for vertexId, bulk in zip( vertexIds, bulks ) ) ] )
+
+	def count( self ):
+		if self.frontier is None:
+			return GremlinTraversal.count( self )
+		_, items, bulks = self.frontier
+		self._setFrontier( GremlinFrontierTraversal.DATA, [ len( items ) if bulks is None else sum( bulks ) ] )
+
+	def sum( self ):
+		dataFrontier = self._dataFrontier()
+		if dataFrontier is None:
+			return GremlinTraversal.sum( self )
+		self._setFrontier( GremlinFrontierTraversal.DATA, [ sum( map( operator.mul, * dataFrontier ) ) ] )
+
+	def mean( self ):
+		dataFrontier = self._dataFrontier()
+		if dataFrontier is None or len( dataFrontier[ 0 ] ) == 0:
+			return GremlinTraversal.mean( self )
+		values, bulks = dataFrontier
+		self._setFrontier( GremlinFrontierTraversal.DATA, [ sum( map( operator.mul, values, bulks ) ) / sum( bulks ) ] )
+
+	def min( self ):
+		dataFrontier = self._dataFrontier()
+		if dataFrontier is None:
+			return GremlinTraversal.min( self )
+		self._setFrontier( GremlinFrontierTraversal.DATA, [ min( dataFrontier[ 0 ] ) ] )
+
+	def max( self ):
+		dataFrontier = self._dataFrontier()
+		if dataFrontier is None:
+			return GremlinTraversal.max( self )
+		self._setFrontier( GremlinFrontierTraversal.DATA, [ max( dataFrontier[ 0 ] ) ] )
+
+class GremlinQueryPlan:
+	def __init__( self, steps, traversalClass, requiresPaths, scanStep=None, combiner=None, template=None, dependencies=None ):
+		# Each step is a callable taking ( traversal, parameters ), where parameters holds the literals of the query in
+		# the order they appear. Plans are therefore independent of the literal values and can be shared between queries.
+		self.steps = steps
+		self.traversalClass = traversalClass
+		self.requiresPaths = requiresPaths
+		# scanStep is 'V' or 'E' when the query starts from a full scan which can be split into partitions and run in
+		# parallel; combiner then names the final step whose per-partition results are combined, if any.
+		self.scanStep = scanStep
+		self.combiner = combiner
+		# The normalised query text, and the ( kind, slot ) templates of the graph versions the query's results depend
+		# on, completed by dependencyKeys(); dependencies is None when the results cannot be cached.
+		self.template = template
+		self.dependencies = dependencies
+		# For a query ending in explain(), the lines describing its plan, which are its results instead of running it.
+		self.explanation = None
+		# A query ending in profile() runs with a GremlinProfiler, and its profile is its only result.
+		self.profile = False
+		# The Gremlin text of each step, for the step hooks, with a '{slot!r}' placeholder for each literal.
+		self.stepNames = None
+		# Whether the query changes the graph, and so must not run alongside other queries on it.
+		self.mutates = False
+
+	def dependencyKeys( self, parameters ):
+		return [ kind if slot is None else (kind, parameters[ slot ]) for kind, slot in self.dependencies ]
+
+	def __repr__( self ):
+		return 'GremlinQueryPlan @{} steps={} traversalClass={} requiresPaths={}'.format( id( self ), len( self.steps ),
+			                                                                             self.traversalClass.__name__, self.requiresPaths )
 
 class GremlinExecutionEngine:
-	def __init__( self ):
+	PLAN_CACHE_CAPACITY = 256
+	RESULT_CACHE_CAPACITY = 1024
+	# Queries with more results than this are not cached.
+	MAX_CACHED_RESULTS = 10000
+	# Steps whose results only depend on the traversers reaching them, and so add no dependency on the graph.
+	DEPENDENCY_FREE_STEPS = { 'count', 'sum', 'mean', 'min', 'max', 'dedup', 'fold', 'path', 'simplePath', 'limit', 'next', 'tryNext',
+	                          'hasNext', 'as', 'select', 'is', 'loops', 'repeat', 'times', 'until', 'emit', 'hasId' }
+	# Steps computing a value for every vertex, mapped to the position of their edge label argument.
+	ANALYTICS_STEPS = { 'pageRank' : 1, 'connectedComponent' : 1, 'degreeCentrality' : 2 }
+	# Final steps whose results are plain values. The results of any other query may hold vertex references, whose
+	# labels change when a vertex is given another one.
+	VALUE_STEPS = { 'count', 'sum', 'mean', 'min', 'max', 'values', 'loops', 'hasNext' }
+	# Steps which modulate an adjacent repeat() rather than running on their own.
+	REPEAT_MODULATORS = { 'times', 'until', 'emit' }
+	# Steps which change the graph.
+	MUTATING_STEPS = { 'addV', 'addE', 'property' }
+	# Steps whose result depends on traversers outside of their own partition, or which have side effects, and so
+	# keep a query from running in parallel. Those listed in COMBINERS are allowed as the final step.
+	UNPARTITIONABLE_STEPS = MUTATING_STEPS | { 'as', 'select', 'limit', 'next', 'tryNext', 'hasNext', 'branch',
+	                                           'count', 'sum', 'min', 'max', 'mean', 'dedup', 'fold' } | set( ANALYTICS_STEPS )
+	# Each partition is reduced by the combiner's first function to a picklable partial result; the second function
+	# combines the partial results of all partitions into the final traversers.
+	COMBINERS = {
+	'count' : ( lambda traversers : sum( GremlinTraverser.bulk( traverser ) for traverser in traversers ),
+	            lambda partials : [ GremlinTraverser.initDataTraverser( sum( partials ) ) ] ),
+	'sum' : ( lambda traversers : sum( GremlinTraverser.getDataFromTraverser( traverser ) * GremlinTraverser.bulk( traverser ) for traverser in traversers ),
+	          lambda partials : [ GremlinTraverser.initDataTraverser( sum( partials ) ) ] ),
+	'mean' : ( lambda traversers : GremlinExecutionEngine._weightedTotal( traversers ),
+	           lambda partials : [ GremlinExecutionEngine._weightedMean( partials ) ] ),
+	'min' : ( lambda traversers : min( ( GremlinTraverser.getDataFromTraverser( traverser ) for traverser in traversers ), default=None ),
+	          lambda partials : [ GremlinTraverser.initDataTraverser( min( partial for partial in partials if partial is not None ) ) ] ),
+	'max' : ( lambda traversers : max( ( GremlinTraverser.getDataFromTraverser( traverser ) for traverser in traversers ), default=None ),
+	          lambda partials : [ GremlinTraverser.initDataTraverser( max( partial for partial in partials if partial is not None ) ) ] ),
+	'dedup' : ( lambda traversers : list( GremlinTraversal._dedup( traversers ) ),
+	            lambda partials : list( GremlinTraversal._dedup( itertools.chain.from_iterable( partials ) ) ) ),
+	'fold' : ( lambda traversers : [ GremlinTraverser.getDataFromTraverser( traverser ) for traverser in traversers for _ in range( GremlinTraverser.bulk( traverser ) ) ],
+	           lambda partials : [ GremlinTraverser.initDataTraverser( list( itertools.chain.from_iterable( partials ) ) ) ] ),
+	# Steps which reduce a partition to a single value by themselves have no partial function: they run in the
+	# partition, and their values are combined.
+	'outDegreeCount' : ( None, lambda partials : [ GremlinTraverser.initDataTraverser( sum( partials ) ) ] ),
+	'bothDegreeCount' : ( None, lambda partials : [ GremlinTraverser.initDataTraverser( sum( partials ) ) ] ),
+	}
+	# The scan is split into this many partitions per worker, so that uneven partitions even out across workers.
+	PARTITIONS_PER_WORKER = 4
+
+	def __init__( self, workers=1 ):
 		self.g = sample_graph.TinkerPopModernGraph.get()
-		self.stack = list()
-		self.stackFrameIndex = 0
 
 		self.controlSteps = {
-		'repeat' : self.__repeat,
-		'branch' : self.__branch,
+		'branch' : self.__compileBranch,
 		}
 
 		self.variables = dict()
+		self.planCache = LRUCache( GremlinExecutionEngine.PLAN_CACHE_CAPACITY )
+		# Maps ( template, parameters ) to ( graph version, dependency versions, results ) for read-only queries. An
+		# entry stays valid while the graph is unchanged, or while none of the versions it depends on has changed.
+		self.resultCache = LRUCache( GremlinExecutionEngine.RESULT_CACHE_CAPACITY )
+
+		# With more than one worker, partitionable queries run in a process pool whose workers map a snapshot of the
+		# graph. The snapshot is taken when the pool is first used, and the pool is started again on a new snapshot
+		# when a query finds that the graph has changed since; snapshotVersion is the graph version it was taken at.
+		self.workers = workers
+		self.executor = None
+		self.executorLock = threading.Lock()
+		self.temporarySnapshotPath = None
+		self.snapshotVersion = None
+
+		# GremlinStepHook objects called around every step run. Without any, steps run with no overhead at all.
+		self.stepHooks = list()
+
+	def addStepHook( self, stepHook ):
+		self.stepHooks = self.stepHooks + [ stepHook ]
+
+	def removeStepHook( self, stepHook ):
+		self.stepHooks = [ hook for hook in self.stepHooks if hook is not stepHook ]
 
 	def setGraph( self, graph ):
 		self.g = graph
+		self.resultCache.clear()
+		self.close()
+
+	def close( self ):
+		with self.executorLock:
+			self.__closeExecutor()
+
+	def __closeExecutor( self ):
+		if self.executor is not None:
+			self.executor.shutdown()
+			self.executor = None
+		if self.temporarySnapshotPath is not None:
+			os.remove( self.temporarySnapshotPath )
+			self.temporarySnapshotPath = None
+		self.snapshotVersion = None
+
+	def run( self, gremlinQuery ):
+		plan, parameters = self.compile( gremlinQuery )
+		return self.__run( gremlinQuery, plan, parameters )
+
+	def __run( self, gremlinQuery, plan, parameters ):
+		traversal = plan.traversalClass( self.g, trackPaths=plan.requiresPaths )
+		if plan.explanation is not None:
+			traversal.traverserList = [ GremlinTraverser.initDataTraverser( line ) for line in plan.explanation ]
+			return traversal
+		if plan.profile or len( self.stepHooks ) > 0:
+			self.__execHooked( gremlinQuery, traversal, plan, parameters )
+		else:
+			traverserList = self.__runParallel( gremlinQuery, plan ) if self.workers > 1 and plan.scanStep is not None else None
+			if traverserList is not None:
+				traversal.traverserList = traverserList
+			else:
+				self.__exec( traversal, plan.steps, parameters )
+		return traversal
+
+	def __runParallel( self, gremlinQuery, plan ):
+		# The lock is held while the query runs, so that the pool is never restarted under a query using it. Each query
+		# keeps every worker busy, so holding it costs no parallelism. Returns None when the graph has ids a snapshot
+		# cannot hold, for the query to run in this process.
+		with self.executorLock:
+			version = self.g.version
+			if self.executor is not None and self.snapshotVersion != version:
+				self.__closeExecutor()
+			if self.executor is None:
+				snapshotPath = getattr( self.g.graph, 'snapshotPath', None )
+				if snapshotPath is None:
+					fileDescriptor, snapshotPath = tempfile.mkstemp( suffix='.snapshot' )
+					os.close( fileDescriptor )
+					try:
+						GraphSnapshot.save( self.g.graph, snapshotPath )
+					except UnsupportedIdError:
+						os.remove( snapshotPath )
+						return None
+					self.temporarySnapshotPath = snapshotPath
+				self.executor = ProcessPoolExecutor( max_workers=self.workers, initializer=gremlinworker.initWorker, initargs=(snapshotPath,) )
+				self.snapshotVersion = version
+
+			objectCount = len( self.g.V() if plan.scanStep == 'V' else self.g.E() )
+			partitionCount = self.workers * GremlinExecutionEngine.PARTITIONS_PER_WORKER
+			bounds = [ objectCount * partition // partitionCount for partition in range( partitionCount + 1 ) ]
+			partials = list( self.executor.map( gremlinworker.runPartition, itertools.repeat( gremlinQuery ), bounds[ : -1 ], bounds[ 1 : ] ) )
+		if plan.combiner is None:
+			return list( itertools.chain.from_iterable( partials ) )
+		_, combine = GremlinExecutionEngine.COMBINERS[ plan.combiner ]
+		return combine( partials )
+
+	@staticmethod
+	def _weightedTotal( traversers ):
+		total, bulks = 0, 0
+		for traverser in traversers:
+			total += GremlinTraverser.getDataFromTraverser( traverser ) * GremlinTraverser.bulk( traverser )
+			bulks += GremlinTraverser.bulk( traverser )
+		return total, bulks
+
+	@staticmethod
+	def _weightedMean( partials ):
+		bulks = sum( partialBulks for _, partialBulks in partials )
+		if bulks == 0:
+			raise statistics.StatisticsError( 'mean requires at least one data point' )
+		return GremlinTraverser.initDataTraverser( sum( total for total, _ in partials ) / bulks )
+
+	def runPartition( self, gremlinQuery, start, stop ):
+		# Runs a partitionable query over objects [ start, stop ) of its scan, returning the partition's traversers, or
+		# its partial result when the query ends in a combined step.
+		plan, parameters = self.compile( gremlinQuery )
+		traversal = plan.traversalClass( self.g, trackPaths=plan.requiresPaths )
+		scan = self.g.V() if plan.scanStep == 'V' else self.g.E()
+		traversal.traverserList = [ traversal._initTraverser( objectId ) for objectId in itertools.islice( scan, start, stop ) ]
+		if plan.combiner is None:
+			self.__exec( traversal, plan.steps[ 1 : ], parameters )
+			return list( traversal.traverserList )
+		partial, _ = GremlinExecutionEngine.COMBINERS[ plan.combiner ]
+		if partial is None:
+			self.__exec( traversal, plan.steps[ 1 : ], parameters )
+			valueTraverser, = traversal.traverserList
+			return GremlinTraverser.getDataFromTraverser( valueTraverser )
+		self.__exec( traversal, plan.steps[ 1 : -1 ], parameters )
+		return partial( traversal.traverserList )
 
 	def exec( self, gremlinQuery ):
-		traversal = GremlinTraversal( self.g )
+		# Returns an iterator over the query's results: GremlinVertexReference, GremlinEdgeReference and GremlinPath
+		# objects, dicts from select(), and plain Python values.
+		plan, parameters = self.compile( gremlinQuery )
+		# While there are step hooks, every query runs its steps for them to observe.
+		if plan.dependencies is None or len( self.stepHooks ) > 0:
+			return self.__run( gremlinQuery, plan, parameters ).results()
+
+		cacheKey, dependencyKeys = (plan.template, tuple( parameters )), plan.dependencyKeys( parameters )
+		entry = self.resultCache.get( cacheKey, isValid=lambda entry : self.__isCurrent( entry, dependencyKeys ) )
+		if entry is not None:
+			_, _, results = entry
+			return iter( results )
+
+		# The versions are read before running the query, so that a concurrent mutation leaves the entry stale.
+		version, dependencyVersions = self.g.version, [ self.g.dependencyVersion( key ) for key in dependencyKeys ]
+		results = self.__run( gremlinQuery, plan, parameters ).results()
+		head = list( itertools.islice( results, GremlinExecutionEngine.MAX_CACHED_RESULTS + 1 ) )
+		if len( head ) > GremlinExecutionEngine.MAX_CACHED_RESULTS:
+			return itertools.chain( head, results )
+		self.resultCache.put( cacheKey, (version, dependencyVersions, head) )
+		return iter( head )
+
+	def __isCurrent( self, entry, dependencyKeys ):
+		version, dependencyVersions, _ = entry
+		if version == self.g.version:
+			return True
+		return all( self.g.dependencyVersion( key ) == dependencyVersion for key, dependencyVersion in zip( dependencyKeys, dependencyVersions ) )
+
+	def cacheStats( self ):
+		return { 'plans' : self.planCache.stats(), 'results' : self.resultCache.stats() }
+
+	def compile( self, gremlinQuery ):
+		# Plans are cached by the normalised query text, so repeated queries which differ only in their literals skip
+		# tokenizing and step lookup entirely.
+		template, parameters = GremlinParser.normalize( gremlinQuery )
+		plan = self.planCache.get( template )
+		if plan is not None:
+			return plan, parameters
+
 		gremlinTokenList = GremlinParser.parse( gremlinQuery )
+		finalStep = gremlinTokenList[ -1 ].functionName if len( gremlinTokenList ) > 0 and gremlinTokenList[ -1 ].tokenType == GremlinToken.GREMLIN_FUNCTION else None
+		explain, profile = finalStep == 'explain', finalStep == 'profile'
+		if explain or profile:
+			gremlinTokenList = gremlinTokenList[ : -1 ]
+		optimizedTokenList = GremlinOptimizer.optimize( gremlinTokenList )
+		requiresPaths = GremlinTraversal.usesSteps( optimizedTokenList, GremlinTraversal.PATH_STEPS )
+		# Queries which neither read paths, use labels nor stop early run in frontier mode.
+		if requiresPaths or GremlinTraversal.usesSteps( optimizedTokenList, GremlinTraversal.LABEL_STEPS | GremlinTraversal.LAZY_STEPS ):
+			traversalClass = GremlinTraversal
+		else:
+			traversalClass = GremlinFrontierTraversal
+
+		literals, slots, stepNames = list(), itertools.count(), list()
+		steps = self.__compile( optimizedTokenList, traversalClass, literals, stepNames )
+		dependencies = GremlinExecutionEngine.__dependencies( gremlinTokenList, slots )
+		# The dependencies refer to literals by position, so they are only usable if they were numbered alike. Profiles
+		# measure a run, so they are never cached.
+		if next( slots ) != len( literals ) or explain or profile:
+			dependencies = None
+		plan = GremlinQueryPlan( steps, traversalClass, requiresPaths, * GremlinExecutionEngine.__partitioning( optimizedTokenList ),
+			                     template=template, dependencies=dependencies )
+		plan.profile, plan.stepNames = profile, stepNames
+		plan.mutates = GremlinTraversal.usesSteps( gremlinTokenList, GremlinExecutionEngine.MUTATING_STEPS )
+		if explain:
+			# The explanation depends on the literals and on the graph's statistics, so the plan is not cached.
+			plan.explanation = self.__explain( gremlinTokenList, optimizedTokenList, plan, literals )
+			return plan, literals
+		# Only cache the plan when the parameters extracted from the query text agree with the parser.
+		if literals == parameters:
+			self.planCache.put( template, plan )
+		return plan, literals
+
+	def __explain( self, gremlinTokenList, optimizedTokenList, plan, literals ):
+		explanation = [ 'query: {}'.format( GremlinOptimizer.render( gremlinTokenList ) ),
+		                'optimized: {}'.format( GremlinOptimizer.render( optimizedTokenList ) ) ]
+		if plan.traversalClass is GremlinFrontierTraversal:
+			explanation.append( 'execution: frontier' )
+		else:
+			explanation.append( 'execution: lazy pipeline, paths {}'.format( 'tracked' if plan.requiresPaths else 'not tracked' ) )
+		functionTokens = [ gremlinToken for gremlinToken in optimizedTokenList if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION ]
+		for position, filterTokens in GremlinExecutionEngine.__filterGroups( functionTokens ):
+			atVertexScan = position > 0 and functionTokens[ position - 1 ].functionName == 'V' and len( functionTokens[ position - 1 ].argumentList ) == 0
+			filters = [ (gremlinToken.functionName, [ argument.literal for argument in gremlinToken.argumentList ]) for gremlinToken in filterTokens ]
+			orderedFilters = list()
+			for functionName, arguments in GremlinOptimizer.orderFilters( self.g, filters, atVertexScan ):
+				estimate, indexed = GremlinOptimizer.estimate( self.g, functionName, arguments )
+				orderedFilters.append( '{} ~{:.0f}{}'.format( GremlinOptimizer.renderStep( functionName, [ repr( argument ) for argument in arguments ] ),
+					                                          estimate, ' (index)' if indexed else str() ) )
+			explanation.append( 'filters: {}'.format( ', '.join( orderedFilters ) ) )
+		if plan.scanStep is not None:
+			explanation.append( 'parallel: {}() scan{}'.format( plan.scanStep, ', combined by {}'.format( plan.combiner ) if plan.combiner is not None else str() ) )
+		dependencies = GremlinExecutionEngine.__dependencies( gremlinTokenList, itertools.count() )
+		if dependencies is None:
+			explanation.append( 'result cache: not cacheable' )
+		else:
+			plan.dependencies = dependencies
+			explanation.append( 'result cache: depends on {}'.format( plan.dependencyKeys( literals ) ) )
+			plan.dependencies = None
+		return explanation
 
-		self.__exec( traversal, gremlinTokenList )
+	@staticmethod
+	def __filterGroups( functionTokens ):
+		# Yields ( position, tokens ) for each run of at least two adjacent filter steps with literal arguments.
+		position = 0
+		while position < len( functionTokens ):
+			end = position
+			while ( end < len( functionTokens ) and functionTokens[ end ].functionName in GremlinOptimizer.FILTER_STEPS and
+				    all( argument.tokenType == GremlinToken.GREMLIN_LITERAL for argument in functionTokens[ end ].argumentList ) ):
+				end += 1
+			if end - position >= 2:
+				yield position, functionTokens[ position : end ]
+			position = max( end, position + 1 )
 
-	def __exec( self, traversal, gremlinTokenList ):
-		self.stack.append( self.stackFrameIndex )
-		self.stackFrameIndex += 1
-		
-		pc = 0
+	@staticmethod
+	def __partitioning( gremlinTokenList ):
+		# Returns ( scanStep, combiner ) for a query starting with a full V() or E() scan and otherwise made only of steps
+		# which treat each traverser on its own, save for a final step with a combiner; ( None, None ) otherwise.
+		functionTokens = [ gremlinToken for gremlinToken in gremlinTokenList if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION ]
+		if len( functionTokens ) == 0 or functionTokens[ 0 ].functionName not in ('V', 'E') or len( functionTokens[ 0 ].argumentList ) > 0:
+			return None, None
+		combiner = functionTokens[ -1 ].functionName if functionTokens[ -1 ].functionName in GremlinExecutionEngine.COMBINERS else None
+		remainingTokens = functionTokens[ 1 : -1 ] if combiner is not None else functionTokens[ 1 : ]
+		if GremlinTraversal.usesSteps( remainingTokens, GremlinExecutionEngine.UNPARTITIONABLE_STEPS | { 'V', 'E' } ):
+			return None, None
+		return functionTokens[ 0 ].functionName, combiner
 
-		while pc < len( gremlinTokenList ):
-			gremlinToken = gremlinTokenList[ pc ]
+	@staticmethod
+	def __dependencies( gremlinTokenList, slots ):
+		# Returns the ( kind, slot ) templates of the graph versions a query's results depend on, where slot is the
+		# position among the query's literals of the label or property name completing the key, or None for keys which
+		# need no completing; None when the query has side effects or uses a step not known here.
+		dependencies = GremlinExecutionEngine.__stepDependencies( gremlinTokenList, slots )
+		functionTokens = [ gremlinToken for gremlinToken in gremlinTokenList if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION ]
+		if dependencies is not None and ( len( functionTokens ) == 0 or functionTokens[ -1 ].functionName not in GremlinExecutionEngine.VALUE_STEPS ):
+			dependencies.append( (Graph.VERTEX_LABELS, None) )
+		return dependencies
 
-			if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION:
-				functionName, argumentList = gremlinToken.functionName, gremlinToken.argumentList
-				pc += self.__executeStep( traversal, functionName, argumentList ) or 1
+	@staticmethod
+	def __stepDependencies( gremlinTokenList, slots ):
+		dependencies = list()
+		functionTokens = [ gremlinToken for gremlinToken in gremlinTokenList if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION ]
+		for position, gremlinToken in enumerate( functionTokens ):
+			functionName, argumentSlots = gremlinToken.functionName, list()
+			for argument in gremlinToken.argumentList:
+				if argument.tokenType == GremlinToken.GREMLIN_LITERAL:
+					argumentSlots.append( next( slots ) )
+				elif argument.tokenType == GremlinToken.GREMLIN_FUNCTION:
+					argumentDependencies = GremlinExecutionEngine.__stepDependencies( [ argument ], slots )
+					if argumentDependencies is None:
+						return None
+					dependencies.extend( argumentDependencies )
+
+			if functionName in GremlinExecutionEngine.DEPENDENCY_FREE_STEPS:
+				continue
+			if functionName == 'V':
+				# A full scan narrowed straight away by a label or a property only depends on that label or property.
+				nextFunctionName = functionTokens[ position + 1 ].functionName if position + 1 < len( functionTokens ) else None
+				if len( argumentSlots ) > 0 or nextFunctionName not in ('hasLabel', 'has'):
+					dependencies.append( (Graph.VERTICES, None) )
+			elif functionName == 'E':
+				dependencies.append( (Graph.EDGES, None) )
+			elif functionName == 'hasLabel':
+				dependencies.extend( (Graph.VERTEX_LABEL, slot) for slot in argumentSlots )
+			elif functionName == 'has':
+				if len( argumentSlots ) == 0:
+					return None
+				if len( argumentSlots ) == 3:
+					dependencies.append( (Graph.VERTEX_LABEL, argumentSlots[ 0 ]) )
+				dependencies.append( (Graph.PROPERTY, argumentSlots[ -2 if len( argumentSlots ) > 1 else 0 ]) )
+			elif functionName == 'values':
+				dependencies.extend( (Graph.PROPERTY, slot) for slot in argumentSlots )
+				if len( argumentSlots ) == 0:
+					dependencies.append( (Graph.PROPERTIES, None) )
+			elif functionName in ('out', 'both', 'shortestPath', 'khop'):
+				# out() and both() take the edge label first, shortestPath() and khop() second.
+				edgeLabelPosition = 0 if functionName in ('out', 'both') else 1
+				if len( argumentSlots ) > edgeLabelPosition:
+					dependencies.append( (Graph.EDGE_LABEL, argumentSlots[ edgeLabelPosition ]) )
+				else:
+					dependencies.append( (Graph.EDGES, None) )
+				if functionName == 'shortestPath' and len( argumentSlots ) > 2:
+					dependencies.append( (Graph.PROPERTY, argumentSlots[ 2 ]) )
+			elif functionName in GremlinExecutionEngine.ANALYTICS_STEPS:
+				# Analytics steps read every vertex, and the edges with the label given at edgeLabelPosition.
+				edgeLabelPosition = GremlinExecutionEngine.ANALYTICS_STEPS[ functionName ]
+				dependencies.append( (Graph.VERTICES, None) )
+				if len( argumentSlots ) > edgeLabelPosition:
+					dependencies.append( (Graph.EDGE_LABEL, argumentSlots[ edgeLabelPosition ]) )
+				else:
+					dependencies.append( (Graph.EDGES, None) )
 			else:
-				pc += 1
+				return None
+		return dependencies
 
-		self.stack.pop()
-		
-		if len( self.stack ) == 0:
-			for traversalState in traversal._toString():
-				print( '==>{}'.format( traversalState ) )
+	def __exec( self, traversal, steps, parameters ):
+		pc = 0
+		while pc < len( steps ):
+			pc += steps[ pc ]( traversal, parameters ) or 1
+
+	def __execHooked( self, gremlinQuery, traversal, plan, parameters ):
+		# Runs a plan serially, calling the step hooks around each of its top level steps. A query ending in profile()
+		# adds a profiler of its own, innermost so that its timings leave out the other hooks, and its profile replaces
+		# the query's results.
+		stepHooks = list( self.stepHooks )
+		profiler = GremlinProfiler() if plan.profile else None
+		if profiler is not None:
+			stepHooks.append( profiler )
+		stepNames = [ stepName.format( * parameters ) for stepName in plan.stepNames ]
+		for stepHook in stepHooks:
+			stepHook.queryStarted( gremlinQuery )
+		# The hooks learn that the query finished even when one of its steps raises, so that they can release what
+		# they hold, such as the profiler's allocation tracing.
+		try:
+			pc = 0
+			while pc < len( plan.steps ):
+				for stepHook in stepHooks:
+					stepHook.stepStarted( stepNames[ pc ], traversal )
+				jump = plan.steps[ pc ]( traversal, parameters )
+				for stepHook in reversed( stepHooks ):
+					stepHook.stepFinished( stepNames[ pc ], traversal )
+				pc += jump or 1
+		finally:
+			for stepHook in stepHooks:
+				stepHook.queryFinished( gremlinQuery, traversal )
+		if profiler is not None:
+			profile, = profiler.profiles
+			traversal.traverserList = [ GremlinTraverser.initDataTraverser( profile ) ]
+
+	def __compile( self, gremlinTokenList, traversalClass, literals, stepNames=None ):
+		# Appends the name template of each step compiled to stepNames, when given.
+		functionTokens = [ gremlinToken for gremlinToken in gremlinTokenList if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION ]
+		filterGroups = dict( GremlinExecutionEngine.__filterGroups( functionTokens ) )
+		steps = list()
+		position = 0
+		while position < len( functionTokens ):
+			firstSlot = len( literals )
+			# A repeat() compiles into a single loop step together with the modulators on either side of it.
+			end = position
+			while end < len( functionTokens ) and functionTokens[ end ].functionName in GremlinExecutionEngine.REPEAT_MODULATORS:
+				end += 1
+			if end < len( functionTokens ) and functionTokens[ end ].functionName == 'repeat':
+				end += 1
+				while end < len( functionTokens ) and functionTokens[ end ].functionName in GremlinExecutionEngine.REPEAT_MODULATORS:
+					end += 1
+				steps.append( self.__compileRepeat( functionTokens[ position : end ], traversalClass, literals ) )
+			elif position in filterGroups:
+				end = position + len( filterGroups[ position ] )
+				steps.append( self.__compileFilters( filterGroups[ position ], literals ) )
+			else:
+				end = position + 1
+				gremlinToken = functionTokens[ position ]
+				steps.append( self.__compileStep( gremlinToken.functionName, gremlinToken.argumentList, traversalClass, literals ) )
+			if stepNames is not None:
+				stepNames.append( GremlinExecutionEngine.__stepName( functionTokens[ position : end ], itertools.count( firstSlot ) ) )
+			position = end
+		return steps
 
-	def __repeat( self, traversal, functionName, argumentList ):
-		gremlinTokenList = argumentList
-		self.__exec( traversal, gremlinTokenList )
+	@staticmethod
+	def __stepName( functionTokens, slots ):
+		# The Gremlin text of the tokens, with each literal replaced by a placeholder numbered from slots, as the literals
+		# are numbered when compiling.
+		renderedSteps = list()
+		for gremlinToken in functionTokens:
+			renderedArguments = list()
+			for argument in gremlinToken.argumentList:
+				if argument.tokenType == GremlinToken.GREMLIN_LITERAL:
+					renderedArguments.append( '{{{}!r}}'.format( next( slots ) ) )
+				elif argument.tokenType == GremlinToken.GREMLIN_FUNCTION:
+					renderedArguments.append( GremlinExecutionEngine.__stepName( [ argument ], slots ) )
+			renderedSteps.append( GremlinOptimizer.renderStep( gremlinToken.functionName, renderedArguments ) )
+		return '.'.join( renderedSteps )
+
+	def __compileFilters( self, filterTokens, literals ):
+		# Adjacent filters compile into one step, which runs them in the order chosen by GremlinOptimizer for the
+		# query's literals and the graph's statistics.
+		filters = list()
+		for gremlinToken in filterTokens:
+			filters.append( (gremlinToken.functionName, list( range( len( literals ), len( literals ) + len( gremlinToken.argumentList ) ) )) )
+			literals.extend( argument.literal for argument in gremlinToken.argumentList )
+
+		def filterStep( traversal, parameters ):
+			boundFilters = [ (functionName, [ parameters[ slot ] for slot in slots ]) for functionName, slots in filters ]
+			for functionName, arguments in GremlinOptimizer.orderFilters( traversal.graphReference, boundFilters, traversal._isVertexScan() ):
+				getattr( traversal, functionName )( * arguments )
+		return filterStep
+
+	def __compileStep( self, functionName, argumentList, traversalClass, literals ):
+		if functionName in self.controlSteps:
+			return self.controlSteps[ functionName ]( self.__compile( argumentList, traversalClass, literals ) )
 
-	def __branch( self, traversal, functionName, argumentList ):
-		pass
+		function = getattr( traversalClass, GremlinTraversal.KEYWORD_STEPS.get( functionName, functionName ), None )
+		if function is None:
+			GremlinExecutionEngine.__collectLiterals( argumentList, literals )
+			return lambda traversal, parameters : print( 'Gremlin step {} not implemented'.format( functionName ) )
 
-	def __executeStep( self, traversal, functionName, argumentList ):
-		if functionName in self.controlSteps:
-			self.controlSteps[ functionName ] ( traversal, functionName, argumentList )
-			return 
-		
-		try:
-			function = getattr( traversal, functionName )
-		except AttributeError:
-			print( 'Gremlin step {} not implemented'.format( functionName ) )
-			return
-		literals = [ argument.literal for argument in argumentList ]
-		return function( * literals )
+		argumentSlots = list()
+		for argument in argumentList:
+			if argument.tokenType != GremlinToken.GREMLIN_LITERAL:
+				raise GremlinSyntaxError( 'Gremlin step {} expects literal arguments'.format( functionName ) )
+			argumentSlots.append( len( literals ) )
+			literals.append( argument.literal )
+
+		if len( argumentSlots ) == 0:
+			return lambda traversal, parameters : function( traversal )
+		return lambda traversal, parameters : function( traversal, * [ parameters[ slot ] for slot in argumentSlots ] )
+
+	@staticmethod
+	def __collectLiterals( argumentList, literals ):
+		for argument in argumentList:
+			if argument.tokenType == GremlinToken.GREMLIN_LITERAL:
+				literals.append( argument.literal )
+			elif argument.tokenType == GremlinToken.GREMLIN_FUNCTION:
+				GremlinExecutionEngine.__collectLiterals( argument.argumentList, literals )
+
+	def __compileRepeat( self, gremlinTokenList, traversalClass, literals ):
+		bodySteps, timesSlot, untilSteps, emitSteps = None, None, None, None
+		untilFirst, emitFirst = False, False
+		for gremlinToken in gremlinTokenList:
+			functionName, argumentList = gremlinToken.functionName, gremlinToken.argumentList
+			if functionName == 'repeat':
+				bodySteps = self.__compile( argumentList, traversalClass, literals )
+			elif functionName == 'times':
+				if len( argumentList ) != 1 or argumentList[ 0 ].tokenType != GremlinToken.GREMLIN_LITERAL:
+					raise GremlinSyntaxError( 'Gremlin step times expects a literal argument' )
+				timesSlot = len( literals )
+				literals.append( argumentList[ 0 ].literal )
+			elif functionName == 'until':
+				# Modulator traversals run on a single traverser at a time, so they never use frontier mode.
+				untilSteps, untilFirst = self.__compile( argumentList, GremlinTraversal, literals ), bodySteps is None
+			elif functionName == 'emit':
+				emitSteps, emitFirst = self.__compile( argumentList, GremlinTraversal, literals ), bodySteps is None
+
+		def repeatStep( traversal, parameters ):
+			traversal._repeat( lambda loopTraversal : self.__exec( loopTraversal, bodySteps, parameters ),
+				               times=parameters[ timesSlot ] if timesSlot is not None else None,
+				               until=self.__predicate( untilSteps, parameters ), emit=self.__predicate( emitSteps, parameters ),
+				               untilFirst=untilFirst, emitFirst=emitFirst )
+		return repeatStep
+
+	def __predicate( self, steps, parameters ):
+		# A traverser satisfies a modulator when the modulator's traversal, started from that traverser, yields anything.
+		# A modulator without a traversal, as in emit(), is satisfied by every traverser.
+		if steps is None:
+			return None
+		if len( steps ) == 0:
+			return lambda traversal, traverser : True
+
+		def predicate( traversal, traverser ):
+			modulatorTraversal = GremlinTraversal( traversal.graphReference, trackPaths=traversal.trackPaths )
+			modulatorTraversal.loopCount = traversal.loopCount
+			modulatorTraversal.traverserList = [ traverser ]
+			self.__exec( modulatorTraversal, steps, parameters )
+			return next( iter( modulatorTraversal.traverserList ), None ) is not None
+		return predicate
+
+	def __compileBranch( self, steps ):
+		return lambda traversal, parameters : None
 
 class GremlinConsole:
 	def __init__( self ):
@@ -401,6 +1535,7 @@ class GremlinConsole:
 		for command in ('exit', 'quit', 'q'):
 			self.commandHandlers[ command ] = self.handleExit
 		self.commandHandlers[ 'load' ] = self.handleLoad
+		self.commandHandlers[ 'stats' ] = self.handleStats
 
 		self.gremlinExecutionEngine = GremlinExecutionEngine()
 
@@ -410,8 +1545,21 @@ class GremlinConsole:
 
 	def handleLoad( self ):
 		print( 'Loading air-routes graph...' )
-		self.gremlinExecutionEngine.setGraph( sample_graph.AirRoutesGraph.get() )
-		print( 'Finished loading air-routes graph...' )
+		g, report = sample_graph.AirRoutesGraph.loadSnapshot()
+		self.gremlinExecutionEngine.setGraph( g )
+		print( 'Finished loading air-routes graph: {} vertices, {} edges in {:.2f}s ({:.0f} objects/s){}'.format(
+			   report[ 'vertices' ], report[ 'edges' ], report[ 'seconds' ], report[ 'objectsPerSecond' ], ', read-only' if report[ 'readOnly' ] else str() ) )
+		if 'snapshotError' in report:
+			print( report[ 'snapshotError' ] )
+
+	def handleStats( self ):
+		stats = self.gremlinExecutionEngine.g.stats()
+		print( '{} vertices, {} edges'.format( stats[ 'vertices' ], stats[ 'edges' ] ) )
+		for heading in ('vertexLabels', 'edgeLabels', 'outDegrees', 'inDegrees'):
+			print( '{}: {}'.format( heading, ', '.join( '{}={}'.format( key, count ) for key, count in stats[ heading ].items() ) ) )
+		for heading in ('vertexProperties', 'edgeProperties'):
+			print( '{}: {}'.format( heading, ', '.join( '{}={}/{}'.format( propertyName, counts[ 'distinct' ], counts[ 'count' ] )
+				                                        for propertyName, counts in stats[ heading ].items() ) ) )
 
 	def console( self ):
 		print( 'Starting Gremlin console...' )
@@ -423,7 +1571,397 @@ class GremlinConsole:
 			if commandStringLowercase in self.commandHandlers:
 				self.commandHandlers[ commandStringLowercase ]()
 				continue
-			self.gremlinExecutionEngine.exec( commandString )
+			# A failing query, such as one changing a read-only graph, is reported and the session carries on.
+			try:
+				TextSerializer.write( self.gremlinExecutionEngine.exec( commandString ), sys.stdout )
+			except Exception as error:
+				print( '{}: {}'.format( type( error ).__name__, error ) )
+
+class GremlinTraverserTest( unittest.TestCase ):
+	def test_cloneSharesHistory( self ):
+		root = GremlinTraverser.init( 1, path=GremlinTraverser.initPath( 1 ) )
+		root = GremlinTraverser.applyLabel( root, 'a' )
+		left, right = GremlinTraverser.clone( root, 2 ), GremlinTraverser.clone( root, 3, newLabel='b' )
+
+		self.assertEqual( GremlinTraverser.pathList( left ), [ 1, 2 ] )
+		self.assertEqual( GremlinTraverser.pathList( right ), [ 1, 3 ] )
+		self.assertIs( left[ 2 ][ 1 ], right[ 2 ][ 1 ] )
+		self.assertEqual( left[ 1 ], { 'a' : 1 } )
+		self.assertEqual( right[ 1 ], { 'a' : 1, 'b' : 3 } )
+		self.assertEqual( root[ 1 ], { 'a' : 1 } )
+
+class GremlinTraversalTest( unittest.TestCase ):
+	def test_bulking( self ):
+		g = sample_graph.TinkerPopModernGraph.get()
+		pathTraversal, bulkedTraversal = GremlinTraversal( g, trackPaths=True ), GremlinTraversal( g, trackPaths=False )
+		for traversal in (pathTraversal, bulkedTraversal):
+			traversal.V()
+			traversal.both()
+			traversal.both()
+			traversal.materialize()
+
+		self.assertEqual( len( pathTraversal.traverserList ), 30 )
+		self.assertEqual( len( bulkedTraversal.traverserList ), 6 )
+		self.assertEqual( sorted( pathTraversal._toString() ), sorted( bulkedTraversal._toString() ) )
+
+		bulkedTraversal.count()
+		self.assertEqual( bulkedTraversal._toString(), [ '30' ] )
+
+	def test_compactGraph( self ):
+		g = sample_graph.TinkerPopModernGraph.get()
+		traversals = [ GremlinTraversal( graph, trackPaths=False ) for graph in (g, g.freeze()) ]
+		for traversal in traversals:
+			traversal.V()
+			traversal.has( 'name', 'marko' )
+			traversal.out()
+			traversal.both( 'created' )
+		self.assertEqual( sorted( traversals[ 0 ]._toString() ), sorted( traversals[ 1 ]._toString() ) )
+
+	def test_lazyPipeline( self ):
+		g = sample_graph.TinkerPopModernGraph.get()
+		pulledVertexIds = list()
+		traversal = GremlinTraversal( g, trackPaths=True )
+		traversal.traverserList = ( pulledVertexIds.append( vertexId ) or traversal._initTraverser( vertexId ) for vertexId in (1, 4, 6) )
+		traversal.out()
+		traversal.limit( 2 )
+		self.assertEqual( len( traversal._toString() ), 2 )
+		self.assertEqual( pulledVertexIds, [ 1 ] )
+
+		traversal = GremlinTraversal( g, trackPaths=False )
+		traversal.V()
+		traversal.both()
+		traversal.both()
+		traversal.limit( 7 )
+		self.assertEqual( len( traversal._toString() ), 7 )
+
+		for hasArguments, expected in ((('name', 'marko'), [ 'True' ]), (('name', 'nobody'), [ 'False' ])):
+			traversal = GremlinTraversal( g, trackPaths=False )
+			traversal.V()
+			traversal.has( * hasArguments )
+			traversal.hasNext()
+			self.assertEqual( traversal._toString(), expected )
+
+		traversal = GremlinTraversal( g, trackPaths=False )
+		traversal.V( 2 )
+		traversal.out()
+		traversal.tryNext()
+		self.assertEqual( traversal._toString(), list() )
+		traversal.V( 2 )
+		traversal.out()
+		with self.assertRaises( NoSuchElementError ):
+			traversal.next()
+
+	def test_independentGraphs( self ):
+		# Two traversals over different graphs, interleaved, each read their own graph.
+		modernGraph, otherGraph = sample_graph.TinkerPopModernGraph.get(), GremlinGraph()
+		for name in ('alice', 'bob'):
+			otherGraph.addVertex( labels=[ 'person' ], props={ 'name' : name } )
+		modernTraversal, otherTraversal = GremlinTraversal( modernGraph, trackPaths=False ), GremlinTraversal( otherGraph, trackPaths=False )
+		for traversal in (modernTraversal, otherTraversal):
+			traversal.V()
+			traversal.hasLabel( 'person' )
+			traversal.values( 'name' )
+		self.assertEqual( sorted( modernTraversal._toString() ), [ 'josh', 'marko', 'peter', 'vadas' ] )
+		self.assertEqual( sorted( otherTraversal._toString() ), [ 'alice', 'bob' ] )
+
+	def test_frontierTraversal( self ):
+		g = sample_graph.TinkerPopModernGraph.get()
+		for graph in (g, g.freeze()):
+			traversal = GremlinFrontierTraversal( graph, trackPaths=False )
+			traversal.V()
+			traversal.both()
+			traversal.hasLabel( 'person' )
+			self.assertIsNotNone( traversal.frontier )
+			self.assertEqual( sorted( traversal._toString() ), [ 'v[1]' ] * 3 + [ 'v[2]' ] + [ 'v[4]' ] * 3 + [ 'v[6]' ] )
+
+			traversal.values( 'age' )
+			traversal.sum()
+			self.assertEqual( traversal._toString(), [ str( 29 * 3 + 27 + 32 * 3 + 35 ) ] )
+
+	def test_frontierDedup( self ):
+		# Traversers reaching the frontier from a step without a frontier implementation are merged only chunk by
+		# chunk, so a vertex may come in many times; dedup() still keeps it once.
+		graph = GremlinGraph()
+		vertexIds = [ graph.addVertex( labels=[ 'person' ] ) for _ in range( 3 ) ]
+		traversal = GremlinFrontierTraversal( graph, trackPaths=False )
+		traversal.traverserList = [ GremlinTraverser.init( vertexIds[ index % 3 ] ) for index in range( 3 * GremlinTraversal.BULK_CHUNK_SIZE ) ]
+		traversal.hasLabel( 'person' )
+		self.assertEqual( traversal._traverserCounts(), (3, 3 * GremlinTraversal.BULK_CHUNK_SIZE) )
+		traversal.dedup()
+		traversal.count()
+		self.assertEqual( traversal._toString(), [ '3' ] )
+
+		graph = GremlinGraph( GraphGenerator( 'rmat', 300, 2000, seed=3 ).load() )
+		counts = list()
+		for traversalClass in (GremlinTraversal, GremlinFrontierTraversal):
+			traversal = traversalClass( graph, trackPaths=False )
+			traversal.V()
+			traversal.khop( 2 )
+			traversal.hasLabel( 'person' )
+			traversal.dedup()
+			traversal.count()
+			counts.append( traversal._toString() )
+		self.assertEqual( counts[ 1 ], counts[ 0 ] )
+
+	def test_scanDuringMutation( self ):
+		# V() scans the vertices present when it runs, whatever later steps add.
+		engine = GremlinExecutionEngine()
+		self.assertEqual( list( engine.run( "g.V().addV('person').count()" ).results() ), [ 6 ] )
+		self.assertEqual( list( engine.run( "g.V().addV('person').limit(100).count()" ).results() ), [ 7 ] )
+		self.assertEqual( list( engine.run( 'g.V().count()' ).results() ), [ 8 ] )
+
+	def test_indexedScan( self ):
+		# A scan seeded from an index never lists the vertices.
+		g = sample_graph.TinkerPopModernGraph.get()
+		g.createLabelIndex()
+		g.createPropertyIndex( 'name' )
+		def vertexSnapshot():
+			raise AssertionError( 'vertexSnapshot called' )
+		g.vertexSnapshot = vertexSnapshot
+		for traversalClass in (GremlinTraversal, GremlinFrontierTraversal):
+			for step, arguments in (('has', ('name', 'josh')), ('hasLabel', ('software',))):
+				traversal = traversalClass( g, trackPaths=False )
+				traversal.V()
+				getattr( traversal, step )( * arguments )
+				traversal.count()
+				self.assertEqual( traversal._toString(), [ '1' if step == 'has' else '2' ] )
+
+	def test_hasLabelWithoutLabels( self ):
+		g = sample_graph.TinkerPopModernGraph.get()
+		g.createLabelIndex()
+		for traversalClass in (GremlinTraversal, GremlinFrontierTraversal):
+			traversal = traversalClass( g, trackPaths=False )
+			traversal.V()
+			traversal.hasLabel()
+			self.assertEqual( traversal._toString(), list() )
+
+	def test_loopsStep( self ):
+		# loops() is a step outside repeat() as well, reading 0.
+		traversal = GremlinTraversal( sample_graph.TinkerPopModernGraph.get() )
+		traversal.V( 1 )
+		traversal.loops()
+		self.assertEqual( traversal._toString(), [ '0' ] )
+
+class GremlinExecutionEngineTest( unittest.TestCase ):
+	def test_planCache( self ):
+		engine = GremlinExecutionEngine()
+		plan, parameters = engine.compile( "g.V().has( 'name', 'marko' ).out( 'knows' )" )
+		cachedPlan, cachedParameters = engine.compile( 'g.V().has("name","josh").out("created")' )
+
+		self.assertIs( plan, cachedPlan )
+		self.assertEqual( parameters, [ 'name', 'marko', 'knows' ] )
+		self.assertEqual( cachedParameters, [ 'name', 'josh', 'created' ] )
+		self.assertEqual( engine.planCache.hits, 1 )
+
+	def test_results( self ):
+		engine = GremlinExecutionEngine()
+		results = engine.exec( 'g.E()' )
+		self.assertNotIsInstance( results, list )
+		edge = min( results, key=lambda edge : edge.id )
+		self.assertEqual( (type( edge ), edge.label, edge.fromVertexId, edge.toVertexId), (GremlinEdgeReference, 'knows', 1, 2) )
+		path, = engine.exec( "g.V(1).out('created').path()" )
+		self.assertEqual( path, (GremlinVertexReference( 1, None ), GremlinVertexReference( 3, None )) )
+		self.assertEqual( path[ 0 ].labels, { 'person' } )
+		self.assertEqual( list( engine.exec( "g.V(1).as('a').out('knows').as('b').select('a','b').count()" ) ), [ 2 ] )
+		selectedList = sorted( engine.exec( "g.V(1).as('a').out('knows').as('b').select('a','b')" ), key=lambda selected : selected[ 'b' ].id )
+		self.assertEqual( [ (selected[ 'a' ], selected[ 'b' ]) for selected in selectedList ],
+		                  [ (GremlinVertexReference( 1, None ), GremlinVertexReference( 2, None )), (GremlinVertexReference( 1, None ), GremlinVertexReference( 4, None )) ] )
+		self.assertEqual( sorted( engine.exec( 'g.V().out().out()' ), key=lambda vertex : vertex.id ), [ GremlinVertexReference( 3, None ), GremlinVertexReference( 5, None ) ] )
+
+	def test_resultCache( self ):
+		engine = GremlinExecutionEngine()
+		engine.setGraph( sample_graph.TinkerPopModernGraph.get() )
+		countQueries = [ "g.V().hasLabel('software').count()", "g.V().hasLabel('person').out('created').count()", 'g.V().count()',
+		                 "g.V().has('name','marko').values('age')" ]
+		self.assertEqual( [ list( engine.exec( gremlinQuery ) ) for gremlinQuery in countQueries ], [ [ 2 ], [ 4 ], [ 6 ], [ 29 ] ] )
+		self.assertEqual( [ list( engine.exec( gremlinQuery ) ) for gremlinQuery in countQueries ], [ [ 2 ], [ 4 ], [ 6 ], [ 29 ] ] )
+		self.assertEqual( engine.resultCache.hits, 4 )
+
+		# A new person invalidates the vertex count and what people created; a knows edge changes nothing cached.
+		peter = engine.g.addVertex( labels=[ 'person' ] )
+		engine.g.addEdge( peter, 1, 'knows' )
+		self.assertEqual( [ list( engine.exec( gremlinQuery ) ) for gremlinQuery in countQueries ], [ [ 2 ], [ 4 ], [ 7 ], [ 29 ] ] )
+		self.assertEqual( (engine.resultCache.hits, engine.resultCache.invalidations), (6, 2) )
+
+		engine.g.addEdge( peter, 3, 'created' )
+		engine.g.setProperty( 1, 'age', 30 )
+		self.assertEqual( [ list( engine.exec( gremlinQuery ) ) for gremlinQuery in countQueries ], [ [ 2 ], [ 5 ], [ 7 ], [ 30 ] ] )
+		self.assertEqual( engine.cacheStats()[ 'results' ][ 'invalidations' ], 4 )
+
+		plan, _ = engine.compile( "g.V(1).property('age', 31)" )
+		self.assertEqual( (plan.dependencies, plan.mutates), (None, True) )
+		plan, parameters = engine.compile( "g.V(1).repeat(out('knows')).until(has('age', 32)).values('name')" )
+		self.assertFalse( plan.mutates )
+		self.assertEqual( plan.dependencyKeys( parameters ), [ Graph.VERTICES, (Graph.EDGE_LABEL, 'knows'), (Graph.PROPERTY, 'age'), (Graph.PROPERTY, 'name') ] )
+
+		# Cached vertices carry their labels, so they are refreshed when a vertex is given another label.
+		marko, = engine.exec( "g.V().has('name','marko')" )
+		engine.g.addLabel( 1, 'vip' )
+		hits = engine.resultCache.hits
+		marko, = engine.exec( "g.V().has('name','marko')" )
+		self.assertEqual( (marko.labels, GremlinSerializer.plain( marko )[ 'label' ]), ({ 'person', 'vip' }, 'person::vip') )
+		self.assertEqual( list( engine.exec( "g.V().has('name','marko').values('age')" ) ), [ 30 ] )
+		self.assertEqual( engine.resultCache.hits, hits + 1 )
+
+	def test_optimizer( self ):
+		engine = GremlinExecutionEngine()
+		for gremlinQuery, expected in [
+			('g.V().out().count()', [ 6 ]),
+			("g.V().out('created').count()", [ 4 ]),
+			('g.V().both().count()', [ 12 ]),
+			("g.V(1).out('knows').count()", [ 2 ]),
+			("g.V().out('created').hasId(3).count()", [ 3 ]),
+			('g.V().out().hasId(5)', [ GremlinVertexReference( 5, None ) ]),
+			("g.V().out().hasId(3).path().count()", [ 3 ]),
+			("g.V().has('name','marko').hasLabel('person').values('age')", [ 29 ]),
+			("g.V().hasLabel('software').has('lang','java').hasId(3,4).values('name')", [ 'lop' ]),
+			]:
+			self.assertEqual( list( engine.exec( gremlinQuery ) ), expected, gremlinQuery )
+
+		# Plans are shared across literals, so filters are ordered for each query's literals when it runs.
+		plan, _ = engine.compile( "g.V().hasLabel('person').has('name','marko')" )
+		self.assertEqual( len( plan.steps ), 2 )
+		self.assertEqual( list( engine.exec( "g.V().hasLabel('person').has('name','vadas').values('age')" ) ), [ 27 ] )
+
+		explanation = list( engine.exec( "g.V().hasLabel('person').has('name','marko').out('knows').count().explain()" ) )
+		self.assertEqual( explanation[ 1 ], "optimized: V().hasLabel('person').has('name','marko').outDegreeCount('knows')" )
+		self.assertIn( "filters: has('name','marko') ~1, hasLabel('person') ~4", explanation )
+		self.assertIn( 'parallel: V() scan, combined by outDegreeCount', explanation )
+
+	def test_profile( self ):
+		engine = GremlinExecutionEngine( workers=2 )
+		for gremlinQuery in ("g.V().hasLabel('person').out('created').values('name').profile()",
+		                     "g.V().hasLabel('person').out('created').as('a').values('name').profile()"):
+			profile, = engine.exec( gremlinQuery )
+			self.assertEqual( [ step[ 'step' ] for step in profile[ 'steps' ] if step[ 'step' ] != "as('a')" ],
+			                  [ 'V()', "hasLabel('person')", "out('created')", "values('name')" ] )
+			self.assertEqual( [ step[ 'bulkOut' ] for step in profile[ 'steps' ] ][ : 3 ], [ 6, 4, 4 ] )
+			self.assertEqual( (profile[ 'steps' ][ 2 ][ 'traversersIn' ], profile[ 'steps' ][ -1 ][ 'bulkOut' ]), (4, 4) )
+			self.assertEqual( GremlinSerializer.plain( profile )[ 'steps' ][ 1 ][ 'step' ], "hasLabel('person')" )
+			self.assertIn( '>TOTAL', str( profile ) )
+		# Profiles are measured afresh each time, with the plan shared across literals.
+		profile, = engine.exec( "g.V().has('name','josh').out().limit(1).profile()" )
+		self.assertEqual( [ step[ 'step' ] for step in profile[ 'steps' ] ], [ 'V()', "has('name','josh')", 'out()', 'limit(1)' ] )
+		self.assertEqual( profile[ 'steps' ][ -1 ][ 'bulkOut' ], 1 )
+		self.assertEqual( next( engine.exec( "g.V().has('name','marko').out().limit(1).profile()" ) )[ 'steps' ][ 1 ][ 'step' ], "has('name','marko')" )
+		self.assertEqual( engine.cacheStats()[ 'results' ][ 'size' ], 0 )
+		engine.close()
+
+	def test_stepHooks( self ):
+		class StepRecorder( GremlinStepHook ):
+			def __init__( self ):
+				self.calls = list()
+
+			def stepStarted( self, stepName, traversal ):
+				self.calls.append( stepName )
+
+			def queryFinished( self, gremlinQuery, traversal ):
+				self.calls.append( list( traversal.results() ) )
+
+		engine = GremlinExecutionEngine()
+		recorder, profiler = StepRecorder(), GremlinProfiler()
+		engine.addStepHook( recorder )
+		engine.addStepHook( profiler )
+		gremlinQuery = "g.V().repeat(out('knows')).times(1).hasLabel('person').has('age',27).values('name')"
+		self.assertEqual( list( engine.exec( gremlinQuery ) ), [ 'vadas' ] )
+		self.assertEqual( recorder.calls, [ 'V()', "repeat(out('knows')).times(1)", "hasLabel('person').has('age',27)", "values('name')", [ 'vadas' ] ] )
+		# A repeated query runs its steps again rather than being answered from the result cache.
+		self.assertEqual( list( engine.exec( gremlinQuery ) ), [ 'vadas' ] )
+		self.assertEqual( (len( recorder.calls ), engine.resultCache.hits), (10, 0) )
+		engine.removeStepHook( recorder )
+		list( engine.exec( 'g.V().count()' ) )
+		self.assertEqual( len( recorder.calls ), 10 )
+		self.assertEqual( [ profile[ 'query' ] for profile in profiler.profiles ], [ gremlinQuery, gremlinQuery, 'g.V().count()' ] )
+
+		# A step raising still ends the query for the hooks, and the profiler stops tracing allocations.
+		tracingProfiler = GremlinProfiler( traceAllocations=True )
+		engine.addStepHook( tracingProfiler )
+		with self.assertRaises( TypeError ):
+			list( engine.exec( "g.V().values('name').sum()" ) )
+		self.assertFalse( tracemalloc.is_tracing() )
+		self.assertEqual( [ step[ 'step' ] for step in tracingProfiler.profiles[ -1 ][ 'steps' ] ], [ 'V()', "values('name')" ] )
+
+	def test_analytics( self ):
+		engine = GremlinExecutionEngine()
+		ranks = dict( zip( engine.exec( "g.V().values('name')" ), engine.exec( 'g.V().pageRank().values("pageRank")' ) ) )
+		self.assertEqual( max( ranks, key=ranks.get ), 'lop' )
+		self.assertAlmostEqual( sum( ranks.values() ), 1.0, places=5 )
+		# After one iteration, marko, without incoming knows edges, only has his share of the rank of the five vertices
+		# without outgoing ones.
+		rank, = engine.exec( "g.V(1).pageRank('rank', 'knows', 0.001, 1).values('rank')" )
+		self.assertAlmostEqual( rank, ( 0.15 + 0.85 * 5 / 6 ) / 6 )
+		self.assertEqual( list( engine.exec( "g.V().connectedComponent().values('component').dedup()" ) ), [ 1 ] )
+		self.assertEqual( sorted( engine.exec( "g.V().has('name','marko').out().degreeCentrality('degree', 'in').values('name','degree')" ), key=str ),
+		                  [ 1, 1, 3, 'josh', 'lop', 'vadas' ] )
+		self.assertEqual( list( engine.exec( "g.V().hasLabel('person').degreeCentrality('knows', 'out', 'knows').values('knows').sum()" ) ), [ 2 ] )
+		plan, parameters = engine.compile( "g.V(1).pageRank('rank', 'knows').values('rank')" )
+		self.assertEqual( plan.dependencyKeys( parameters ), [ Graph.VERTICES, Graph.VERTICES, (Graph.EDGE_LABEL, 'knows'), (Graph.PROPERTY, 'rank') ] )
+		self.assertIsNone( plan.scanStep )
+
+	def test_pathSearch( self ):
+		engine = GremlinExecutionEngine()
+		for gremlinQuery, expected in [
+			('g.V(1).shortestPath(5)', [ '[v[1],v[4],v[5]]' ]),
+			("g.V(1).shortestPath(4, 'knows')", [ '[v[1],v[4]]' ]),
+			("g.V(1).shortestPath(3, 'knows')", list()),
+			("g.V(1).shortestPath(4, 'knows', 'weight')", [ '[v[1],v[4]]' ]),
+			("g.V(1).shortestPath(3, 'created', 'weight')", [ '[v[1],v[3]]' ]),
+			('g.V(1).shortestPath(5, "knows", "weight", 1)', list()),
+			('g.V().shortestPath(3).count()', [ '4' ]),
+			('g.V(1).khop(1)', [ 'v[2]', 'v[3]', 'v[4]' ]),
+			('g.V(1).khop(2).path()', [ '[v[1],v[2]]', '[v[1],v[3]]', '[v[1],v[4],v[5]]', '[v[1],v[4]]' ]),
+			("g.V().khop(2, 'created').count()", [ '4' ]),
+			]:
+			self.assertEqual( sorted( engine.run( gremlinQuery )._toString() ), expected, gremlinQuery )
+
+	def test_parallel( self ):
+		serialEngine, parallelEngine = GremlinExecutionEngine(), GremlinExecutionEngine( workers=2 )
+		try:
+			for gremlinQuery in ('g.V().out().out().count()', 'g.V().both().both().path()', "g.V().values('age').sum()",
+				                 "g.V().values('age').mean()", "g.V().values('age').min()", "g.V().values('age').max()",
+				                 'g.V().both().dedup()', "g.E().count()", "g.V().repeat(both()).times(2).hasLabel('software').count()"):
+				self.assertEqual( sorted( serialEngine.run( gremlinQuery )._toString() ), sorted( parallelEngine.run( gremlinQuery )._toString() ), gremlinQuery )
+			self.assertIsNotNone( parallelEngine.executor )
+
+			serialTraverser, = serialEngine.run( "g.V().out().values('name').fold()" ).traverserList
+			parallelTraverser, = parallelEngine.run( "g.V().out().values('name').fold()" ).traverserList
+			self.assertEqual( sorted( GremlinTraverser.getDataFromTraverser( serialTraverser ) ), sorted( GremlinTraverser.getDataFromTraverser( parallelTraverser ) ) )
+
+			plan, _ = parallelEngine.compile( "g.V().out().dedup().count()" )
+			self.assertIsNone( plan.scanStep )
+			plan, _ = parallelEngine.compile( "g.V().out().dedup()" )
+			self.assertEqual( (plan.scanStep, plan.combiner), ('V', 'dedup') )
+
+			# The workers' snapshot is taken again once the graph has changed.
+			parallelEngine.g.addVertex( labels=[ 'person' ], props={ 'name' : 'ann' } )
+			self.assertEqual( (parallelEngine.run( 'g.V().count()' )._toString(), list( parallelEngine.exec( 'g.V().count()' ) )), ([ '7' ], [ 7 ]) )
+			self.assertEqual( parallelEngine.snapshotVersion, parallelEngine.g.version )
+
+			# Ids a snapshot cannot hold keep the query in this process.
+			parallelEngine.g.addVertex( labels=[ 'airport' ], id_='JFK' )
+			self.assertEqual( parallelEngine.run( 'g.V().count()' )._toString(), [ '8' ] )
+			self.assertIsNone( parallelEngine.executor )
+		finally:
+			parallelEngine.close()
+
+	def test_repeat( self ):
+		engine = GremlinExecutionEngine()
+		for gremlinQuery, expected in [
+			('g.V(1).repeat(out()).times(2)', [ 'v[3]', 'v[5]' ]),
+			("g.V(1).repeat(out()).until(hasLabel('software')).path()", [ '[v[1],v[3]]', '[v[1],v[4],v[3]]', '[v[1],v[4],v[5]]' ]),
+			('g.V(1).emit().repeat(out()).times(2)', [ 'v[1]', 'v[2]', 'v[3]', 'v[3]', 'v[4]', 'v[5]' ]),
+			('g.V(1).repeat(out()).emit().times(2)', [ 'v[2]', 'v[3]', 'v[3]', 'v[4]', 'v[5]' ]),
+			("g.V(1).until(hasLabel('person')).repeat(out())", [ 'v[1]' ]),
+			('g.V(1).repeat(both()).until(loops().is(3)).count()', [ '17' ]),
+			('g.V(1).repeat(both()).times(3).count()', [ '17' ]),
+			('g.V(1).repeat(both().dedup()).times(3).count()', [ '6' ]),
+			('g.V(1).repeat(both().simplePath()).times(3).path()', [ '[v[1],v[3],v[4],v[5]]', '[v[1],v[4],v[3],v[6]]' ]),
+			('g.V(1).repeat(both()).emit().limit(4).count()', [ '4' ]),
+			]:
+			self.assertEqual( sorted( engine.run( gremlinQuery )._toString() ), expected, gremlinQuery )
+
+		with self.assertRaises( LoopLimitExceededError ):
+			engine.run( 'g.V(1).repeat(both()).emit().count()' )
 
 class GremlinTest( unittest.TestCase ):
 	def test_Gremlin( self ):
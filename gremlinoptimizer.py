@@ -0,0 +1,121 @@
+import unittest
+
+from gremlinparser import GremlinParser, GremlinToken, GremlinFunction, GremlinLiteral
+
+class GremlinOptimizer:
+	# Rewrites the steps of a parsed query before it is compiled. Plans are cached by the query's normalised text and
+	# reused with other literals, so rewrites never depend on literal values and keep the literals in the order they
+	# appear in the query; choices which do depend on them, such as the order of filters, are made when the plan runs,
+	# by orderFilters().
+	# Steps which only drop traversers and so can run in any order, when next to each other.
+	FILTER_STEPS = { 'has', 'hasLabel', 'hasId' }
+	# expansion().count() becomes a sum of degrees.
+	DEGREE_COUNT_STEPS = { 'out' : 'outDegreeCount', 'both' : 'bothDegreeCount' }
+	# expansion( edgeLabel ).hasId( vertexId ) becomes a lookup of the edges into vertexId.
+	REVERSE_LOOKUP_STEPS = { 'out' : 'outHasId' }
+	# The fraction of vertices assumed to have a property, which the statistics do not count per vertex.
+	EXISTS_SELECTIVITY = 0.5
+
+	@staticmethod
+	def optimize( gremlinTokenList ):
+		# Returns the rewritten token list; gremlinTokenList itself is left unchanged.
+		optimizedTokenList = list()
+		for gremlinToken in gremlinTokenList:
+			if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION:
+				gremlinToken = GremlinFunction( gremlinToken.functionName, GremlinOptimizer.optimize( gremlinToken.argumentList ) )
+				previousToken = optimizedTokenList[ -1 ] if len( optimizedTokenList ) > 0 else None
+				rewrittenToken = GremlinOptimizer._rewritePair( previousToken, gremlinToken )
+				if rewrittenToken is not None:
+					optimizedTokenList[ -1 ] = rewrittenToken
+					continue
+			optimizedTokenList.append( gremlinToken )
+		return optimizedTokenList
+
+	@staticmethod
+	def _rewritePair( previousToken, gremlinToken ):
+		# Returns the single step replacing previousToken followed by gremlinToken, or None.
+		if previousToken is None or previousToken.tokenType != GremlinToken.GREMLIN_FUNCTION or not GremlinOptimizer._literalArguments( previousToken ):
+			return None
+		previousName, functionName = previousToken.functionName, gremlinToken.functionName
+		if functionName == 'count' and len( gremlinToken.argumentList ) == 0 and previousName in GremlinOptimizer.DEGREE_COUNT_STEPS:
+			return GremlinFunction( GremlinOptimizer.DEGREE_COUNT_STEPS[ previousName ], list( previousToken.argumentList ) )
+		if ( functionName == 'hasId' and len( gremlinToken.argumentList ) == 1 and GremlinOptimizer._literalArguments( gremlinToken ) and
+			 previousName in GremlinOptimizer.REVERSE_LOOKUP_STEPS ):
+			return GremlinFunction( GremlinOptimizer.REVERSE_LOOKUP_STEPS[ previousName ], previousToken.argumentList + gremlinToken.argumentList )
+		return None
+
+	@staticmethod
+	def _literalArguments( gremlinToken ):
+		return all( argument.tokenType == GremlinToken.GREMLIN_LITERAL for argument in gremlinToken.argumentList )
+
+	@staticmethod
+	def orderFilters( graph, filters, atVertexScan=False ):
+		# filters is a list of ( functionName, arguments ) for adjacent filter steps; returns them most selective first.
+		# Straight after a full vertex scan, the most selective filter answered by an index goes first, so that it
+		# seeds the traversal instead of every vertex being tested, unless the index would return every vertex anyway.
+		estimates = [ GremlinOptimizer.estimate( graph, functionName, arguments ) for functionName, arguments in filters ]
+		order = sorted( range( len( filters ) ), key=lambda position : estimates[ position ][ 0 ] )
+		if atVertexScan:
+			vertexCount = len( graph.V() )
+			indexedPositions = [ position for position in order if estimates[ position ][ 1 ] and estimates[ position ][ 0 ] < vertexCount ]
+			if len( indexedPositions ) > 0:
+				order.remove( indexedPositions[ 0 ] )
+				order.insert( 0, indexedPositions[ 0 ] )
+		return [ filters[ position ] for position in order ]
+
+	@staticmethod
+	def estimate( graph, functionName, arguments ):
+		# Returns ( estimated number of vertices passing the filter, whether an index answers it ). Label and value
+		# counts come from the graph's statistics; has( propertyName ) alone is given EXISTS_SELECTIVITY.
+		vertexCount = len( graph.V() )
+		if functionName == 'hasId':
+			return len( arguments ), True
+		if functionName == 'hasLabel':
+			return sum( graph.labelCount( label ) for label in arguments ), graph.hasLabelIndex()
+		if len( arguments ) == 1:
+			return vertexCount * GremlinOptimizer.EXISTS_SELECTIVITY, False
+		propertyName, propertyValue = arguments[ -2 : ]
+		estimate = graph.propertyValueCount( propertyName, propertyValue ), graph.hasPropertyIndex( propertyName )
+		if len( arguments ) == 3:
+			labelEstimate = GremlinOptimizer.estimate( graph, 'hasLabel', arguments[ : 1 ] )
+			return min( estimate[ 0 ], labelEstimate[ 0 ] ), estimate[ 1 ] or labelEstimate[ 1 ]
+		return estimate
+
+	@staticmethod
+	def render( gremlinTokenList ):
+		# The steps of a token list as Gremlin text, for explain().
+		steps = list()
+		for gremlinToken in gremlinTokenList:
+			if gremlinToken.tokenType == GremlinToken.GREMLIN_FUNCTION:
+				steps.append( GremlinOptimizer.renderStep( gremlinToken.functionName, [ GremlinOptimizer._renderArgument( argument ) for argument in gremlinToken.argumentList ] ) )
+		return '.'.join( steps )
+
+	@staticmethod
+	def renderStep( functionName, renderedArguments ):
+		return '{}({})'.format( functionName, ','.join( renderedArguments ) )
+
+	@staticmethod
+	def _renderArgument( argument ):
+		if argument.tokenType == GremlinToken.GREMLIN_LITERAL:
+			return repr( argument.literal )
+		return GremlinOptimizer.render( [ argument ] )
+
+class GremlinOptimizerTest( unittest.TestCase ):
+	def test_rewrites( self ):
+		for gremlinQuery, expected in [
+			("g.V().out('route').count()", "V().outDegreeCount('route')"),
+			('g.V().both().count()', 'V().bothDegreeCount()'),
+			("g.V().out('route').hasId(7)", "V().outHasId('route',7)"),
+			('g.V().out().hasId(7).count()', 'V().outHasId(7).count()'),
+			('g.V().repeat(out().count()).times(2)', 'V().repeat(outDegreeCount()).times(2)'),
+			("g.V().out('route').hasId(7,8)", "V().out('route').hasId(7,8)"),
+			("g.V().out().values('code').count()", "V().out().values('code').count()"),
+			]:
+			gremlinTokenList = GremlinParser.parse( gremlinQuery )
+			self.assertEqual( GremlinOptimizer.render( GremlinOptimizer.optimize( gremlinTokenList ) ), expected )
+		gremlinTokenList = GremlinParser.parse( "g.V().out('route').count()" )
+		GremlinOptimizer.optimize( gremlinTokenList )
+		self.assertEqual( GremlinOptimizer.render( gremlinTokenList ), "V().out('route').count()" )
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 import tokenize
 import io
+import re
 
 class GremlinSyntaxError( Exception ):
 	pass
@@ -48,13 +49,147 @@ class GremlinLiteral( GremlinToken ):
 	def __repr__( self ):
 		return 'GremlinLiteral @{} literal={}'.format( id( self ), self.literal )
 
+class GremlinLexer:
+	NAME, NUMBER, STRING, OPERATOR = 'NAME', 'NUMBER', 'STRING', 'OPERATOR'
+
+	NAME_PATTERN = re.compile( r'[A-Za-z_]\w*' )
+	NUMBER_PATTERN = re.compile( r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?' )
+	OPERATORS = '().,='
+	ESCAPES = { 'n' : '\n', 't' : '\t', 'r' : '\r', '0' : '\0' }
+
+	@staticmethod
+	def tokenize( commandString ):
+		# Single pass over the query, returning a list of (tokenType, tokenValue, position) tuples.
+		tokenList = list()
+		position, length = 0, len( commandString )
+		while position < length:
+			character = commandString[ position ]
+			if character.isspace():
+				position += 1
+			elif character in GremlinLexer.OPERATORS:
+				tokenList.append( (GremlinLexer.OPERATOR, character, position) )
+				position += 1
+			elif character in ('\'', '"'):
+				literal, end = GremlinLexer._scanString( commandString, position )
+				tokenList.append( (GremlinLexer.STRING, literal, position) )
+				position = end
+			elif character.isdigit() or character == '-':
+				match = GremlinLexer.NUMBER_PATTERN.match( commandString, position )
+				if match is None:
+					raise GremlinSyntaxError( 'unexpected character {} at position {}'.format( character, position ) )
+				tokenList.append( (GremlinLexer.NUMBER, GremlinLexer.toNumber( match.group() ), position) )
+				position = match.end()
+			else:
+				match = GremlinLexer.NAME_PATTERN.match( commandString, position )
+				if match is None:
+					raise GremlinSyntaxError( 'unexpected character {} at position {}'.format( character, position ) )
+				tokenList.append( (GremlinLexer.NAME, match.group(), position) )
+				position = match.end()
+		return tokenList
+
+	@staticmethod
+	def toNumber( numberString ):
+		if '.' in numberString or 'e' in numberString or 'E' in numberString:
+			return float( numberString )
+		return int( numberString )
+
+	@staticmethod
+	def unescape( literal ):
+		if '\\' not in literal:
+			return literal
+		characters, position = list(), 0
+		while position < len( literal ):
+			character = literal[ position ]
+			if character == '\\' and position + 1 < len( literal ):
+				position += 1
+				character = GremlinLexer.ESCAPES.get( literal[ position ], literal[ position ] )
+			characters.append( character )
+			position += 1
+		return str().join( characters )
+
+	@staticmethod
+	def _scanString( commandString, start ):
+		quote = commandString[ start ]
+		position = start + 1
+		while True:
+			end = commandString.find( quote, position )
+			if end == -1:
+				raise GremlinSyntaxError( 'unterminated string starting at position {}'.format( start ) )
+			# The quote is escaped if it is preceded by an odd number of backslashes.
+			backslashes = 0
+			while commandString[ end - 1 - backslashes ] == '\\':
+				backslashes += 1
+			if backslashes % 2 == 0:
+				return GremlinLexer.unescape( commandString[ start + 1 : end ] ), end + 1
+			position = end + 1
+
 class GremlinParser:
+	# Matches the string and number literals of a query, in the same order in which parse() produces them.
+	LITERAL_PATTERN = re.compile( r"'((?:[^'\\]|\\.)*)'|\"((?:[^\"\\]|\\.)*)\"|(?<![\w.])(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)" )
+	WHITESPACE_PATTERN = re.compile( r'\s+' )
+
+	@staticmethod
+	def normalize( commandString ):
+		# Returns the query with every literal replaced by '?' and whitespace removed, along with the literals.
+		literals = list()
+		def replaceLiteral( match ):
+			singleQuoted, doubleQuoted, number = match.groups()
+			if number is not None:
+				literals.append( GremlinLexer.toNumber( number ) )
+			else:
+				literals.append( GremlinLexer.unescape( singleQuoted if singleQuoted is not None else doubleQuoted ) )
+			return '?'
+		template = GremlinParser.LITERAL_PATTERN.sub( replaceLiteral, commandString )
+		return GremlinParser.WHITESPACE_PATTERN.sub( str(), template ), literals
+
+	@staticmethod
+	def parse( commandString ):
+		gremlinTokenList = list()
+		# Functions whose argument list is still open; nesting is tracked here rather than on the Python stack.
+		functionStack = list()
+
+		tokenList = GremlinLexer.tokenize( commandString )
+		for index, (tokenType, tokenValue, position) in enumerate( tokenList ):
+			if tokenType == GremlinLexer.NAME:
+				nextTokenValue = tokenList[ index + 1 ][ 1 ] if index + 1 < len( tokenList ) else None
+				if nextTokenValue == '(':
+					gremlinFunction = GremlinFunction( functionName=tokenValue )
+					if len( functionStack ) > 0:
+						functionStack[ -1 ].addArgument( gremlinFunction )
+					else:
+						gremlinTokenList.append( gremlinFunction )
+					functionStack.append( gremlinFunction )
+				elif len( functionStack ) > 0:
+					functionStack[ -1 ].addArgument( GremlinIdentifier( identifierName=tokenValue ) )
+				elif nextTokenValue in ('.', '='):
+					gremlinTokenList.append( GremlinIdentifier( identifierName=tokenValue ) )
+					if nextTokenValue == '=':
+						gremlinTokenList.append( GremlinAssign() )
+			elif tokenType in (GremlinLexer.STRING, GremlinLexer.NUMBER):
+				if len( functionStack ) == 0:
+					raise GremlinSyntaxError( 'unexpected literal {} at position {}'.format( tokenValue, position ) )
+				functionStack[ -1 ].addArgument( GremlinLiteral( tokenValue ) )
+			elif tokenValue == ')':
+				if len( functionStack ) == 0:
+					raise GremlinSyntaxError( 'unbalanced ) at position {}'.format( position ) )
+				functionStack.pop()
+			elif tokenValue == '(':
+				if index == 0 or tokenList[ index - 1 ][ 0 ] != GremlinLexer.NAME:
+					raise GremlinSyntaxError( 'unexpected ( at position {}'.format( position ) )
+
+		if len( functionStack ) > 0:
+			raise GremlinSyntaxError( 'missing ) for {}'.format( functionStack[ -1 ].functionName ) )
+		return gremlinTokenList
+
+class GremlinTokenizeParser:
+	# The original parser built on the tokenize module. It recurses once per step and keeps literals as they appear
+	# in the source; it is kept as a reference for benchmark.py.
 	@staticmethod
 	def parse( commandString ):
 		gremlinTokenList = list()
 
 		tokenList = tokenize.tokenize( io.BytesIO( commandString.encode() ).readline )
-		GremlinParser._process( tokenList, gremlinTokenList )
+		GremlinTokenizeParser._process( tokenList, gremlinTokenList )
 
 		return gremlinTokenList
 
@@ -73,7 +208,7 @@ class GremlinParser:
 			elif tokenType == tokenize.NAME:
 				nestedGremlinFunction = GremlinFunction( functionName=tokenValue )
 				gremlinFunction.addArgument( nestedGremlinFunction )
-				GremlinParser._processFunction( tokenList, nestedGremlinFunction )
+				GremlinTokenizeParser._processFunction( tokenList, nestedGremlinFunction )
 
 	@staticmethod
 	def _process( tokenList, gremlinTokenList ):
@@ -88,13 +223,13 @@ class GremlinParser:
 		if nextTokenType == tokenize.OP and nextTokenValue == '(':
 			gremlinFunction = GremlinFunction( functionName=tokenValue )
 			gremlinTokenList.append( gremlinFunction )
-			GremlinParser._processFunction( tokenList, gremlinFunction )
+			GremlinTokenizeParser._processFunction( tokenList, gremlinFunction )
 		elif nextTokenType == tokenize.OP and nextTokenValue in ('.', '='):
 			gremlinTokenList.append( GremlinIdentifier( identifierName=tokenValue ) )
 			if nextTokenValue == '=':
 				gremlinTokenList.append( GremlinAssign() )
 		
-		GremlinParser._process( tokenList, gremlinTokenList )
+		GremlinTokenizeParser._process( tokenList, gremlinTokenList )
 		return gremlinTokenList
 
 class GremlinParserTest( unittest.TestCase ):
@@ -104,5 +239,30 @@ class GremlinParserTest( unittest.TestCase ):
 		for gremlinToken in GremlinParser.parse( gremlinQuery ):
 			print( gremlinToken )
 
+	def test_tokens( self ):
+		gremlinQuery = "i = g.V( 1 ).has( 'name', \"O'Hare\" ).has( 'lat', -41.5 ).repeat( out( 'it\\'s' ) ).times( 3 )"
+		gremlinTokenList = GremlinParser.parse( gremlinQuery )
+		self.assertEqual( [ gremlinToken.tokenType for gremlinToken in gremlinTokenList ],
+		                  [ 'IDENTIFIER', 'ASSIGN', 'IDENTIFIER' ] + [ 'FUNCTION' ] * 5 )
+
+		_, _, _, V, hasName, hasLat, repeat, times = gremlinTokenList
+		self.assertEqual( [ argument.literal for argument in V.argumentList ], [ 1 ] )
+		self.assertEqual( [ argument.literal for argument in hasName.argumentList ], [ 'name', "O'Hare" ] )
+		self.assertEqual( [ argument.literal for argument in hasLat.argumentList ], [ 'lat', -41.5 ] )
+		nestedFunction, = repeat.argumentList
+		self.assertEqual( (nestedFunction.functionName, nestedFunction.argumentList[ 0 ].literal), ('out', "it's") )
+		self.assertEqual( times.argumentList[ 0 ].literal, 3 )
+
+		self.assertEqual( GremlinParser.normalize( gremlinQuery )[ 1 ], [ 1, 'name', "O'Hare", 'lat', -41.5, "it's", 3 ] )
+
+	def test_longChain( self ):
+		gremlinTokenList = GremlinParser.parse( 'g.V()' + '.out()' * 5000 )
+		self.assertEqual( len( gremlinTokenList ), 5002 )
+
+	def test_syntaxErrors( self ):
+		for gremlinQuery in ("g.V().has( 'name )", 'g.V().out(', 'g.V())', 'g.V().has( # )'):
+			with self.assertRaises( GremlinSyntaxError ):
+				GremlinParser.parse( gremlinQuery )
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -0,0 +1,104 @@
+import unittest
+import time
+import threading
+import tracemalloc
+
+from gremlinresults import GremlinProfile
+
+class GremlinStepHook:
+	# The calls GremlinExecutionEngine makes to the hooks added with addStepHook(), around each step of the queries it
+	# runs. stepName is the step's Gremlin text with its literals, as optimized; adjacent filters and a repeat() with
+	# its modulators run as one step. While any hook is added the result cache is bypassed, so that every query runs
+	# its steps. queryFinished is called even when a step raises.
+	def queryStarted( self, gremlinQuery ):
+		pass
+
+	def stepStarted( self, stepName, traversal ):
+		pass
+
+	def stepFinished( self, stepName, traversal ):
+		pass
+
+	def queryFinished( self, gremlinQuery, traversal ):
+		pass
+
+class GremlinProfiler( GremlinStepHook ):
+	# Measures each step of the queries it is hooked into, collecting a GremlinProfile per query in profiles. Steps
+	# otherwise run lazily, each pulling traversers through the ones before it, so the profiler materializes the
+	# traversers of every step before stopping its clock: each step's time is then its own. The only exception is a
+	# full vertex scan, which is counted but left lazy so that a filter following it can still be seeded from an index.
+	# With traceAllocations, the peak memory allocated while each step runs is traced as well, which slows the steps
+	# down noticeably; it is process wide, so it is only meaningful for queries running one at a time.
+	def __init__( self, traceAllocations=False ):
+		self.traceAllocations = traceAllocations
+		self.profiles = list()
+		self.lock = threading.Lock()
+		# The profile and step being measured by each thread.
+		self.current = threading.local()
+
+	def queryStarted( self, gremlinQuery ):
+		self.current.profile = GremlinProfile( query=gremlinQuery, steps=list(), totalMilliseconds=0.0 )
+		self.current.startedTracing = self.traceAllocations and not tracemalloc.is_tracing()
+		if self.current.startedTracing:
+			tracemalloc.start()
+
+	def stepStarted( self, stepName, traversal ):
+		if self.traceAllocations:
+			tracemalloc.reset_peak()
+			self.current.startMemory, _ = tracemalloc.get_traced_memory()
+		self.current.startTime = time.perf_counter()
+
+	def stepFinished( self, stepName, traversal ):
+		traversers, bulk = traversal._traverserCounts()
+		milliseconds = ( time.perf_counter() - self.current.startTime ) * 1e3
+		steps = self.current.profile[ 'steps' ]
+		traversersIn, bulkIn = (steps[ -1 ][ 'traversersOut' ], steps[ -1 ][ 'bulkOut' ]) if len( steps ) > 0 else (0, 0)
+		step = { 'step' : stepName, 'traversersIn' : traversersIn, 'bulkIn' : bulkIn, 'traversersOut' : traversers, 'bulkOut' : bulk,
+		         'milliseconds' : milliseconds, 'percent' : 0.0 }
+		if self.traceAllocations:
+			_, peakMemory = tracemalloc.get_traced_memory()
+			step[ 'peakBytes' ] = max( peakMemory - self.current.startMemory, 0 )
+		steps.append( step )
+
+	def queryFinished( self, gremlinQuery, traversal ):
+		profile = self.current.profile
+		if self.current.startedTracing:
+			tracemalloc.stop()
+		totalMilliseconds = sum( step[ 'milliseconds' ] for step in profile[ 'steps' ] )
+		for step in profile[ 'steps' ]:
+			step[ 'percent' ] = 100.0 * step[ 'milliseconds' ] / totalMilliseconds if totalMilliseconds > 0 else 0.0
+		profile[ 'totalMilliseconds' ] = totalMilliseconds
+		with self.lock:
+			self.profiles.append( profile )
+
+class GremlinProfilerTest( unittest.TestCase ):
+	class CountedTraversal:
+		def __init__( self, counts ):
+			self.counts = counts
+
+		def _traverserCounts( self ):
+			return self.counts
+
+	def test_profiler( self ):
+		profiler = GremlinProfiler( traceAllocations=True )
+		profiler.queryStarted( 'g.V().out()' )
+		for stepName, counts in [ ('V()', (6, 6)), ('out()', (4, 6)) ]:
+			profiler.stepStarted( stepName, None )
+			values = [ str( value ) for value in range( 1000 ) ]
+			profiler.stepFinished( stepName, GremlinProfilerTest.CountedTraversal( counts ) )
+		profiler.queryFinished( 'g.V().out()', None )
+		self.assertFalse( tracemalloc.is_tracing() )
+
+		profile, = profiler.profiles
+		self.assertEqual( [ (step[ 'step' ], step[ 'traversersIn' ], step[ 'bulkIn' ], step[ 'traversersOut' ], step[ 'bulkOut' ]) for step in profile[ 'steps' ] ],
+			              [ ('V()', 0, 0, 6, 6), ('out()', 6, 6, 4, 6) ] )
+		self.assertAlmostEqual( sum( step[ 'percent' ] for step in profile[ 'steps' ] ), 100.0 )
+		self.assertAlmostEqual( sum( step[ 'milliseconds' ] for step in profile[ 'steps' ] ), profile[ 'totalMilliseconds' ] )
+		self.assertGreater( profile[ 'steps' ][ 1 ][ 'peakBytes' ], 1000 * len( values[ -1 ] ) )
+		lines = str( profile ).splitlines()
+		self.assertEqual( lines[ 0 ].split(), [ 'Step', 'Count', 'Traversers', 'Time', '(ms)', '%', 'Dur', 'Peak', '(KB)' ] )
+		self.assertEqual( lines[ 3 ].split()[ : 3 ], [ 'out()', '6', '4' ] )
+		self.assertEqual( lines[ -1 ].split()[ 0 ], '>TOTAL' )
+
+if __name__ == '__main__':
+	unittest.main()
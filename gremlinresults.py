@@ -0,0 +1,245 @@
+import unittest
+import io
+import json
+import struct
+import itertools
+
+class GremlinVertexReference:
+	# The result of a traversal ending on a vertex: its id and labels, detached from the graph so that it can be kept,
+	# compared and serialised after the traversal is gone.
+	__slots__ = ('id', 'labels')
+
+	def __init__( self, id_, labels ):
+		self.id = id_
+		self.labels = labels
+
+	def __eq__( self, other ):
+		return type( other ) is GremlinVertexReference and self.id == other.id
+
+	def __hash__( self ):
+		return hash( (GremlinVertexReference, self.id) )
+
+	def __repr__( self ):
+		return 'v[{}]'.format( self.id )
+
+class GremlinEdgeReference:
+	__slots__ = ('id', 'label', 'fromVertexId', 'toVertexId')
+
+	def __init__( self, id_, label, fromVertexId, toVertexId ):
+		self.id = id_
+		self.label = label
+		self.fromVertexId, self.toVertexId = fromVertexId, toVertexId
+
+	def __eq__( self, other ):
+		return type( other ) is GremlinEdgeReference and self.id == other.id
+
+	def __hash__( self ):
+		return hash( (GremlinEdgeReference, self.id) )
+
+	def __repr__( self ):
+		return 'e[{}][{}-{}->{}]'.format( self.id, self.fromVertexId, self.label, self.toVertexId )
+
+class GremlinPath( tuple ):
+	# The vertex and edge references visited by a traverser, in order.
+	def __repr__( self ):
+		return '[' + ','.join( repr( graphObject ) for graphObject in self ) + ']'
+
+class GremlinProfile( dict ):
+	# The result of profile(): { 'query', 'steps', 'totalMilliseconds' }, where each step is a dict of 'step',
+	# 'traversersIn', 'bulkIn', 'traversersOut', 'bulkOut', 'milliseconds', 'percent' and, when allocations are traced,
+	# 'peakBytes'. It serialises as that dict, and prints as a table in the style of TinkerPop's profile(), whose Count
+	# column is the bulk.
+	STEP_WIDTH = 60
+
+	def __repr__( self ):
+		peak = any( 'peakBytes' in step for step in self[ 'steps' ] )
+		row = '{:<' + str( GremlinProfile.STEP_WIDTH ) + '}{:>12}{:>12}{:>14}{:>10}' + ( '{:>14}' if peak else '{}' )
+		lines = [ row.format( 'Step', 'Count', 'Traversers', 'Time (ms)', '% Dur', 'Peak (KB)' if peak else str() ) ]
+		lines.append( '=' * len( lines[ 0 ] ) )
+		for step in self[ 'steps' ]:
+			stepName = step[ 'step' ] if len( step[ 'step' ] ) <= GremlinProfile.STEP_WIDTH - 2 else step[ 'step' ][ : GremlinProfile.STEP_WIDTH - 5 ] + '...'
+			lines.append( row.format( stepName, step[ 'bulkOut' ], step[ 'traversersOut' ], '{:.3f}'.format( step[ 'milliseconds' ] ),
+				                      '{:.2f}'.format( step[ 'percent' ] ), '{:.1f}'.format( step[ 'peakBytes' ] / 1024 ) if 'peakBytes' in step else str() ) )
+		lines.append( row.format( '>TOTAL'.rjust( GremlinProfile.STEP_WIDTH - 2 ), '-', '-', '{:.3f}'.format( self[ 'totalMilliseconds' ] ), '-',
+			                      '-' if peak else str() ) )
+		return '\n'.join( lines )
+
+	__str__ = __repr__
+
+class GremlinSerializer:
+	# Writes an iterable of results to a stream, BATCH_SIZE results per write. Serializers are used as classes rather
+	# than instances; each subclass defines encode( result ), which returns the text of a result, or its bytes when
+	# BINARY is set.
+	BATCH_SIZE = 256
+	BINARY = False
+
+	@classmethod
+	def write( cls, results, stream, batchSize=BATCH_SIZE ):
+		# Returns the number of results written.
+		results = iter( results )
+		separator = b'' if cls.BINARY else str()
+		resultCount = 0
+		while True:
+			batch = [ cls.encode( result ) for result in itertools.islice( results, batchSize ) ]
+			if len( batch ) == 0:
+				return resultCount
+			stream.write( separator.join( batch ) )
+			resultCount += len( batch )
+
+	@staticmethod
+	def plain( result ):
+		# The result as JSON compatible values: graph objects become dicts, paths lists and map keys strings.
+		resultType = type( result )
+		if resultType is GremlinVertexReference:
+			return { 'id' : result.id, 'label' : GremlinSerializer.vertexLabel( result ), 'type' : 'vertex' }
+		if resultType is GremlinEdgeReference:
+			return { 'id' : result.id, 'label' : result.label, 'type' : 'edge', 'outV' : result.fromVertexId, 'inV' : result.toVertexId }
+		if isinstance( result, dict ):
+			return { str( key ) : GremlinSerializer.plain( value ) for key, value in result.items() }
+		if isinstance( result, (list, tuple, set, frozenset) ):
+			return [ GremlinSerializer.plain( value ) for value in result ]
+		return result
+
+	@staticmethod
+	def vertexLabel( vertexReference ):
+		# Vertices with several labels are given the TinkerPop multi-label form, label1::label2.
+		return '::'.join( sorted( vertexReference.labels ) ) if len( vertexReference.labels ) > 0 else None
+
+class TextSerializer( GremlinSerializer ):
+	# The console's format.
+	@staticmethod
+	def encode( result ):
+		return '==>{}\n'.format( result )
+
+class JsonLinesSerializer( GremlinSerializer ):
+	@staticmethod
+	def encode( result ):
+		return json.dumps( GremlinSerializer.plain( result ) ) + '\n'
+
+class GraphSONSerializer( GremlinSerializer ):
+	# One GraphSON 3.0 style typed value per line.
+	@staticmethod
+	def encode( result ):
+		return json.dumps( GraphSONSerializer.typed( result ) ) + '\n'
+
+	@staticmethod
+	def typed( result ):
+		resultType = type( result )
+		if result is None or resultType in (bool, str):
+			return result
+		if resultType is int:
+			return { '@type' : 'g:Int32' if -2 ** 31 <= result < 2 ** 31 else 'g:Int64', '@value' : result }
+		if resultType is float:
+			return { '@type' : 'g:Double', '@value' : result }
+		if resultType is GremlinVertexReference:
+			return { '@type' : 'g:Vertex', '@value' : { 'id' : GraphSONSerializer.typed( result.id ), 'label' : GremlinSerializer.vertexLabel( result ) } }
+		if resultType is GremlinEdgeReference:
+			return { '@type' : 'g:Edge', '@value' : { 'id' : GraphSONSerializer.typed( result.id ), 'label' : result.label,
+			                                          'outV' : GraphSONSerializer.typed( result.fromVertexId ),
+			                                          'inV' : GraphSONSerializer.typed( result.toVertexId ) } }
+		if resultType is GremlinPath:
+			return { '@type' : 'g:Path', '@value' : { 'labels' : GraphSONSerializer.typed( [ set() for _ in result ] ),
+			                                          'objects' : GraphSONSerializer.typed( list( result ) ) } }
+		if isinstance( result, dict ):
+			return { '@type' : 'g:Map', '@value' : [ GraphSONSerializer.typed( item ) for entry in result.items() for item in entry ] }
+		if isinstance( result, (set, frozenset) ):
+			return { '@type' : 'g:Set', '@value' : [ GraphSONSerializer.typed( value ) for value in result ] }
+		if isinstance( result, (list, tuple) ):
+			return { '@type' : 'g:List', '@value' : [ GraphSONSerializer.typed( value ) for value in result ] }
+		return str( result )
+
+class MsgpackSerializer( GremlinSerializer ):
+	# A stream of MessagePack objects, one per result, holding the same values as JsonLinesSerializer. The subset of
+	# the format needed for them is encoded here rather than depending on the msgpack package.
+	BINARY = True
+
+	@staticmethod
+	def encode( result ):
+		chunks = list()
+		MsgpackSerializer._pack( GremlinSerializer.plain( result ), chunks )
+		return b''.join( chunks )
+
+	@staticmethod
+	def _pack( value, chunks ):
+		valueType = type( value )
+		if value is None:
+			chunks.append( b'\xc0' )
+		elif valueType is bool:
+			chunks.append( b'\xc3' if value else b'\xc2' )
+		elif valueType is int:
+			if 0 <= value < 0x80:
+				chunks.append( struct.pack( 'B', value ) )
+			elif -0x20 <= value < 0:
+				chunks.append( struct.pack( 'b', value ) )
+			elif value >= 0:
+				chunks.append( b'\xcf' + struct.pack( '>Q', value ) )
+			else:
+				chunks.append( b'\xd3' + struct.pack( '>q', value ) )
+		elif valueType is float:
+			chunks.append( b'\xcb' + struct.pack( '>d', value ) )
+		elif valueType is str:
+			encoded = value.encode( 'utf-8' )
+			MsgpackSerializer._packHeader( len( encoded ), 0xa0, 32, b'\xd9', b'\xda', b'\xdb', chunks )
+			chunks.append( encoded )
+		elif valueType is list:
+			MsgpackSerializer._packHeader( len( value ), 0x90, 16, None, b'\xdc', b'\xdd', chunks )
+			for item in value:
+				MsgpackSerializer._pack( item, chunks )
+		elif valueType is dict:
+			MsgpackSerializer._packHeader( len( value ), 0x80, 16, None, b'\xde', b'\xdf', chunks )
+			for key, item in value.items():
+				MsgpackSerializer._pack( key, chunks )
+				MsgpackSerializer._pack( item, chunks )
+		else:
+			MsgpackSerializer._pack( str( value ), chunks )
+
+	@staticmethod
+	def _packHeader( length, fixedMarker, fixedLimit, marker8, marker16, marker32, chunks ):
+		if length < fixedLimit:
+			chunks.append( struct.pack( 'B', fixedMarker | length ) )
+		elif marker8 is not None and length < 0x100:
+			chunks.append( marker8 + struct.pack( 'B', length ) )
+		elif length < 0x10000:
+			chunks.append( marker16 + struct.pack( '>H', length ) )
+		else:
+			chunks.append( marker32 + struct.pack( '>I', length ) )
+
+SERIALIZERS = { 'text' : TextSerializer, 'json' : JsonLinesSerializer, 'graphson' : GraphSONSerializer, 'msgpack' : MsgpackSerializer }
+
+class GremlinSerializerTest( unittest.TestCase ):
+	def setUp( self ):
+		marko, lop = GremlinVertexReference( 1, frozenset( [ 'person' ] ) ), GremlinVertexReference( 3, frozenset( [ 'software' ] ) )
+		created = GremlinEdgeReference( 9, 'created', 1, 3 )
+		self.results = [ marko, created, GremlinPath( (marko, lop) ), { 'a' : marko, 'b' : lop }, 29, 0.4, 'lop', [ 'java' ] ]
+
+	def test_text( self ):
+		stream = io.StringIO()
+		self.assertEqual( TextSerializer.write( iter( self.results ), stream, batchSize=3 ), len( self.results ) )
+		self.assertEqual( stream.getvalue().splitlines(), [ '==>v[1]', '==>e[9][1-created->3]', '==>[v[1],v[3]]', "==>{'a': v[1], 'b': v[3]}",
+		                                                    '==>29', '==>0.4', '==>lop', "==>['java']" ] )
+
+	def test_json( self ):
+		stream = io.StringIO()
+		JsonLinesSerializer.write( self.results, stream )
+		decoded = [ json.loads( line ) for line in stream.getvalue().splitlines() ]
+		self.assertEqual( decoded[ : 4 ], [ { 'id' : 1, 'label' : 'person', 'type' : 'vertex' },
+		                                    { 'id' : 9, 'label' : 'created', 'type' : 'edge', 'outV' : 1, 'inV' : 3 },
+		                                    [ { 'id' : 1, 'label' : 'person', 'type' : 'vertex' }, { 'id' : 3, 'label' : 'software', 'type' : 'vertex' } ],
+		                                    { 'a' : { 'id' : 1, 'label' : 'person', 'type' : 'vertex' }, 'b' : { 'id' : 3, 'label' : 'software', 'type' : 'vertex' } } ] )
+		self.assertEqual( decoded[ 4 : ], [ 29, 0.4, 'lop', [ 'java' ] ] )
+
+		stream = io.StringIO()
+		GraphSONSerializer.write( self.results[ 2 : 5 ], stream )
+		path, selected, age = [ json.loads( line ) for line in stream.getvalue().splitlines() ]
+		self.assertEqual( path[ '@value' ][ 'objects' ][ '@value' ][ 1 ], { '@type' : 'g:Vertex', '@value' : { 'id' : { '@type' : 'g:Int32', '@value' : 3 }, 'label' : 'software' } } )
+		self.assertEqual( selected[ '@value' ][ 0 ], 'a' )
+		self.assertEqual( age, { '@type' : 'g:Int32', '@value' : 29 } )
+
+	def test_msgpack( self ):
+		stream = io.BytesIO()
+		MsgpackSerializer.write( [ [ 1, -1, 'a' ], None, 2 ** 40, { 'x' : True } ], stream )
+		self.assertEqual( stream.getvalue(), b'\x93\x01\xff\xa1a' + b'\xc0' + b'\xcf' + struct.pack( '>Q', 2 ** 40 ) + b'\x81\xa1x\xc3' )
+		self.assertEqual( MsgpackSerializer.encode( 'x' * 40 ), b'\xd9\x28' + b'x' * 40 )
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,228 @@
+import unittest
+import asyncio
+import json
+import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import sample_graph
+from gremlin import GremlinExecutionEngine
+from gremlinresults import GremlinSerializer
+from utilities import ReadWriteLock
+
+class GremlinServer:
+	# Serves Gremlin queries over TCP as JSON lines. Each request line is { "id" : ..., "gremlin" : query } and is answered
+	# by { "id" : ..., "status" : "ok", "result" : [ ... ] } or { "id" : ..., "status" : "error", "error" : message }.
+	# Every connection is a session whose requests are answered in order; the queries of all sessions run on a bounded
+	# pool of threads sharing one engine, and so one graph and one plan cache. Queries reading the graph run alongside
+	# each other, while one changing it runs alone.
+	DEFAULT_PORT = 8182
+	WORKERS = 4
+	# Queries admitted at once, across all sessions, whether running or waiting for a thread. A session whose query is
+	# not admitted stops reading its connection until it is, so that clients are held back by TCP flow control instead
+	# of having their queries queued without bound.
+	MAX_PENDING = 64
+	TIMEOUT_SECONDS = 30.0
+	MAX_REQUEST_BYTES = 1 << 20
+
+	def __init__( self, engine=None, workers=WORKERS, maxPending=MAX_PENDING, timeout=TIMEOUT_SECONDS ):
+		self.engine = engine if engine is not None else GremlinExecutionEngine()
+		self.executor = ThreadPoolExecutor( max_workers=workers )
+		self.maxPending = maxPending
+		self.timeout = timeout
+		self.pending = None
+		self.server = None
+		self.graphLock = ReadWriteLock()
+		# The tasks of the open sessions, which stop() cancels.
+		self.sessions = set()
+
+	async def start( self, host='127.0.0.1', port=DEFAULT_PORT ):
+		# Returns the port listened on, which is chosen by the system when port is 0.
+		self.pending = asyncio.Semaphore( self.maxPending )
+		self.server = await asyncio.start_server( self.handleSession, host, port, limit=GremlinServer.MAX_REQUEST_BYTES )
+		_, port, * _ = self.server.sockets[ 0 ].getsockname()
+		return port
+
+	async def stop( self ):
+		self.server.close()
+		sessions = list( self.sessions )
+		for session in sessions:
+			session.cancel()
+		await asyncio.gather( * sessions, return_exceptions=True )
+		await self.server.wait_closed()
+		self.executor.shutdown( wait=False, cancel_futures=True )
+
+	def serve( self, host='127.0.0.1', port=DEFAULT_PORT ):
+		async def serveForever():
+			await self.start( host, port )
+			try:
+				await self.server.serve_forever()
+			finally:
+				await self.stop()
+		asyncio.run( serveForever() )
+
+	async def handleSession( self, reader, writer ):
+		session = asyncio.current_task()
+		self.sessions.add( session )
+		try:
+			while True:
+				requestLine = await reader.readline()
+				if len( requestLine ) == 0:
+					break
+				response = await self.handleRequest( requestLine )
+				writer.write( json.dumps( response ).encode( 'utf-8' ) + b'\n' )
+				await writer.drain()
+		except (ConnectionError, ValueError):
+			# ValueError is raised by readline() for request lines over MAX_REQUEST_BYTES.
+			pass
+		except asyncio.CancelledError:
+			# The server is stopping. The session ends like any other rather than leaving its cancellation to be
+			# reported by the stream's callback.
+			pass
+		finally:
+			self.sessions.discard( session )
+			writer.close()
+
+	async def handleRequest( self, requestLine ):
+		try:
+			request = json.loads( requestLine )
+			requestId, gremlinQuery = request.get( 'id' ), request[ 'gremlin' ]
+		except (ValueError, KeyError, TypeError, AttributeError) as error:
+			return { 'id' : None, 'status' : 'error', 'error' : 'malformed request: {}'.format( error ) }
+
+		await self.pending.acquire()
+		future = asyncio.get_running_loop().run_in_executor( self.executor, self.execute, gremlinQuery )
+		# A running query cannot be interrupted, so one which times out keeps its thread until it completes, and is
+		# counted against MAX_PENDING until then.
+		future.add_done_callback( self._queryDone )
+		try:
+			result = await asyncio.wait_for( asyncio.shield( future ), self.timeout )
+		except asyncio.TimeoutError:
+			return { 'id' : requestId, 'status' : 'error', 'error' : 'query timed out after {}s'.format( self.timeout ) }
+		except Exception as error:
+			return { 'id' : requestId, 'status' : 'error', 'error' : '{}: {}'.format( type( error ).__name__, error ) }
+		return { 'id' : requestId, 'status' : 'ok', 'result' : result }
+
+	def _queryDone( self, future ):
+		self.pending.release()
+		# Retrieves the exception of a query nobody waits for anymore, so that it is not reported as unhandled.
+		if not future.cancelled():
+			future.exception()
+
+	def execute( self, gremlinQuery ):
+		# Runs in a worker thread. Each query gets its own traversal, so queries share nothing but the engine's graph
+		# and caches; the graph lock is held until the results are serialized, as they are computed lazily.
+		plan, _ = self.engine.compile( gremlinQuery )
+		with self.graphLock.writing() if plan.mutates else self.graphLock.reading():
+			return [ GremlinSerializer.plain( result ) for result in self.engine.exec( gremlinQuery ) ]
+
+class GremlinLoadGenerator:
+	# Sends queries to a GremlinServer from concurrent connections, each waiting for a response before sending its next
+	# request, and reports the latency percentiles and the throughput achieved.
+	@staticmethod
+	async def run( host, port, queries, connections=8, requests=1000 ):
+		latencies, errors = list(), list()
+		requestIds = itertools.count()
+
+		async def session():
+			reader, writer = await asyncio.open_connection( host, port, limit=GremlinServer.MAX_REQUEST_BYTES )
+			try:
+				while True:
+					requestId = next( requestIds )
+					if requestId >= requests:
+						break
+					request = { 'id' : requestId, 'gremlin' : queries[ requestId % len( queries ) ] }
+					startTime = time.perf_counter()
+					writer.write( json.dumps( request ).encode( 'utf-8' ) + b'\n' )
+					await writer.drain()
+					response = json.loads( await reader.readline() )
+					latencies.append( time.perf_counter() - startTime )
+					if response[ 'status' ] != 'ok':
+						errors.append( response[ 'error' ] )
+			finally:
+				writer.close()
+				await writer.wait_closed()
+
+		startTime = time.perf_counter()
+		await asyncio.gather( * [ session() for _ in range( connections ) ] )
+		elapsed = time.perf_counter() - startTime
+		return { 'requests' : len( latencies ), 'errors' : len( errors ), 'qps' : len( latencies ) / elapsed,
+		         'p50Milliseconds' : GremlinLoadGenerator._percentile( latencies, 0.50 ) * 1e3,
+		         'p99Milliseconds' : GremlinLoadGenerator._percentile( latencies, 0.99 ) * 1e3 }
+
+	@staticmethod
+	def _percentile( values, fraction ):
+		if len( values ) == 0:
+			return 0.0
+		values = sorted( values )
+		return values[ min( len( values ) - 1, int( fraction * len( values ) ) ) ]
+
+class GremlinServerTest( unittest.TestCase ):
+	@staticmethod
+	async def request( reader, writer, request ):
+		writer.write( ( request if type( request ) is bytes else json.dumps( request ).encode( 'utf-8' ) ) + b'\n' )
+		await writer.drain()
+		return json.loads( await reader.readline() )
+
+	def test_sessions( self ):
+		async def scenario():
+			server = GremlinServer( workers=2 )
+			port = await server.start( port=0 )
+			try:
+				reader, writer = await asyncio.open_connection( '127.0.0.1', port )
+				response = await GremlinServerTest.request( reader, writer, { 'id' : 1, 'gremlin' : "g.V().has('name','marko').out('knows').values('name')" } )
+				self.assertEqual( (response[ 'id' ], response[ 'status' ], sorted( response[ 'result' ] )), (1, 'ok', [ 'josh', 'vadas' ]) )
+				response = await GremlinServerTest.request( reader, writer, { 'id' : 2, 'gremlin' : 'g.V(42)' } )
+				self.assertEqual( (response[ 'id' ], response[ 'status' ]), (2, 'error') )
+				self.assertIn( 'VertexNotPresentError', response[ 'error' ] )
+				response = await GremlinServerTest.request( reader, writer, b'{ "id" : 3 }' )
+				self.assertEqual( response[ 'status' ], 'error' )
+				writer.close()
+
+				report = await GremlinLoadGenerator.run( '127.0.0.1', port, [ 'g.V().count()', 'g.V().out().path()' ], connections=4, requests=40 )
+				self.assertEqual( (report[ 'requests' ], report[ 'errors' ]), (40, 0) )
+				self.assertLessEqual( report[ 'p50Milliseconds' ], report[ 'p99Milliseconds' ] )
+
+				# Queries adding vertices run under the write lock, alongside sessions reading the graph.
+				report = await GremlinLoadGenerator.run( '127.0.0.1', port, [ "g.V(1).addV('person')", "g.V().out().values('name')" ], connections=4, requests=40 )
+				self.assertEqual( (report[ 'requests' ], report[ 'errors' ]), (40, 0) )
+				self.assertEqual( list( server.engine.exec( 'g.V().count()' ) ), [ 26 ] )
+
+				# Sessions still open are ended by stop().
+				reader, writer = await asyncio.open_connection( '127.0.0.1', port )
+				response = await GremlinServerTest.request( reader, writer, { 'id' : 4, 'gremlin' : "g.V(1).property('age', 30).values('age')" } )
+				self.assertEqual( response[ 'result' ], [ 30 ] )
+			finally:
+				await server.stop()
+			self.assertEqual( (server.sessions, await reader.read()), (set(), b'') )
+			writer.close()
+		asyncio.run( scenario() )
+
+	class BlockedServer( GremlinServer ):
+		# Runs no query until released, so that every query outlasts any timeout.
+		def __init__( self, ** arguments ):
+			GremlinServer.__init__( self, ** arguments )
+			self.released = threading.Event()
+
+		def execute( self, gremlinQuery ):
+			self.released.wait()
+			return list()
+
+	def test_timeout( self ):
+		async def scenario():
+			server = GremlinServerTest.BlockedServer( workers=1, timeout=0.01 )
+			port = await server.start( port=0 )
+			try:
+				reader, writer = await asyncio.open_connection( '127.0.0.1', port )
+				response = await GremlinServerTest.request( reader, writer, { 'id' : 1, 'gremlin' : 'g.V().count()' } )
+				self.assertEqual( response[ 'status' ], 'error' )
+				self.assertIn( 'timed out', response[ 'error' ] )
+				writer.close()
+			finally:
+				server.released.set()
+				await server.stop()
+		asyncio.run( scenario() )
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,17 @@
+# The entry points of GremlinExecutionEngine's parallel worker processes. They live outside gremlin.py so that a worker
+# started with the spawn or forkserver method can import them: gremlin and sample_graph import each other, and only
+# importing sample_graph first resolves the cycle.
+import sample_graph
+import gremlin
+from graphsnapshot import GraphSnapshot
+
+# The engine of a worker process, reading the graph snapshot mapped by initWorker.
+workerEngine = None
+
+def initWorker( snapshotPath ):
+	global workerEngine
+	workerEngine = gremlin.GremlinExecutionEngine()
+	workerEngine.setGraph( gremlin.GremlinGraph( GraphSnapshot.load( snapshotPath ) ) )
+
+def runPartition( gremlinQuery, start, stop ):
+	return workerEngine.runPartition( gremlinQuery, start, stop )
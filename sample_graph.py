@@ -1,44 +1,58 @@
 from gremlin import GremlinGraph
+from graph import Graph
+from graphml import GraphMLLoader
+from graphsnapshot import GraphSnapshot, SnapshotFormatError
+from compactgraph import CompactGraph
+import unittest
 import os
-import xml.etree.ElementTree as ET
+import time
+import tempfile
 
 class AirRoutesGraph:
+	PATH = os.path.join( 'tests', 'gremlin', 'air-routes', 'air-routes-latest.graphml' )
+	SNAPSHOT_PATH = os.path.join( 'tests', 'gremlin', 'air-routes', 'air-routes-latest.snapshot' )
+
 	@staticmethod
 	def get():
+		g, _ = AirRoutesGraph.load()
+		return g
+
+	@staticmethod
+	def load( path=None ):
+		# Returns the graph along with the loader's report (counts, elapsed seconds and objects per second).
 		g = GremlinGraph()
+		g.createLabelIndex()
+		g.createPropertyIndex( 'code' )
 
-		path = os.path.join( 'tests', 'gremlin', 'air-routes', 'air-routes-latest.graphml' )
-		root = ET.parse( path ).getroot()
-
-		i = len( root.tag )
-		while root.tag[ i - 1 ] != '}':
-			i = i - 1
-
-		namespaceString = root.tag[ : i ]
-		graphNodeTag = namespaceString + 'graph'
-		vertexNodeTag = namespaceString + 'node'
-		edgeNodeTag = namespaceString + 'edge'
-
-		graphNode = root.find( graphNodeTag )
-		for graphObject in graphNode:
-			if graphObject.tag == vertexNodeTag:
-				id_ = graphObject.attrib[ 'id' ]
-				props = dict()
-				for propertyNode in graphObject:
-					propertyKey = propertyNode.attrib[ 'key' ]
-					propertyValue = propertyNode.text
-					props[ propertyKey ] = propertyValue
-				g.addVertex( labels=[ props[ 'labelV' ] ], props=props, id_=int( id_ ) )
-			elif graphObject.tag == edgeNodeTag:
-				id_ = graphObject.attrib[ 'id' ]
-				fromVertex, toVertex = graphObject.attrib[ 'source' ], graphObject.attrib[ 'target' ]
-				for propertyNode in graphObject:
-					propertyKey = propertyNode.attrib[ 'key' ]
-					propertyValue = propertyNode.text
-					props[ propertyKey ] = propertyValue
-				g.addEdge( int( fromVertex ), int( toVertex ), props[ 'labelE' ], props=props, id_=int( id_ ) )
+		report = GraphMLLoader( g.graph ).load( path or AirRoutesGraph.PATH )
+		return g, report
 
-		return g
+	@staticmethod
+	def loadSnapshot( path=None, snapshotPath=None ):
+		# Maps the snapshot when it is newer than the GraphML file, giving a read-only graph. Otherwise the file is
+		# parsed into a graph which can still be changed, and a snapshot is written for the next load; should that
+		# fail, the report carries the error as snapshotError. The report's readOnly tells the two apart.
+		path, snapshotPath = path or AirRoutesGraph.PATH, snapshotPath or AirRoutesGraph.SNAPSHOT_PATH
+		if GraphSnapshot.isFresh( snapshotPath, path ):
+			startTime = time.perf_counter()
+			try:
+				g = GremlinGraph( GraphSnapshot.load( snapshotPath ) )
+			except SnapshotFormatError:
+				# A damaged snapshot is replaced as if it were stale.
+				g = None
+			if g is not None:
+				seconds = time.perf_counter() - startTime
+				vertexCount, edgeCount = len( g.V() ), len( g.E() )
+				return g, { 'vertices' : vertexCount, 'edges' : edgeCount, 'seconds' : seconds,
+				            'objectsPerSecond' : ( vertexCount + edgeCount ) / seconds if seconds > 0 else 0.0, 'readOnly' : True }
+
+		g, report = AirRoutesGraph.load( path )
+		try:
+			GraphSnapshot.save( g.graph, snapshotPath )
+		except OSError as error:
+			report[ 'snapshotError' ] = 'Could not write snapshot {}: {}'.format( snapshotPath, error )
+		report[ 'readOnly' ] = False
+		return g, report
 
 class TinkerPopModernGraph:
 	@staticmethod
@@ -69,4 +83,48 @@ class TinkerPopModernGraph:
 		for id_, (fromVertex, toVertex), edgeLabel, props in edgeInfo:
 			g.addEdge( fromVertex, toVertex, edgeLabel, props=props, id_=id_ )
 
-		return g
\ No newline at end of file
+		return g
+
+class AirRoutesGraphTest( unittest.TestCase ):
+	GRAPHML = '''<?xml version="1.0" encoding="UTF-8"?>
+<graphml xmlns="http://graphml.graphdrawing.org/xmlns">
+  <key id="labelV" for="node" attr.name="labelV" attr.type="string"/>
+  <key id="code" for="node" attr.name="code" attr.type="string"/>
+  <key id="labelE" for="edge" attr.name="labelE" attr.type="string"/>
+  <graph id="routes" edgedefault="directed">
+    <node id="1"><data key="labelV">airport</data><data key="code">AUS</data></node>
+    <node id="2"><data key="labelV">airport</data><data key="code">DFW</data></node>
+    <edge id="3" source="1" target="2"><data key="labelE">route</data></edge>
+  </graph>
+</graphml>'''
+
+	def test_loadSnapshot( self ):
+		with tempfile.TemporaryDirectory() as directory:
+			path, snapshotPath = os.path.join( directory, 'routes.graphml' ), os.path.join( directory, 'routes.snapshot' )
+			with open( path, 'w' ) as graphMLFile:
+				graphMLFile.write( AirRoutesGraphTest.GRAPHML )
+
+			# Parsed, keeping a graph which can be changed, and snapshotted; then mapped read-only.
+			g, report = AirRoutesGraph.loadSnapshot( path, snapshotPath )
+			self.assertIsInstance( g.graph, Graph )
+			self.assertEqual( (report[ 'vertices' ], report[ 'edges' ], report[ 'readOnly' ], report.get( 'snapshotError' )), (2, 1, False, None) )
+			g.addVertex( labels=[ 'airport' ] )
+			g, report = AirRoutesGraph.loadSnapshot( path, snapshotPath )
+			self.assertIsInstance( g.graph, CompactGraph )
+			self.assertEqual( (report[ 'vertices' ], report[ 'edges' ], report[ 'readOnly' ]), (2, 1, True) )
+
+			# A truncated snapshot is parsed again and rewritten.
+			with open( snapshotPath, 'wb' ):
+				pass
+			g, report = AirRoutesGraph.loadSnapshot( path, snapshotPath )
+			self.assertEqual( (report[ 'vertices' ], report[ 'readOnly' ]), (2, False) )
+			self.assertIsInstance( AirRoutesGraph.loadSnapshot( path, snapshotPath )[ 0 ].graph, CompactGraph )
+
+			os.remove( snapshotPath )
+			g, report = AirRoutesGraph.loadSnapshot( path, os.path.join( directory, 'missing', 'routes.snapshot' ) )
+			self.assertIsInstance( g.graph, Graph )
+			self.assertIn( 'Could not write snapshot', report[ 'snapshotError' ] )
+			self.assertEqual( sorted( g.graph.lookupProperty( 'code', 'DFW' ) ), [ 2 ] )
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,8 +1,209 @@
 import unittest
+import collections
+import contextlib
+import threading
+import bisect
 
 def expectInstance( object, expectedType ):
 	if not isinstance( object, expectedType ):
 		raise TypeError( 'expected type {}'.format( expectedType ) )
 
+class LRUCache:
+	# Safe to share between threads: every operation holds the cache's lock.
+	def __init__( self, capacity ):
+		self.capacity = capacity
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+		self.hits, self.misses, self.evictions, self.invalidations = 0, 0, 0, 0
+
+	def get( self, key, default=None, isValid=None ):
+		# An entry for which isValid( value ) is false is dropped, and the lookup counts as a miss.
+		with self.lock:
+			if key not in self.entries:
+				self.misses += 1
+				return default
+			value = self.entries[ key ]
+			if isValid is not None and not isValid( value ):
+				del self.entries[ key ]
+				self.invalidations += 1
+				self.misses += 1
+				return default
+			self.hits += 1
+			self.entries.move_to_end( key )
+			return value
+
+	def put( self, key, value ):
+		with self.lock:
+			self.entries[ key ] = value
+			self.entries.move_to_end( key )
+			while len( self.entries ) > self.capacity:
+				self.entries.popitem( last=False )
+				self.evictions += 1
+
+	def clear( self ):
+		with self.lock:
+			self.entries.clear()
+
+	def stats( self ):
+		with self.lock:
+			return { 'size' : len( self.entries ), 'capacity' : self.capacity, 'hits' : self.hits, 'misses' : self.misses,
+			         'evictions' : self.evictions, 'invalidations' : self.invalidations }
+
+	def __len__( self ):
+		return len( self.entries )
+
+class IdAllocator:
+	# Hands out unused non-negative integer ids. Every id from highWaterMark upwards is free, as are the ranges
+	# [ freeStarts[ i ], freeEnds[ i ] ) below it, which are the gaps left by explicitly chosen ids. Ids are never
+	# handed out twice, even once the object holding them is deleted. Safe to share between threads.
+	def __init__( self ):
+		self.highWaterMark = 0
+		self.freeStarts, self.freeEnds = list(), list()
+		self.lock = threading.Lock()
+
+	def allocate( self ):
+		with self.lock:
+			if len( self.freeStarts ) == 0:
+				self.highWaterMark += 1
+				return self.highWaterMark - 1
+			id_ = self.freeStarts[ 0 ]
+			if id_ + 1 == self.freeEnds[ 0 ]:
+				del self.freeStarts[ 0 ], self.freeEnds[ 0 ]
+			else:
+				self.freeStarts[ 0 ] = id_ + 1
+			return id_
+
+	def reserve( self, count ):
+		# Returns a range of count contiguous ids, for a bulk load or a writer assigning ids by itself.
+		with self.lock:
+			start = self.highWaterMark
+			self.highWaterMark += count
+			return range( start, start + count )
+
+	def claim( self, id_ ):
+		# Marks an explicitly chosen id as used. Ids other than non-negative integers are outside the allocator's range
+		# and ignored.
+		if type( id_ ) is int and id_ >= 0:
+			with self.lock:
+				if id_ == self.highWaterMark:
+					self.highWaterMark += 1
+				else:
+					self._claim( id_ )
+
+	def claimAll( self, ids ):
+		with self.lock:
+			for id_ in sorted( id_ for id_ in ids if type( id_ ) is int and id_ >= 0 ):
+				# Ids loaded in order mostly continue from the high water mark.
+				if id_ == self.highWaterMark:
+					self.highWaterMark += 1
+				else:
+					self._claim( id_ )
+
+	def _claim( self, id_ ):
+		if id_ >= self.highWaterMark:
+			if id_ > self.highWaterMark:
+				self.freeStarts.append( self.highWaterMark )
+				self.freeEnds.append( id_ )
+			self.highWaterMark = id_ + 1
+			return
+		position = bisect.bisect_right( self.freeStarts, id_ ) - 1
+		if position < 0 or id_ >= self.freeEnds[ position ]:
+			return
+		start, end = self.freeStarts[ position ], self.freeEnds[ position ]
+		if start == id_ and end == id_ + 1:
+			del self.freeStarts[ position ], self.freeEnds[ position ]
+		elif start == id_:
+			self.freeStarts[ position ] = id_ + 1
+		elif end == id_ + 1:
+			self.freeEnds[ position ] = id_
+		else:
+			self.freeEnds[ position ] = id_
+			self.freeStarts.insert( position + 1, id_ + 1 )
+			self.freeEnds.insert( position + 1, end )
+
+class ReadWriteLock:
+	# Held by any number of readers at once, or by a single writer. A waiting writer keeps new readers out, so that a
+	# steady stream of readers cannot starve it. Not reentrant.
+	def __init__( self ):
+		self.condition = threading.Condition()
+		self.readers, self.writer, self.waitingWriters = 0, False, 0
+
+	@contextlib.contextmanager
+	def reading( self ):
+		with self.condition:
+			while self.writer or self.waitingWriters > 0:
+				self.condition.wait()
+			self.readers += 1
+		try:
+			yield
+		finally:
+			with self.condition:
+				self.readers -= 1
+				if self.readers == 0:
+					self.condition.notify_all()
+
+	@contextlib.contextmanager
+	def writing( self ):
+		with self.condition:
+			self.waitingWriters += 1
+			while self.writer or self.readers > 0:
+				self.condition.wait()
+			self.waitingWriters -= 1
+			self.writer = True
+		try:
+			yield
+		finally:
+			with self.condition:
+				self.writer = False
+				self.condition.notify_all()
+
+class LRUCacheTest( unittest.TestCase ):
+	def test_eviction( self ):
+		cache = LRUCache( capacity=2 )
+		cache.put( 'a', 1 )
+		cache.put( 'b', 2 )
+		self.assertEqual( cache.get( 'a' ), 1 )
+		cache.put( 'c', 3 )
+
+		self.assertIsNone( cache.get( 'b' ) )
+		self.assertEqual( cache.get( 'a' ), 1 )
+		self.assertEqual( cache.get( 'c' ), 3 )
+		self.assertEqual( cache.stats(), { 'size' : 2, 'capacity' : 2, 'hits' : 3, 'misses' : 1, 'evictions' : 1, 'invalidations' : 0 } )
+
+		self.assertIsNone( cache.get( 'a', isValid=lambda value : value > 1 ) )
+		self.assertEqual( cache.get( 'c', isValid=lambda value : value > 1 ), 3 )
+		self.assertEqual( (len( cache ), cache.invalidations, cache.misses), (1, 1, 2) )
+
+class IdAllocatorTest( unittest.TestCase ):
+	def test_allocation( self ):
+		allocator = IdAllocator()
+		self.assertEqual( [ allocator.allocate() for _ in range( 2 ) ], [ 0, 1 ] )
+		allocator.claimAll( [ 10, 5, 'x', -1, 11 ] )
+		allocator.claim( 7 )
+		self.assertEqual( (allocator.highWaterMark, allocator.freeStarts, allocator.freeEnds), (12, [ 2, 6, 8 ], [ 5, 7, 10 ]) )
+		self.assertEqual( [ allocator.allocate() for _ in range( 7 ) ], [ 2, 3, 4, 6, 8, 9, 12 ] )
+		self.assertEqual( allocator.reserve( 3 ), range( 13, 16 ) )
+		allocator.claim( 14 )
+		self.assertEqual( allocator.allocate(), 16 )
+
+class ReadWriteLockTest( unittest.TestCase ):
+	def test_exclusion( self ):
+		lock, events = ReadWriteLock(), list()
+		def write():
+			with lock.writing():
+				events.append( 'write' )
+		writerThread = threading.Thread( target=write )
+
+		with lock.reading():
+			with lock.reading():
+				writerThread.start()
+				with lock.condition:
+					lock.condition.wait_for( lambda : lock.waitingWriters == 1 )
+				events.append( 'read' )
+		writerThread.join()
+		self.assertEqual( events, [ 'read', 'write' ] )
+		self.assertEqual( (lock.readers, lock.writer, lock.waitingWriters), (0, False, 0) )
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file